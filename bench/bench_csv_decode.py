@@ -0,0 +1,81 @@
+"""
+Benchmark of decoding the csv response of a query of a million values into a
+DataFrame, compares the bulk AsyncQuery._csv_into_dataframe with parsing the
+response into FluxRecords by the client and turning them into a DataFrame.
+
+Run from the root of the repository:
+    python -m bench.bench_csv_decode
+
+Author: Piotr Krzysztof Lis - github.com/straightchlorine
+"""
+
+import io
+import time
+
+import pandas as pd
+from influxdb_client.client.flux_csv_parser import (
+    FluxCsvParser,
+    FluxSerializationMode,
+)
+
+from reads.query.async_query import AsyncQuery
+
+sensors = {
+    "bmp180": ["altitude", "pressure", "temperature", "seaLevelPressure"],
+    "mq135": ["aceton", "alcohol", "co", "co2", "nh4", "toulen"],
+}
+
+
+def make_response(records=1_000_000) -> str:
+    """Annotated csv response of a query, a table per parameter."""
+    fields = [param for params in sensors.values() for param in params]
+    points = records // len(fields)
+    times = pd.date_range("2024-01-01", periods=points, freq="1s", tz="UTC")
+    times = times.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+    lines = [
+        "#datatype,string,long,dateTime:RFC3339,double,string,string,string",
+        "#group,false,false,false,false,true,true,true",
+        "#default,_result,,,,,,",
+        ",result,table,_time,_value,_field,_measurement,device",
+    ]
+    for table, field in enumerate(fields):
+        lines.extend(
+            f",,{table},{timestamp},{i}.5,{field},sensor_data,nodemcu"
+            for i, timestamp in enumerate(times)
+        )
+    return "\r\n".join(lines) + "\r\n\r\n"
+
+
+def flux_records(query, response) -> pd.DataFrame:
+    """The client parses the response into FluxRecords, then a DataFrame."""
+    parser = FluxCsvParser(
+        response=io.BytesIO(response.encode()),
+        serialization_mode=FluxSerializationMode.tables,
+    )
+    with parser:
+        for _ in parser.generator():
+            pass
+    return query._into_dataframe(parser.table_list())
+
+
+def run(records=1_000_000):
+    response = make_response(records)
+    query = AsyncQuery("localhost", 8086, "token", "org", "bucket", sensors)
+
+    results = {}
+    for name, func in (
+        ("flux records", flux_records),
+        ("bulk csv", lambda query, text: query._csv_into_dataframe(text)),
+    ):
+        start = time.perf_counter()
+        frame = func(query, response)
+        results[name] = time.perf_counter() - start
+        print(f"{name:>20}: {results[name]:8.3f} s, {frame.shape}")
+
+    speedup = results["flux records"] / results["bulk csv"]
+    print(f"{'speedup':>20}: {speedup:8.1f}x")
+
+
+if __name__ == "__main__":
+    run()
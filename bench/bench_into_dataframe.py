@@ -0,0 +1,93 @@
+"""
+Benchmark of turning a query result of a million records into a DataFrame,
+compares the columnar AsyncQuery._into_dataframe with the previous
+record-by-record implementation.
+
+Run from the root of the repository:
+    python -m bench.bench_into_dataframe
+
+Author: Piotr Krzysztof Lis - github.com/straightchlorine
+"""
+
+import datetime
+import time
+
+import pandas as pd
+from influxdb_client.client.flux_table import FluxRecord, FluxTable
+
+from reads.query.async_query import AsyncQuery
+
+sensors = {
+    "bmp180": ["altitude", "pressure", "temperature", "seaLevelPressure"],
+    "mq135": ["aceton", "alcohol", "co", "co2", "nh4", "toulen"],
+}
+
+
+def make_tables(records=1_000_000):
+    """Tables of a query result, a table per parameter."""
+    fields = [param for params in sensors.values() for param in params]
+    points = records // len(fields)
+    start = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+    times = [start + datetime.timedelta(seconds=i) for i in range(points)]
+
+    tables = []
+    for index, field in enumerate(fields):
+        table = FluxTable()
+        table.records = [
+            FluxRecord(
+                index,
+                {
+                    "result": "_result",
+                    "table": index,
+                    "_time": timestamp,
+                    "_value": float(i),
+                    "_field": field,
+                    "_measurement": "sensor_data",
+                    "device": "nodemcu",
+                },
+            )
+            for i, timestamp in enumerate(times)
+        ]
+        tables.append(table)
+    return tables
+
+
+def record_by_record(tables) -> pd.DataFrame:
+    """The implementation replaced by the columnar one."""
+    read: dict = {}
+    timestamps = set()
+    for table in tables:
+        for record in table.records:
+            parameter = record.get_field()
+            timestamps.add(record.get_time())
+            if parameter not in read:
+                read[parameter] = []
+            read[parameter].append(float(record.get_value()))
+
+    local_offset = datetime.timedelta(
+        seconds=datetime.datetime.now().astimezone().utcoffset().total_seconds()
+    )
+    read["time"] = [pd.to_datetime(t) + local_offset for t in timestamps]
+    return pd.DataFrame(read)
+
+
+def run(records=1_000_000):
+    tables = make_tables(records)
+    query = AsyncQuery("localhost", 8086, "token", "org", "bucket", sensors)
+
+    results = {}
+    for name, func in (
+        ("record by record", record_by_record),
+        ("columnar", query._into_dataframe),
+    ):
+        start = time.perf_counter()
+        frame = func(tables)
+        results[name] = time.perf_counter() - start
+        print(f"{name:>20}: {results[name]:8.3f} s, {frame.shape}")
+
+    speedup = results["record by record"] / results["columnar"]
+    print(f"{'speedup':>20}: {speedup:8.1f}x")
+
+
+if __name__ == "__main__":
+    run()
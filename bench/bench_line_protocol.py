@@ -0,0 +1,71 @@
+"""
+Micro-benchmark of encoding a reading into line protocol, compares the
+precompiled LineProtocolEncoder with building the record dict and passing it
+through Point.from_dict.
+
+Run from the root of the repository:
+    python -m bench.bench_line_protocol
+
+Author: Piotr Krzysztof Lis - github.com/straightchlorine
+"""
+
+import datetime
+import time
+import timeit
+
+from influxdb_client.client.write.point import Point
+
+from reads.fetch.line_protocol import LineProtocolEncoder
+
+sensors = {
+    "bmp180": ["altitude", "pressure", "temperature", "seaLevelPressure"],
+    "mq135": ["aceton", "alcohol", "co", "co2", "nh4", "toulen"],
+}
+
+fields = {
+    "altitude": 149.56,
+    "pressure": 998.42,
+    "temperature": 26.0,
+    "seaLevelPressure": 1016.34,
+    "aceton": 2.57,
+    "alcohol": 6.62,
+    "co": 28.88,
+    "co2": 412.1,
+    "nh4": 15.12,
+    "toulen": 3.14,
+}
+
+
+def point_from_dict():
+    record = {
+        "measurement": "sensor_data",
+        "tags": {"device": "nodemcu"},
+        "timestamp": str(datetime.datetime.now()),
+        "fields": dict(fields),
+    }
+    return Point.from_dict(record, write_precision="ns").to_line_protocol()
+
+
+encoder = LineProtocolEncoder(sensors)
+
+
+def compiled_encoder():
+    return encoder.encode("nodemcu", fields.values(), time.time_ns())
+
+
+def run(number=20_000, repeat=5):
+    results = {}
+    for name, func in (
+        ("Point.from_dict", point_from_dict),
+        ("LineProtocolEncoder", compiled_encoder),
+    ):
+        best = min(timeit.repeat(func, number=number, repeat=repeat))
+        results[name] = best / number * 1e6
+        print(f"{name:>20}: {results[name]:8.2f} us/reading")
+
+    speedup = results["Point.from_dict"] / results["LineProtocolEncoder"]
+    print(f"{'speedup':>20}: {speedup:8.1f}x")
+
+
+if __name__ == "__main__":
+    run()
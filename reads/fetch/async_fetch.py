@@ -6,13 +6,59 @@ Author: Piotr Krzysztof Lis - github.com/straightchlorine
 """
 
 import asyncio
-import datetime
+import functools
+import logging
+import os
+import time
 
+from influxdb_client.client.exceptions import InfluxDBError
 from influxdb_client.client.influxdb_client_async import InfluxDBClientAsync
-from influxdb_client.client.write.point import Point
+from influxdb_client.client.write_api_async import WriteApiAsync
 
 import aiohttp
 
+from reads.fetch.compression import ReadingCompressor
+from reads.fetch.device import Device
+from reads.fetch.line_protocol import LineProtocolEncoder
+from reads.fetch.rollup import STATS, Rollup
+from reads.fetch.scheduler import FixedRateScheduler
+from reads.fetch.schema import Reading, SensorSchema
+from reads.fetch.spool import Spool
+from reads.fetch.write_buffer import AsyncWriteBuffer
+from reads.metrics import REGISTRY, Rate
+
+logger = logging.getLogger(__name__)
+
+# latency of the stages of the write path
+REQUEST_SECONDS = REGISTRY.histogram(
+    "reads_device_request_seconds", "Time spent requesting readings from a device."
+)
+DECODE_SECONDS = REGISTRY.histogram(
+    "reads_decode_seconds", "Time spent decoding the JSON payload of a device."
+)
+ENCODE_SECONDS = REGISTRY.histogram(
+    "reads_record_build_seconds",
+    "Time spent encoding a batch of readings into line protocol.",
+)
+WRITE_SECONDS = REGISTRY.histogram(
+    "reads_db_write_seconds", "Time spent writing a batch into InfluxDB.", ("bucket",)
+)
+
+READINGS = REGISTRY.counter("reads_readings_total", "Readings decoded.")
+WRITTEN = REGISTRY.counter(
+    "reads_records_written_total", "Records written into InfluxDB.", ("bucket",)
+)
+ERRORS = REGISTRY.counter(
+    "reads_errors_total", "Errors by the stage they occurred in.", ("stage",)
+)
+QUEUE_DEPTH = REGISTRY.gauge(
+    "reads_queue_depth", "Decoded readings waiting for the writers."
+)
+READINGS_RATE = REGISTRY.gauge(
+    "reads_readings_per_second", "Readings decoded per second, over 10 seconds."
+)
+READINGS_RATE.add_callback(Rate(READINGS))
+
 
 class AsyncReadFetcher:
     """
@@ -31,6 +77,30 @@ class AsyncReadFetcher:
         _device_address (str): The address of the device in the network.
         _database_address (str): The address of the InfluxDB instance.
         _sensors (dict): Sensors attached to the device.
+        _devices (list[Device]): Devices polled by the fetcher.
+        _max_concurrency (int): Maximum number of devices polled at once.
+        _interval (float): Default poll interval of a device in seconds.
+        _jitter (float): Fraction of the interval used to spread out devices.
+        _scheduler (FixedRateScheduler): Schedules polling of the devices.
+        _schemas (dict[str, SensorSchema]): Payload schemas per device name.
+        _encoders (dict[str, LineProtocolEncoder]): Encoders per device name.
+        _session (aiohttp.ClientSession): Pooled session used to poll the device.
+        _client (InfluxDBClientAsync): Long-lived client used to write readings.
+        _write_api (WriteApiAsync): Write API of the long-lived client.
+        _queue (asyncio.Queue): Decoded readings waiting for the writers.
+        _writers (int): Number of tasks encoding and writing the readings.
+        _overflow (str): Policy applied to readings when the queue is full.
+        _spools (dict[str, Spool]): Keep batches that could not be written to
+            InfluxDB, per bucket.
+        _db_available (bool): Whether the last write to InfluxDB succeeded.
+        _compression (dict[str, dict]): Compression configuration per parameter.
+        _compressors (dict[str, ReadingCompressor]): Compressors per device name.
+        _ingested (dict[str, Device]): Devices readings were ingested from,
+            pushing devices included, by name.
+        _stopping (bool): Whether stop() is in progress.
+        _rollup_buckets (dict[int, str]): Downsampled buckets by window length.
+        _rollups (dict[str, list[tuple[str, Rollup]]]): Rollups per device name.
+        _rollup_buffers (dict[str, AsyncWriteBuffer]): Buffers per rollup bucket.
     """
 
     _influxdb_host: str  # host of the influxdb instance
@@ -46,8 +116,76 @@ class AsyncReadFetcher:
     _dev_url: str  # address of the device in the network
     _db_url: str  # address of the influxdb instance
 
+    _connection_limit: int  # total number of pooled device connections
+    _connection_limit_per_host: int  # pooled connections per device (0 - no limit)
+    _db_connection_limit: int  # pooled connections to the influxdb instance
+    _request_timeout: float  # timeout of a single device request in seconds
+
+    _devices: list[Device]  # devices polled by the fetcher
+    _max_concurrency: int  # maximum number of devices polled at once
+    _interval: float  # default poll interval of a device in seconds
+    _jitter: float  # fraction of the interval used to spread out devices
+    _scheduler: FixedRateScheduler | None  # schedules polling of the devices
+    _schemas: dict[str, SensorSchema]  # payload schemas per device name
+    _encoders: dict[str, LineProtocolEncoder]  # encoders per device name
+
+    _batch_size: int  # number of readings written in a single batch
+    _flush_interval: int  # maximum age of a batch in milliseconds
+    _write_timeout: float  # time after which a slow write is spooled
+
+    _queue_size: int  # readings that can wait for the writers
+    _writers: int  # tasks encoding and writing the readings
+    _overflow: str  # policy applied to readings when the queue is full
+
+    _spools: dict[str, Spool]  # batches that could not be written, per bucket
+    _replay_batch_size: int  # records written at once while replaying the spool
+    _replay_interval: float  # seconds between attempts to replay the spool
+    _db_available: bool  # whether the last write into influxdb succeeded
+
+    _compression: dict[str, dict] | None  # compression config per parameter
+    _compressors: dict[str, ReadingCompressor]  # compressors per device name
+    _ingested: dict[str, Device]  # devices readings were ingested from, by name
+    _stopping: bool  # whether stop() is in progress
+
+    _rollup_buckets: dict[int, str]  # downsampled buckets by window in seconds
+    _rollups: dict[str, list[tuple[str, Rollup]]]  # rollups per device name
+    _rollup_buffers: dict[str, AsyncWriteBuffer]  # buffers per rollup bucket
+
+    _session: aiohttp.ClientSession | None  # pooled session to the device
+    _client: InfluxDBClientAsync | None  # long-lived influxdb client
+    _write_api: WriteApiAsync | None  # write api of the influxdb client
+    _queue: asyncio.Queue | None  # decoded readings waiting for the writers
+
     def __init__(
-        self, host, port, token, org, bucket, sensors, dev_ip, dev_port, handle=""
+        self,
+        host,
+        port,
+        token,
+        org,
+        bucket,
+        sensors,
+        dev_ip,
+        dev_port,
+        handle="",
+        device_name="nodemcu",
+        max_concurrency=100,
+        interval=1.0,
+        jitter=0.0,
+        connection_limit=100,
+        connection_limit_per_host=0,
+        db_connection_limit=10,
+        request_timeout=5.0,
+        batch_size=500,
+        flush_interval=1000,
+        write_timeout=10.0,
+        queue_size=10000,
+        writers=1,
+        overflow="block",
+        spool_dir=None,
+        replay_batch_size=5000,
+        replay_interval=5.0,
+        compression=None,
+        rollup_buckets=None,
     ):
         """
         Initialize the fetcher with the required information.
@@ -62,6 +200,42 @@ class AsyncReadFetcher:
             dev_port (str): Port of the device providing the readings.
             handle (str): Http handle to access the data ("" by default).
             sensors (dict): Which sensors device has and what do they measure.
+            device_name (str): Name the readings are tagged with in InfluxDB
+                ('nodemcu' by default).
+            max_concurrency (int): Maximum number of devices polled at once.
+            interval (float): Poll interval in seconds of devices that do not
+                specify their own.
+            jitter (float): Fraction of the interval (0 - 1) over which poll
+                times of the devices are spread out.
+            connection_limit (int): Total number of pooled device connections.
+            connection_limit_per_host (int): Pooled connections per device
+                (0 means no limit).
+            db_connection_limit (int): Pooled connections to InfluxDB.
+            request_timeout (float): Timeout of a single device request in
+                seconds.
+            batch_size (int): Number of readings written in a single batch.
+            flush_interval (int): Maximum time in milliseconds a writer waits
+                for a batch to fill up before it is written.
+            write_timeout (float): Time in seconds after which a write is
+                considered failed.
+            queue_size (int): Number of decoded readings that can wait for
+                the writers.
+            writers (int): Number of tasks encoding and writing the readings.
+            overflow (str): What happens to a reading when the queue is full,
+                'block' waits for space, 'drop_oldest' drops the oldest queued
+                reading, 'spool' writes the reading into the spool.
+            spool_dir (str): Directory of the on-disk spool holding batches
+                which could not be written (None disables spooling).
+            replay_batch_size (int): Number of spooled readings written at
+                once when the spool is replayed.
+            replay_interval (float): Seconds between attempts to replay the
+                spool.
+            compression (dict[str, dict]): Deadband or swinging door compression
+                per parameter name ('*' for every parameter), see
+                ReadingCompressor (None disables compression).
+            rollup_buckets (dict[int, str]): Buckets receiving min, max, mean
+                and count of every parameter, by window length in seconds, e.g.
+                {60: "sensors_1m", 3600: "sensors_1h"} (None disables rollups).
         """
 
         # InfluxDB authentication data
@@ -82,112 +256,771 @@ class AsyncReadFetcher:
 
         self._sensors = sensors
 
-    def _get_reads(self, data) -> dict[str, float]:
+        # devices polled on every tick of the fetching loop
+        self._devices = [
+            Device(self._dev_ip, self._dev_port, self._dev_handle, sensors, device_name)
+        ]
+        self._max_concurrency = max_concurrency
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+        # schemas and line protocol encoders compiled per device
+        self._schemas = {}
+        self._encoders = {}
+
+        # polling schedule, created once the fetching loop starts
+        self._interval = interval
+        self._jitter = jitter
+        self._scheduler = None
+
+        # connection pool configuration
+        self._connection_limit = connection_limit
+        self._connection_limit_per_host = connection_limit_per_host
+        self._db_connection_limit = db_connection_limit
+        self._request_timeout = request_timeout
+
+        # write batching configuration
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._write_timeout = write_timeout
+
+        # polling and writing are joined by a bounded queue
+        if overflow not in ("block", "drop_oldest", "spool"):
+            raise ValueError(f"unknown overflow policy {overflow!r}")
+        if overflow == "spool" and spool_dir is None:
+            raise ValueError("'spool' overflow policy requires spool_dir")
+        self._queue_size = queue_size
+        self._writers = writers
+        self._overflow = overflow
+        self._queue = None
+        self._writer_tasks = []
+        self._dropped = 0
+        self._overflow_spooled = 0
+
+        # aggregates over fixed windows are written to downsampled buckets
+        self._rollup_buckets = dict(rollup_buckets or {})
+        self._rollups = {}
+        self._rollup_buffers = {}
+        self._rollup_encoders = {}
+
+        # batches that failed to be written are kept on the disk, spools of
+        # the rollup buckets are nested within the directory
+        self._spools = {}
+        if spool_dir is not None:
+            self._spools[self._influxdb_bucket] = Spool(spool_dir)
+            for bucket in self._rollup_buckets.values():
+                self._spools[bucket] = Spool(os.path.join(spool_dir, bucket))
+        self._replay_batch_size = replay_batch_size
+        self._replay_interval = replay_interval
+        self._db_available = True
+        self._replay_task = None
+
+        # values carrying no new information are not written
+        self._compression = compression
+        self._compressors = {}
+        self._ingested = {}
+        self._stopping = False
+
+        # functions every decoded reading is published to
+        self._reading_callbacks = []
+        # functions notified of the readings replayed from the spool
+        self._replay_callbacks = []
+
+        # connections are opened in start() and kept until stop()
+        self._session = None
+        self._client = None
+        self._write_api = None
+
+    async def __aenter__(self) -> "AsyncReadFetcher":
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        await self.stop()
+
+    @property
+    def started(self) -> bool:
+        """Whether the pooled connections are currently open."""
+        return self._session is not None
+
+    async def start(self):
+        """
+        Open the pooled device session and the InfluxDB client.
+
+        Both are kept alive until stop() is called, so that every reading
+        reuses already established connections. Calling start() on a started
+        fetcher does nothing.
+        """
+
+        if self.started:
+            return
+
+        connector = aiohttp.TCPConnector(
+            limit=self._connection_limit,
+            limit_per_host=self._connection_limit_per_host,
+        )
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=self._request_timeout),
+        )
+
+        self._client = InfluxDBClientAsync(
+            url=self._db_url,
+            token=self._influxdb_token,
+            org=self._influxdb_organization,
+            connection_pool_maxsize=self._db_connection_limit,
+        )
+        self._write_api = self._client.write_api()
+
+        self._queue = asyncio.Queue(maxsize=self._queue_size)
+        QUEUE_DEPTH.add_callback(self._queue.qsize)
+        self._writer_tasks = [
+            asyncio.create_task(self._writer()) for _ in range(self._writers)
+        ]
+
+        for bucket in self._rollup_buckets.values():
+            self._rollup_buffers[bucket] = AsyncWriteBuffer(
+                functools.partial(self._write_to_db, bucket=bucket),
+                self._batch_size,
+                self._flush_interval,
+            )
+            self._rollup_buffers[bucket].start()
+
+        if self._spools:
+            self._replay_task = asyncio.create_task(self._replay_loop())
+
+    async def stop(self):
+        """
+        Gracefully close the pooled device session and the InfluxDB client.
+
+        Queued readings are written before the client is closed. Safe to call
+        multiple times, as well as on a fetcher that was never started.
+        Readings arriving meanwhile are dropped, they would start the fetcher
+        again.
+        """
+
+        self._stopping = True
+        try:
+            await self._stop()
+        finally:
+            self._stopping = False
+
+    async def _stop(self):
+        """Implementation of stop()."""
+        session, client, queue = self._session, self._client, self._queue
+        self._session = None
+
+        if self._replay_task is not None:
+            self._replay_task.cancel()
+            try:
+                await self._replay_task
+            except asyncio.CancelledError:
+                pass
+            self._replay_task = None
+
+        if queue is not None:
+            # write values held back by the compression, of pushing devices
+            # as well
+            for name, compressor in self._compressors.items():
+                for reading in compressor.flush(name):
+                    await self._store_sensor_readings(reading, self._ingested[name])
+
+            # let the writers drain the queue
+            await queue.join()
+            for task in self._writer_tasks:
+                task.cancel()
+            await asyncio.gather(*self._writer_tasks, return_exceptions=True)
+            self._writer_tasks = []
+            self._queue = None
+            QUEUE_DEPTH.remove_callback(queue.qsize)
+
+        # write aggregates of the incomplete windows, merged with the stored
+        # ones once the fetcher starts again
+        for name, rollups in self._rollups.items():
+            for bucket, rollup in rollups:
+                aggregates = rollup.flush(name)
+                if aggregates is not None:
+                    await self._buffer_rollup(aggregates, self._ingested[name], bucket)
+        self._rollups = {}
+
+        rollup_buffers = self._rollup_buffers
+        self._rollup_buffers = {}
+        for rollup_buffer in rollup_buffers.values():
+            await rollup_buffer.close()
+
+        for spool in self._spools.values():
+            spool.close()
+
+        self._client = None
+        self._write_api = None
+
+        if session is not None:
+            await session.close()
+        if client is not None:
+            await client.close()
+
+    async def close(self):
+        """Alias of stop(), closes every pooled connection."""
+        await self.stop()
+
+    @property
+    def devices(self) -> list[Device]:
+        """Devices polled by the fetcher."""
+        return self._devices
+
+    def interval(self, device) -> float:
+        """Seconds between polls of the device."""
+        return device.interval or self._interval
+
+    def _get_schema(self, device) -> SensorSchema:
         """
-        Based on sensors specified in sensors attribute fill the fields
-        with appropriate key-value pairs for InfluxDB storage.
+        Return the schema compiled for sensors of the device.
 
         Args:
-            data (dict): The sensor readings to parse.
+            device (Device): The device the readings come from.
         """
 
-        fields = {}
-        for sensor in self._sensors:
-            for param in self._sensors[sensor]:
-                fields[param] = float(data["nodemcu"][sensor][param])
-        return fields
+        schema = self._schemas.get(device.name)
+        if schema is None:
+            schema = SensorSchema(device.sensors)
+            self._schemas[device.name] = schema
+        return schema
 
-    def _parse_into_records(self, data, device_name="nodemcu"):
+    def add_reading_callback(self, callback):
         """
-        Parse raw json file into records for InfluxDB.
+        Publish every decoded reading to the callback, before it is compressed
+        and written.
 
         Args:
-            data (dict): The sensor readings to parse.
-            device_name (str): The name of the device (default is 'nodemcu').
+            callback (callable): Function taking the reading and the names of
+                its values.
         """
 
-        records = {
-            "measurement": "sensor_data",
-            "tags": {"device": device_name},
-            "timestamp": str(datetime.datetime.now()),
-        }
+        self._reading_callbacks.append(callback)
+
+    def remove_reading_callback(self, callback):
+        """Stop publishing the readings to the callback."""
+        if callback in self._reading_callbacks:
+            self._reading_callbacks.remove(callback)
+
+    def add_replay_callback(self, callback):
+        """
+        Notify the callback of every batch of readings replayed from the spool
+        into the bucket of the fetcher, they were written late, e.g. a day
+        stored from the bucket in the meantime misses them.
+
+        Args:
+            callback (callable): Function taking the timestamps of the oldest
+                and the newest replayed reading, in nanoseconds.
+        """
+
+        self._replay_callbacks.append(callback)
+
+    def remove_replay_callback(self, callback):
+        """Stop notifying the callback of the replayed readings."""
+        if callback in self._replay_callbacks:
+            self._replay_callbacks.remove(callback)
+
+    def _get_reads(self, payload, device, timestamp=None) -> Reading:
+        """
+        Based on sensors of the device extract the readings from the payload,
+        parameters that are missing or malformed are reported and left out.
+
+        Args:
+            payload (bytes): The raw JSON payload sent by the device.
+            device (Device): The device the readings come from.
+            timestamp (int): Time of the reading in nanoseconds (now by default).
+        """
+
+        if timestamp is None:
+            timestamp = time.time_ns()
+
+        with DECODE_SECONDS.time():
+            reading = self._get_schema(device).decode_payload(
+                payload, device.name, timestamp
+            )
+
+        READINGS.inc()
+        if reading.errors:
+            ERRORS.inc("decode")
+            logger.warning(
+                "incomplete reading from %s: %s", device.name, reading.errors
+            )
+        return reading
+
+    def _get_compressor(self, device) -> ReadingCompressor:
+        """
+        Return the compressor of readings of the device.
+
+        Args:
+            device (Device): The device the readings come from.
+        """
+
+        compressor = self._compressors.get(device.name)
+        if compressor is None:
+            fields = self._get_schema(device).fields
+            compressor = ReadingCompressor(fields, self._compression)
+            self._compressors[device.name] = compressor
+        return compressor
+
+    async def _roll_up(self, reading, device):
+        """
+        Add the reading into the rollups of the device, buffer the aggregates
+        of windows that were closed by it.
 
-        records["fields"] = self._get_reads(data)
-        return records
+        Args:
+            reading (Reading): The decoded sensor readings.
+            device (Device): The device the readings come from.
+        """
+
+        rollups = self._rollups.get(device.name)
+        if rollups is None:
+            fields = self._get_schema(device).fields
+            rollups = [
+                (bucket, Rollup(fields, window))
+                for window, bucket in sorted(self._rollup_buckets.items())
+            ]
+            self._rollups[device.name] = rollups
 
-    async def _write_to_db(self, client, record):
+            # the window may have been partially written before a restart
+            for bucket, rollup in rollups:
+                start = rollup.window_start(reading.timestamp)
+                stored = await self._stored_rollup(bucket, device, start, rollup)
+                if stored is not None:
+                    rollup.merge(start, stored)
+
+        for bucket, rollup in rollups:
+            aggregates = rollup.add(reading)
+            if aggregates is not None:
+                await self._buffer_rollup(aggregates, device, bucket)
+
+    async def _stored_rollup(self, bucket, device, start, rollup) -> dict | None:
         """
-        Write the sensor readings to InfluxDB.
+        Query the aggregates of the window already stored in the bucket.
 
         Args:
-            client (InfluxDBClientAsync): The InfluxDB client to write to.
-            records (dict): The sensor readings as records for InfluxDB.
+            bucket (str): The rollup bucket.
+            device (Device): The device the readings come from.
+            start (int): Start of the window in nanoseconds.
+            rollup (Rollup): Rollup of the window.
+
+        Returns:
+            dict[str, list[float]]: Values of every statistic in the order of
+                the fields, None if nothing is stored or the query failed.
         """
 
-        print("<.> writing new read into database...")
-        write_api = client.write_api()
-        point = Point.from_dict(record, write_precision="ns")
-        await write_api.write(
-            bucket=self._influxdb_bucket, org=self._influxdb_organization, record=point
+        name = device.name.replace("\\", "\\\\").replace('"', '\\"')
+        name = name.replace("${", "\\${")
+        query = (
+            f'from(bucket:"{bucket}")'
+            f" |> range(start: time(v: {start}), stop: time(v: {start + 1}))"
+            f' |> filter(fn: (r) => r.device == "{name}")'
         )
 
-    async def _store_sensor_readings(self, record):
+        assert self._client is not None, "stored rollup queried before start()"
+        try:
+            tables = await asyncio.wait_for(
+                self._client.query_api().query(query), self._write_timeout
+            )
+        except (InfluxDBError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+            ERRORS.inc("rollup")
+            logger.warning("stored rollup of %s not merged: %r", device.name, e)
+            return None
+
+        columns = {field: i for i, field in enumerate(rollup.fields)}
+        stored = {stat: [float("nan")] * len(columns) for stat in STATS}
+        found = False
+        for table in tables:
+            for record in table.records:
+                stat, field = record.values.get("stat"), record.get_field()
+                if stat in stored and field in columns:
+                    stored[stat][columns[field]] = float(record.get_value())
+                    found = True
+        return stored if found else None
+
+    async def _buffer_rollup(self, aggregates, device, bucket):
+        """
+        Encode the aggregates and put them into the buffer of the bucket.
+
+        Args:
+            aggregates (dict[str, Reading]): Reading per statistic.
+            device (Device): The device the readings come from.
+            bucket (str): The rollup bucket.
+        """
+
+        rollup_buffer = self._rollup_buffers.get(bucket)
+        if rollup_buffer is None:
+            return
+
+        for stat, reading in aggregates.items():
+            encoder = self._rollup_encoders.get((device.name, stat))
+            if encoder is None:
+                encoder = LineProtocolEncoder(device.sensors, tags={"stat": stat})
+                self._rollup_encoders[(device.name, stat)] = encoder
+
+            record = encoder.encode(reading.device, reading.values, reading.timestamp)
+            if record is not None:
+                await rollup_buffer.add(record)
+
+    def _get_encoder(self, device) -> LineProtocolEncoder:
+        """
+        Return the line protocol encoder compiled for sensors of the device.
+
+        Args:
+            device (Device): The device the readings come from.
+        """
+
+        encoder = self._encoders.get(device.name)
+        if encoder is None:
+            encoder = LineProtocolEncoder(device.sensors)
+            self._encoders[device.name] = encoder
+        return encoder
+
+    def _parse_into_records(self, reading, device) -> str | None:
+        """
+        Parse the reading into a line protocol record for InfluxDB.
+
+        Args:
+            reading (Reading): The decoded sensor readings.
+            device (Device): The device the readings come from.
+        """
+
+        return self._get_encoder(device).encode(
+            reading.device, reading.values, reading.timestamp
+        )
+
+    async def _write_batch(self, batch, bucket=None):
+        """
+        Write a batch of sensor readings to InfluxDB in a single request.
+
+        Args:
+            batch (list[str]): The sensor readings encoded in line protocol.
+            bucket (str): Bucket to write into (the fetcher's bucket by default).
+        """
+
+        if bucket is None:
+            bucket = self._influxdb_bucket
+
+        assert self._write_api is not None, "batch written before start()"
+        logger.debug("writing %d reads into %s", len(batch), bucket)
+        with WRITE_SECONDS.time(bucket):
+            await asyncio.wait_for(
+                self._write_api.write(
+                    bucket=bucket,
+                    org=self._influxdb_organization,
+                    record="\n".join(batch),
+                    write_precision="ns",
+                ),
+                self._write_timeout,
+            )
+        WRITTEN.inc(bucket, amount=len(batch))
+
+    async def _write_to_db(self, batch, bucket=None):
+        """
+        Write a batch of sensor readings to InfluxDB, failed writes are spooled.
+
+        While InfluxDB is unavailable batches go straight to the spool, the
+        replay loop writes them once the database is back.
+
+        Args:
+            batch (list[str]): The sensor readings encoded in line protocol.
+            bucket (str): Bucket to write into (the fetcher's bucket by default).
+        """
+
+        if bucket is None:
+            bucket = self._influxdb_bucket
+
+        spool = self._spools.get(bucket)
+        if spool is not None and not self._db_available:
+            spool.append(batch)
+            return
+
+        try:
+            await self._write_batch(batch, bucket)
+        except (InfluxDBError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+            ERRORS.inc("write")
+            logger.error("exception caught while writing into the database: %r", e)
+            if spool is not None:
+                logger.warning("spooling %d reads", len(batch))
+                self._db_available = False
+                spool.append(batch)
+
+    async def _replay_loop(self):
+        """
+        Periodically replay the spool into InfluxDB.
+
+        Runs alongside the fetching loop, so live readings keep being polled
+        while the spool is replayed.
+        """
+
+        while True:
+            await asyncio.sleep(self._replay_interval)
+
+            try:
+                for bucket, spool in self._spools.items():
+                    if spool.segments():
+                        replayed = await spool.replay(
+                            functools.partial(self._replay_batch, bucket=bucket),
+                            self._replay_batch_size,
+                        )
+                        logger.info(
+                            "replayed %d spooled reads into %s", replayed, bucket
+                        )
+            except (InfluxDBError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.warning("database still unavailable, replay postponed: %r", e)
+            else:
+                self._db_available = True
+
+    async def _replay_batch(self, batch, bucket):
+        """
+        Write a batch replayed from the spool, notify the replay callbacks of
+        the readings written into the bucket of the fetcher.
+
+        Args:
+            batch (list[str]): The sensor readings encoded in line protocol.
+            bucket (str): Bucket to write into.
+        """
+
+        await self._write_batch(batch, bucket)
+        if bucket == self._influxdb_bucket and self._replay_callbacks:
+            # the timestamp ends every record
+            times = [int(record.rsplit(" ", 1)[1]) for record in batch]
+            for callback in self._replay_callbacks:
+                callback(min(times), max(times))
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of decoded readings waiting for the writers."""
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def pipeline_stats(self) -> dict:
+        """
+        Return the state of the queue between polling and writing.
+        """
+
+        return {
+            "queue_depth": self.queue_depth,
+            "queue_size": self._queue_size,
+            "writers": len(self._writer_tasks),
+            "overflow": self._overflow,
+            "dropped": self._dropped,
+            "spooled": self._overflow_spooled,
+        }
+
+    async def _store_sensor_readings(self, reading, device):
         """
         Store sensor readings within InfluxDB.
 
+        The reading is put into the queue consumed by the writers. If the queue
+        is full, the overflow policy decides whether to wait, drop the oldest
+        queued reading or spool the reading.
+
         Args:
-            records (dict): The sensor readings in the form of InfluxDB records.
+            reading (Reading): The decoded sensor readings.
+            device (Device): The device the readings come from.
         """
 
-        async with InfluxDBClientAsync(
-            url=self._db_url,
-            token=self._influxdb_token,
-            org=self._influxdb_organization,
-        ) as client:
-            await self._write_to_db(client, record)
+        queue = self._queue
+        assert queue is not None, "reading enqueued before start()"
+
+        item = (reading, device)
+        if self._overflow == "block":
+            await queue.put(item)
+            return
+
+        try:
+            queue.put_nowait(item)
+            return
+        except asyncio.QueueFull:
+            pass
+
+        if self._overflow == "drop_oldest":
+            queue.get_nowait()
+            queue.task_done()
+            queue.put_nowait(item)
+            self._dropped += 1
+            ERRORS.inc("overflow")
+        else:
+            record = self._parse_into_records(reading, device)
+            if record is not None:
+                self._spools[self._influxdb_bucket].append([record])
+                self._overflow_spooled += 1
+                ERRORS.inc("overflow")
 
-    async def _request_sensor_readings(self, session):
+    async def _writer(self):
+        """
+        Encode the queued readings and write them in batches, until cancelled.
+
+        A batch is written once it holds batch_size readings or once the
+        flush_interval passed since its first reading was taken. A batch that
+        fails with an error not handled by _write_to_db() (e.g. the spool
+        cannot be written) is logged and dropped.
+        """
+
+        queue = self._queue
+        assert queue is not None, "writer started before the queue"
+        while True:
+            items = [await queue.get()]
+            deadline = time.monotonic() + self._flush_interval / 1000
+
+            while len(items) < self._batch_size:
+                try:
+                    items.append(queue.get_nowait())
+                    continue
+                except asyncio.QueueEmpty:
+                    pass
+
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    items.append(await asyncio.wait_for(queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            try:
+                batch = []
+                with ENCODE_SECONDS.time():
+                    for reading, device in items:
+                        record = self._parse_into_records(reading, device)
+                        if record is not None:
+                            batch.append(record)
+                if batch:
+                    await self._write_to_db(batch)
+            except Exception as e:
+                # a failed batch must not stop the writer, stop() and blocked
+                # producers wait for the queue to be consumed
+                ERRORS.inc("write")
+                logger.error("dropping batch of %d reads: %r", len(items), e)
+            finally:
+                for _ in items:
+                    queue.task_done()
+
+    async def _request_sensor_readings(self, session, url=None):
         """
         Fetch the sensor readings from the device via http request.
 
         Args:
             session: The aiohttp session to use for the request.
+            url (str): Address of the device (_dev_url by default).
+
+        Returns:
+            bytes: The raw payload, None if the device could not be reached.
         """
 
-        async with session.get(self._dev_url) as response:
-            if response.status != 200:
-                print(f"Error fetching data: {response.status}")
-            else:
-                read = await response.json()
-                return read
+        if url is None:
+            url = self._dev_url
+
+        try:
+            with REQUEST_SECONDS.time():
+                async with session.get(url) as response:
+                    if response.status == 200:
+                        return await response.read()
+            ERRORS.inc("request")
+            logger.error("error fetching data from %s: %d", url, response.status)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            ERRORS.inc("request")
+            logger.error("error fetching data from %s: %r", url, e)
 
-    async def _request_and_store(self):
+    async def _request_and_store(self, device=None):
         """
         Request sensor reading via aiohttp and store them in InfluxDB.
+
+        Args:
+            device (Device): Device to poll (the first device by default).
+        """
+
+        if device is None:
+            device = self._devices[0]
+        if self._stopping:
+            return
+
+        await self.start()
+        async with self._semaphore:
+            payload = await self._request_sensor_readings(self._session, device.url)
+
+        if payload is not None:
+            await self.ingest(payload, device)
+
+    async def ingest(self, payload, device, timestamp=None):
+        """
+        Decode the payload sent by the device and store it within InfluxDB.
+
+        Shared by polling and by the push ingestion server.
+
+        Args:
+            payload (bytes): The raw JSON payload sent by the device.
+            device (Device): The device the readings come from.
+            timestamp (int): Time of the reading in nanoseconds (now by default).
         """
 
-        async with aiohttp.ClientSession() as session:
-            json = await self._request_sensor_readings(session)
-            await self._store_sensor_readings(self._parse_into_records(json))
+        if self._stopping:
+            ERRORS.inc("stopping")
+            logger.warning("fetcher is stopping, reading of %s dropped", device.name)
+            return
+
+        await self.start()
+        self._ingested[device.name] = device
+        reading = self._get_reads(payload, device, timestamp)
+
+        if self._reading_callbacks:
+            fields = self._get_schema(device).fields
+            for callback in self._reading_callbacks:
+                callback(reading, fields)
+
+        # aggregates are computed from every value, before compression
+        if self._rollup_buckets:
+            await self._roll_up(reading, device)
+
+        if self._compression:
+            readings = self._get_compressor(device).compress(reading)
+        else:
+            readings = (reading,)
+
+        for reading in readings:
+            await self._store_sensor_readings(reading, device)
+
+    def scheduler_stats(self) -> dict[str, dict]:
+        """
+        Return tick counters as well as the actual and the target poll rate of
+        every device, see FixedRateScheduler.stats().
+        """
+
+        if self._scheduler is None:
+            return {}
+        return self._scheduler.stats()
 
     async def _fetching_loop(self):
         """
         Main fetcher loop to request and store sensor readings.
 
-        Loop is infinite and receives readings every second, meant to run in
-        the background.
+        Loop is infinite and polls every device at its fixed rate (every second
+        by default), meant to run in the background. Ticks are aligned to the
+        wall-clock, so slow requests do not make the polling drift.
         """
 
-        while True:
-            await asyncio.sleep(1)
-            await self._request_and_store()
+        self._scheduler = FixedRateScheduler(self._jitter)
+        for device in self._devices:
+            self._scheduler.add(
+                device.name,
+                functools.partial(self._request_and_store, device),
+                self.interval(device),
+            )
+
+        await self._scheduler.run()
 
     async def schedule_fetcher(self):
         """
         Create a task group managing the fetching loop.
 
+        Pooled connections are opened before the loop starts and closed once
+        it finishes, is cancelled or fails.
+
         Tested using asyncio.run()
         """
 
-        async with asyncio.TaskGroup() as tg:
-            await tg.create_task(self._fetching_loop())
+        await self.start()
+        try:
+            async with asyncio.TaskGroup() as tg:
+                await tg.create_task(self._fetching_loop())
+        finally:
+            await self.stop()
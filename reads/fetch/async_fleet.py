@@ -0,0 +1,99 @@
+"""
+Module asyncronously fetches the data from a fleet of devices within a single
+event loop and writes the readings into InfluxDB as records.
+
+Author: Piotr Krzysztof Lis - github.com/straightchlorine
+"""
+
+from reads.fetch.async_fetch import AsyncReadFetcher
+from reads.fetch.device import Device
+
+
+class AsyncFleetFetcher(AsyncReadFetcher):
+    """
+    Poll many devices concurrently, sharing the pooled device session, the
+    InfluxDB client and the write buffer between all of them.
+
+    Every reading is tagged with the name of the device it came from. The
+    _dev_* attributes inherited from AsyncReadFetcher describe the first
+    device of the fleet.
+    """
+
+    def __init__(
+        self, host, port, token, org, bucket, devices, max_concurrency=100, **kwargs
+    ):
+        """
+        Initialize the fetcher with the required information.
+
+        Args:
+            host (str): Host of the InfluxDB instance.
+            port (int): Port of the InfluxDB instance.
+            token (str): Token to authenticate with InfluxDB.
+            org (str): Organization to use within InfluxDB.
+            bucket (str): Bucket within InfluxDB where the data will be stored.
+            devices (list[Device]): Devices to poll.
+            max_concurrency (int): Maximum number of devices polled at once.
+            **kwargs: Connection and batching options of AsyncReadFetcher.
+        """
+
+        devices = list(devices)
+        if not devices:
+            raise ValueError("fleet requires at least one device")
+
+        names = [device.name for device in devices]
+        if len(set(names)) != len(names):
+            raise ValueError("device names within the fleet must be unique")
+
+        # by default keep a pooled connection for every concurrent request
+        kwargs.setdefault("connection_limit", max_concurrency)
+
+        first = devices[0]
+        super().__init__(
+            host,
+            port,
+            token,
+            org,
+            bucket,
+            first.sensors,
+            first.ip,
+            first.port,
+            first.handle,
+            device_name=first.name,
+            max_concurrency=max_concurrency,
+            **kwargs,
+        )
+
+        self._devices = devices
+
+    @classmethod
+    def from_config(cls, host, port, token, org, bucket, devices, **kwargs):
+        """
+        Create the fetcher from plain device descriptions.
+
+        Args:
+            devices (list[dict]): Devices described by 'ip', 'port', 'handle',
+                'sensors', 'name', 'interval' and 'token' keys (all but 'ip',
+                'port' and 'sensors' are optional).
+            **kwargs: Options passed to the constructor.
+        """
+
+        return cls(
+            host,
+            port,
+            token,
+            org,
+            bucket,
+            [
+                Device(
+                    device["ip"],
+                    device["port"],
+                    device.get("handle", ""),
+                    device["sensors"],
+                    device.get("name", f"{device['ip']}:{device['port']}"),
+                    device.get("interval"),
+                    device.get("token"),
+                )
+                for device in devices
+            ],
+            **kwargs,
+        )
@@ -0,0 +1,308 @@
+"""
+Per-parameter compression of readings before they are written into InfluxDB,
+dropping values that do not carry new information.
+
+Author: Piotr Krzysztof Lis - github.com/straightchlorine
+"""
+
+import math
+from array import array
+
+from reads.fetch.schema import Reading
+
+NAN = float("nan")
+
+
+class Deadband:
+    """
+    Write a value only if it differs from the last written one by more than
+    the threshold, or if the heartbeat elapsed since the last write.
+
+    Attributes:
+        threshold (float): Smallest change that is written.
+        heartbeat (int): Nanoseconds after which a value is always written.
+    """
+
+    threshold: float  # smallest change that is written
+    heartbeat: int | None  # nanoseconds after which a value is always written
+
+    def __init__(self, threshold, heartbeat=None):
+        """
+        Initialize the filter.
+
+        Args:
+            threshold (float): Smallest change that is written.
+            heartbeat (float): Seconds after which a value is always written
+                (None disables the heartbeat).
+        """
+
+        self.threshold = threshold
+        self.heartbeat = None if heartbeat is None else int(heartbeat * 1e9)
+
+        self._value = None
+        self._written = 0
+
+    def update(self, timestamp, value) -> list[tuple[int, float]]:
+        """
+        Process the value, return the points that should be written.
+
+        Args:
+            timestamp (int): Time of the value in nanoseconds.
+            value (float): The value.
+        """
+
+        if (
+            self._value is None
+            or abs(value - self._value) > self.threshold
+            or (
+                self.heartbeat is not None
+                and timestamp - self._written >= self.heartbeat
+            )
+        ):
+            self._value = value
+            self._written = timestamp
+            return [(timestamp, value)]
+        return []
+
+    def flush(self) -> list[tuple[int, float]]:
+        """Return points held back by the filter (deadband holds none)."""
+        return []
+
+
+class SwingingDoor:
+    """
+    Swinging door trending compression.
+
+    Values are dropped as long as every value received since the last
+    written point lies within the deviation from a straight line between
+    the last written point and the newest value. Once it does not, the
+    previous value is written and becomes the new pivot.
+
+    Attributes:
+        deviation (float): Allowed deviation from the line.
+        heartbeat (int): Nanoseconds after which a value is always written.
+    """
+
+    deviation: float  # allowed deviation from the line
+    heartbeat: int | None  # nanoseconds after which a value is always written
+
+    def __init__(self, deviation, heartbeat=None):
+        """
+        Initialize the filter.
+
+        Args:
+            deviation (float): Allowed deviation from the line.
+            heartbeat (float): Seconds after which a value is always written
+                (None disables the heartbeat).
+        """
+
+        self.deviation = deviation
+        self.heartbeat = None if heartbeat is None else int(heartbeat * 1e9)
+
+        self._pivot = None  # last written point
+        self._previous = None  # last received point, not written yet
+        self._upper = -math.inf  # steepest slope of the upper door
+        self._lower = math.inf  # shallowest slope of the lower door
+
+    def _open(self, timestamp, value):
+        """Reset the doors, the point becomes the pivot."""
+        self._pivot = (timestamp, value)
+        self._previous = None
+        self._upper = -math.inf
+        self._lower = math.inf
+
+    def _swing(self, timestamp, value):
+        """Narrow the doors by the point."""
+        assert self._pivot is not None, "doors swung before they were opened"
+        pivot_time, pivot_value = self._pivot
+        elapsed = timestamp - pivot_time
+        self._upper = max(self._upper, (value - pivot_value - self.deviation) / elapsed)
+        self._lower = min(self._lower, (value - pivot_value + self.deviation) / elapsed)
+
+    def update(self, timestamp, value) -> list[tuple[int, float]]:
+        """
+        Process the value, return the points that should be written.
+
+        Args:
+            timestamp (int): Time of the value in nanoseconds.
+            value (float): The value.
+        """
+
+        if (
+            self._pivot is None
+            or timestamp <= self._pivot[0]
+            or (
+                self.heartbeat is not None
+                and timestamp - self._pivot[0] >= self.heartbeat
+            )
+        ):
+            # the held back point ends the line, otherwise the values between
+            # it and the new pivot would be lost
+            written = [] if self._previous is None else [self._previous]
+            self._open(timestamp, value)
+            written.append((timestamp, value))
+            return written
+
+        self._swing(timestamp, value)
+        if self._upper <= self._lower:
+            self._previous = (timestamp, value)
+            return []
+
+        # the doors opened, the previous point is the last one on the line
+        written = []
+        if self._previous is not None:
+            written.append(self._previous)
+            self._open(*self._previous)
+            self._swing(timestamp, value)
+            self._previous = (timestamp, value)
+        else:
+            self._open(timestamp, value)
+            written.append((timestamp, value))
+        return written
+
+    def flush(self) -> list[tuple[int, float]]:
+        """Return the last received point, if it was not written yet."""
+        if self._previous is None:
+            return []
+        previous = self._previous
+        self._open(*previous)
+        return [previous]
+
+
+class ReadingCompressor:
+    """
+    Compress the readings of a single device parameter by parameter.
+
+    Parameters are configured by dictionaries of the form:
+        {"mode": "deadband", "threshold": 0.5, "heartbeat": 600}
+        {"mode": "swinging_door", "deviation": 0.5, "heartbeat": 600}
+
+    Parameters without configuration are always written. Compressed values
+    are written at least once every heartbeat (10 minutes by default), which
+    must be shorter than MAX_HEARTBEAT, so the latest value of every parameter
+    is always within the lookback of AsyncQuery.latest().
+
+    Attributes:
+        fields (tuple[str]): Names of the parameters, in the order of values.
+        _filters (list): Filter of every parameter (None - not compressed).
+    """
+
+    fields: tuple[str, ...]  # names of the parameters in the order of values
+
+    MODES = {"deadband": Deadband, "swinging_door": SwingingDoor}
+
+    DEFAULT_HEARTBEAT = 600.0  # seconds
+    MAX_HEARTBEAT = 3600.0  # seconds, lookback of AsyncQuery.latest()
+
+    def __init__(self, fields, config):
+        """
+        Initialize the compressor.
+
+        Args:
+            fields (tuple[str]): Names of the parameters, in the order of values.
+            config (dict[str, dict]): Configuration per parameter name, the
+                '*' key configures every parameter not listed explicitly.
+        """
+
+        self.fields = tuple(fields)
+        self._filters = [
+            self._make_filter(config.get(f, config.get("*"))) for f in fields
+        ]
+
+    @classmethod
+    def _make_filter(cls, spec):
+        """Create the filter described by the configuration."""
+        if spec is None:
+            return None
+
+        spec = dict(spec)
+        mode = spec.pop("mode", "deadband")
+        if mode not in cls.MODES:
+            raise ValueError(f"unknown compression mode {mode!r}")
+
+        heartbeat = spec.get("heartbeat")
+        if heartbeat is None:
+            heartbeat = cls.DEFAULT_HEARTBEAT
+        if not 0 < heartbeat < cls.MAX_HEARTBEAT:
+            raise ValueError(
+                f"heartbeat must be within (0, {cls.MAX_HEARTBEAT}) seconds, "
+                f"got {heartbeat}"
+            )
+
+        if mode == "deadband":
+            return Deadband(spec.get("threshold", 0.0), heartbeat)
+        return SwingingDoor(spec.get("deviation", 0.0), heartbeat)
+
+    def _collect(self, device, points, readings=None) -> list[Reading]:
+        """
+        Group the points written by the filters into readings by timestamp.
+
+        Args:
+            device (str): Name of the device.
+            points (list[tuple[int, int, float]]): Index, timestamp and value.
+            readings (dict[int, Reading]): Readings to add the points to.
+        """
+
+        if readings is None:
+            readings = {}
+
+        for index, timestamp, value in points:
+            reading = readings.get(timestamp)
+            if reading is None:
+                reading = Reading(
+                    device, timestamp, array("d", [NAN] * len(self.fields))
+                )
+                readings[timestamp] = reading
+            reading.values[index] = value
+
+        return [readings[timestamp] for timestamp in sorted(readings)]
+
+    def compress(self, reading) -> list[Reading]:
+        """
+        Compress the reading.
+
+        Values that should not be written are replaced with NaN, which the
+        line protocol encoder leaves out. Swinging door might write points
+        of the previous readings, those are returned as separate readings.
+
+        Args:
+            reading (Reading): The reading to compress.
+
+        Returns:
+            list[Reading]: Readings to write, ordered by their timestamps.
+        """
+
+        current = Reading(
+            reading.device,
+            reading.timestamp,
+            array("d", [NAN] * len(self.fields)),
+            reading.errors,
+        )
+
+        points = []
+        for index, (param_filter, value) in enumerate(
+            zip(self._filters, reading.values)
+        ):
+            if param_filter is None:
+                current.values[index] = value
+            elif value == value:  # NaN marks a missing value
+                for timestamp, point in param_filter.update(reading.timestamp, value):
+                    points.append((index, timestamp, point))
+
+        return self._collect(reading.device, points, {reading.timestamp: current})
+
+    def flush(self, device) -> list[Reading]:
+        """
+        Return the points the filters are holding back, e.g. on shutdown.
+
+        Args:
+            device (str): Name of the device.
+        """
+
+        points = [
+            (index, timestamp, value)
+            for index, param_filter in enumerate(self._filters)
+            if param_filter is not None
+            for timestamp, value in param_filter.flush()
+        ]
+        return self._collect(device, points)
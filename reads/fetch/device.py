@@ -0,0 +1,62 @@
+"""
+Description of a device providing sensor readings.
+
+Author: Piotr Krzysztof Lis - github.com/straightchlorine
+"""
+
+
+class Device:
+    """
+    Device providing the sensor readings over http.
+
+    Attributes:
+        ip (str): The IP address of the device.
+        port (int): The port of the device.
+        handle (str): The http handle to access the data.
+        sensors (dict): Sensors attached to the device and their parameters.
+        name (str): Name the readings are tagged with in InfluxDB.
+        interval (float): Poll interval of the device in seconds.
+        token (str): Token the device authenticates with when pushing readings.
+        url (str): The address of the device in the network.
+    """
+
+    ip: str  # ip of the device sending the data
+    port: int  # port of the device sending the data
+    handle: str  # handle to access the data
+    sensors: dict  # sensors attached to the device
+    name: str  # value of the device tag in influxdb
+    interval: float | None  # poll interval in seconds (None - fetcher's default)
+    token: str | None  # token used to authenticate pushed readings
+
+    url: str  # address of the device in the network
+
+    def __init__(
+        self, ip, port, handle, sensors, name="nodemcu", interval=None, token=None
+    ):
+        """
+        Initialize the device.
+
+        Args:
+            ip (str): The IP address of the device.
+            port (int): The port of the device.
+            handle (str): The http handle to access the data.
+            sensors (dict): Sensors attached to the device and their parameters.
+            name (str): Name the readings are tagged with ('nodemcu' by default).
+            interval (float): Poll interval in seconds (None to use the default
+                interval of the fetcher).
+            token (str): Token the device authenticates with when pushing
+                readings (None - the device is not allowed to push).
+        """
+
+        self.ip = ip
+        self.port = port
+        self.handle = handle
+        self.sensors = sensors
+        self.name = name
+        self.interval = interval
+        self.token = token
+
+        self.url = f"http://{self.ip}:{self.port}/{self.handle}"
+
+    def __repr__(self) -> str:
+        return f"Device({self.name!r}, {self.url!r})"
@@ -0,0 +1,138 @@
+"""
+Line protocol encoder compiled once from the sensors configuration.
+
+Author: Piotr Krzysztof Lis - github.com/straightchlorine
+"""
+
+import math
+
+# characters escaped within measurement names
+_ESCAPE_MEASUREMENT = str.maketrans(
+    {",": r"\,", " ": r"\ ", "\n": r"\n", "\t": r"\t", "\r": r"\r"}
+)
+
+# characters escaped within tag keys, tag values and field keys
+_ESCAPE_KEY = str.maketrans(
+    {",": r"\,", "=": r"\=", " ": r"\ ", "\n": r"\n", "\t": r"\t", "\r": r"\r"}
+)
+
+
+def escape_key(key) -> str:
+    """Escape a tag key, tag value or field key."""
+    escaped = str(key).translate(_ESCAPE_KEY)
+    if escaped.endswith("\\"):
+        escaped += " "
+    return escaped
+
+
+class LineProtocolEncoder:
+    """
+    Encode sensor readings into InfluxDB line protocol.
+
+    The measurement name, the tag key and the field keys are fixed by the
+    sensors configuration, so they are escaped once when the encoder is
+    created. Encoding a reading only formats the values into a precompiled
+    template.
+
+    Attributes:
+        measurement (str): Name of the measurement.
+        tag (str): Key of the tag identifying the device.
+        tags (dict[str, str]): Constant tags added to every line.
+        fields (tuple[str]): Field keys, in the order values are expected in.
+        _prefixes (tuple[str]): Escaped field keys followed by '='.
+        _template (str): Format string of a line with every field present.
+        _heads (dict[str, str]): Measurement and tag set per tag value.
+    """
+
+    measurement: str  # name of the measurement
+    tag: str  # key of the tag identifying the device
+    tags: dict[str, str]  # constant tags added to every line
+    fields: tuple[str, ...]  # field keys in the order of the values
+
+    _prefixes: tuple[str, ...]  # escaped field keys followed by '='
+    _template: str  # format string of a line with every field present
+    _heads: dict[str, str]  # measurement and tag set per tag value
+
+    def __init__(self, sensors, measurement="sensor_data", tag="device", tags=None):
+        """
+        Compile the encoder.
+
+        Args:
+            sensors (dict): The sensors and their parameters, parameters become
+                fields in the order they are listed in.
+            measurement (str): Name of the measurement ('sensor_data' by default).
+            tag (str): Key of the tag identifying the device ('device' by default).
+            tags (dict[str, str]): Constant tags added to every line.
+        """
+
+        fields = tuple(param for sensor in sensors for param in sensors[sensor])
+        if len(set(fields)) != len(fields):
+            raise ValueError("parameter names must be unique across sensors")
+
+        self.measurement = measurement
+        self.tag = tag
+        self.tags = dict(tags or {})
+        self.fields = fields
+
+        self._measurement = str(measurement).translate(_ESCAPE_MEASUREMENT)
+        self._tag = escape_key(tag)
+        self._tags = "".join(
+            f",{escape_key(key)}={escape_key(value)}"
+            for key, value in sorted(self.tags.items())
+        )
+        self._prefixes = tuple(f"{escape_key(field)}=" for field in fields)
+        self._template = (
+            "{}"
+            + ",".join(
+                prefix.replace("{", "{{").replace("}", "}}") + "{}"
+                for prefix in self._prefixes
+            )
+            + " {}"
+        )
+        self._heads = {}
+
+    def _head(self, tag_value) -> str:
+        """Return the measurement and the tag set, followed by a space."""
+        head = self._heads.get(tag_value)
+        if head is None:
+            head = (
+                f"{self._measurement},{self._tag}={escape_key(tag_value)}"
+                f"{self._tags} "
+            )
+            self._heads[tag_value] = head
+        return head
+
+    def encode(self, tag_value, values, timestamp) -> str | None:
+        """
+        Encode a single reading into a line of line protocol.
+
+        Values that are not finite are skipped, as InfluxDB does not accept
+        them.
+
+        Args:
+            tag_value (str): Value of the device tag.
+            values (iterable[float]): Values in the order of the fields.
+            timestamp (int): Timestamp of the reading in nanoseconds.
+
+        Returns:
+            str: The encoded reading, None if none of the values is finite.
+        """
+
+        values = tuple(values)
+
+        # fast path, the sum is finite only if every value is finite
+        total = sum(values)
+        if total - total == 0 and len(values) == len(self._prefixes):
+            return self._template.format(self._head(tag_value), *values, timestamp)
+
+        isfinite = math.isfinite
+        body = ",".join(
+            [
+                prefix + str(value)
+                for prefix, value in zip(self._prefixes, values)
+                if isfinite(value)
+            ]
+        )
+        if not body:
+            return None
+        return f"{self._head(tag_value)}{body} {timestamp}"
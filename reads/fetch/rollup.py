@@ -0,0 +1,163 @@
+"""
+Running aggregates of readings over fixed time windows, written into
+downsampled buckets by the fetcher.
+
+Author: Piotr Krzysztof Lis - github.com/straightchlorine
+"""
+
+import math
+from array import array
+
+from reads.fetch.schema import Reading
+
+# statistics kept for every window, written as values of the 'stat' tag
+STATS = ("min", "max", "mean", "count")
+
+
+class Rollup:
+    """
+    Minimum, maximum, mean and count of every parameter of a single device
+    over consecutive windows aligned to the epoch.
+
+    Aggregates of a window are stamped with the start of the window, thus a
+    window written again replaces the stored one. Aggregates already stored
+    for the window (e.g. flushed before a restart) are merged in beforehand,
+    readings older than the current window are not aggregated.
+
+    Attributes:
+        fields (tuple[str]): Names of the parameters, in the order of values.
+        window (int): Length of the window in nanoseconds.
+        late (int): Readings older than the current window, left out.
+        _start (int): Start of the current window (None before the first value).
+    """
+
+    fields: tuple[str, ...]  # names of the parameters in the order of values
+    window: int  # length of the window in nanoseconds
+    late: int  # readings older than the current window, left out
+
+    _start: int | None  # start of the current window
+
+    def __init__(self, fields, window):
+        """
+        Initialize the rollup.
+
+        Args:
+            fields (tuple[str]): Names of the parameters, in the order of values.
+            window (float): Length of the window in seconds.
+        """
+
+        self.fields = tuple(fields)
+        self.window = int(window * 1e9)
+        self.late = 0
+        self._start = None
+        self._reset()
+
+    def window_start(self, timestamp) -> int:
+        """Return the start of the window the timestamp belongs to."""
+        return timestamp - timestamp % self.window
+
+    def _reset(self):
+        """Start aggregating a new window."""
+        size = len(self.fields)
+        self._min = array("d", [math.inf] * size)
+        self._max = array("d", [-math.inf] * size)
+        self._sum = array("d", [0.0] * size)
+        self._count = array("d", [0.0] * size)
+
+    def _aggregates(self, device) -> dict[str, Reading] | None:
+        """
+        Return the aggregates of the current window as a reading per statistic.
+
+        Args:
+            device (str): Name of the device.
+        """
+
+        if self._start is None or not any(self._count):
+            return None
+
+        nan = float("nan")
+        mean = array(
+            "d",
+            [s / c if c else nan for s, c in zip(self._sum, self._count)],
+        )
+        count = array("d", [c if c else nan for c in self._count])
+
+        values = {"min": self._min, "max": self._max, "mean": mean, "count": count}
+        return {stat: Reading(device, self._start, values[stat]) for stat in STATS}
+
+    def add(self, reading) -> dict[str, Reading] | None:
+        """
+        Add the reading into the aggregates.
+
+        Args:
+            reading (Reading): The reading to aggregate.
+
+        Returns:
+            dict[str, Reading]: Aggregates of the window the reading closed,
+                None if the reading belongs to the current window.
+        """
+
+        start = self.window_start(reading.timestamp)
+
+        # reopening a closed window would overwrite its stored aggregates
+        if self._start is not None and start < self._start:
+            self.late += 1
+            return None
+
+        closed = None
+        if start != self._start:
+            closed = self._aggregates(reading.device)
+            self._start = start
+            self._reset()
+
+        for i, value in enumerate(reading.values):
+            if value != value:  # NaN marks a missing value
+                continue
+            if value < self._min[i]:
+                self._min[i] = value
+            if value > self._max[i]:
+                self._max[i] = value
+            self._sum[i] += value
+            self._count[i] += 1
+
+        return closed
+
+    def merge(self, start, aggregates):
+        """
+        Merge the aggregates stored for the window into the current window,
+        which becomes the window if there is none yet. Aggregates of another
+        window are ignored.
+
+        Args:
+            start (int): Start of the window in nanoseconds.
+            aggregates (dict[str, list[float]]): Values of every statistic in
+                the order of the fields, NaN where missing.
+        """
+
+        if self._start != start:
+            if self._start is not None:
+                return
+            self._start = start
+            self._reset()
+
+        for i in range(len(self.fields)):
+            count = aggregates["count"][i]
+            if not count > 0:  # NaN marks a missing value
+                continue
+            self._min[i] = min(self._min[i], aggregates["min"][i])
+            self._max[i] = max(self._max[i], aggregates["max"][i])
+            self._sum[i] += aggregates["mean"][i] * count
+            self._count[i] += count
+
+    def flush(self, device) -> dict[str, Reading] | None:
+        """
+        Return the aggregates of the current, incomplete window and reset.
+
+        Args:
+            device (str): Name of the device.
+        """
+
+        aggregates = self._aggregates(device)
+        self._start = None
+        self._reset()
+        return aggregates
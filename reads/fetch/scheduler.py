@@ -0,0 +1,229 @@
+"""
+Drift-free, fixed-rate scheduling of periodic coroutines.
+
+Author: Piotr Krzysztof Lis - github.com/straightchlorine
+"""
+
+import asyncio
+import logging
+import math
+import random
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class ScheduledJob:
+    """
+    Periodic coroutine run by the FixedRateScheduler.
+
+    Attributes:
+        name (str): Name identifying the job.
+        callback (coroutine function): Coroutine function run on every tick.
+        interval (float): Period of the job in seconds.
+        offset (float): Phase of the job within the interval in seconds.
+        ticks (int): Number of ticks that started a run.
+        completed (int): Number of runs that finished.
+        skipped (int): Number of ticks skipped because of an overlapping run.
+        errors (int): Number of runs that raised an exception.
+        started (float): Wall-clock time the job was first scheduled.
+    """
+
+    name: str  # name identifying the job
+    interval: float  # period of the job in seconds
+    offset: float  # phase of the job within the interval in seconds
+
+    ticks: int  # ticks that started a run
+    completed: int  # runs that finished
+    skipped: int  # ticks skipped because the previous run was still running
+    errors: int  # runs that raised an exception
+    started: float  # wall-clock time the job was first scheduled
+
+    def __init__(self, name, callback, interval, offset=0.0):
+        """
+        Initialize the job.
+
+        Args:
+            name (str): Name identifying the job.
+            callback (coroutine function): Coroutine function run on every tick.
+            interval (float): Period of the job in seconds.
+            offset (float): Phase of the job within the interval in seconds.
+        """
+
+        if interval <= 0:
+            raise ValueError("interval must be positive")
+
+        self.name = name
+        self.callback = callback
+        self.interval = interval
+        self.offset = offset % interval
+
+        self.ticks = 0
+        self.completed = 0
+        self.skipped = 0
+        self.errors = 0
+        self.started = 0.0
+
+        self._running = None
+
+    def next_tick(self, now) -> int:
+        """
+        Compute the index of the first tick strictly after now.
+
+        Ticks are aligned to multiples of the interval since the epoch,
+        shifted by the offset of the job.
+
+        Args:
+            now (float): Current wall-clock time.
+        """
+
+        return math.floor((now - self.offset) / self.interval) + 1
+
+    def deadline(self, tick) -> float:
+        """
+        Compute the wall-clock time of the tick.
+
+        Args:
+            tick (int): Index of the tick.
+        """
+
+        return tick * self.interval + self.offset
+
+    @property
+    def target_rate(self) -> float:
+        """Runs per second the job is scheduled at."""
+        return 1 / self.interval
+
+    @property
+    def actual_rate(self) -> float:
+        """Runs per second that actually finished since the job was started."""
+        elapsed = time.time() - self.started
+        if not self.started or elapsed <= 0:
+            return 0.0
+        return self.completed / elapsed
+
+    def stats(self) -> dict:
+        """Return the counters and the rates of the job."""
+        return {
+            "interval": self.interval,
+            "ticks": self.ticks,
+            "completed": self.completed,
+            "skipped": self.skipped,
+            "errors": self.errors,
+            "target_rate": self.target_rate,
+            "actual_rate": self.actual_rate,
+        }
+
+    def _on_done(self, task):
+        """Account for a finished run."""
+        if task.cancelled():
+            return
+        if task.exception() is not None:
+            self.errors += 1
+            logger.error("error in scheduled job %s: %r", self.name, task.exception())
+        else:
+            self.completed += 1
+
+
+class FixedRateScheduler:
+    """
+    Run coroutines at fixed rates, with ticks derived from absolute deadlines.
+
+    The duration of a run does not delay the following ticks. A tick that
+    would overlap a run which is still in progress is skipped and counted,
+    as are ticks missed because the event loop was blocked.
+
+    Attributes:
+        _jobs (dict[str, ScheduledJob]): The scheduled jobs by name.
+        _jitter (float): Fraction of the interval used to spread out jobs.
+    """
+
+    _jobs: dict[str, ScheduledJob]  # scheduled jobs by name
+    _jitter: float  # fraction of the interval used to spread the jobs
+
+    def __init__(self, jitter=0.0, seed=None):
+        """
+        Initialize the scheduler.
+
+        Args:
+            jitter (float): Fraction of the interval (0 - 1) over which the
+                phases of the jobs are randomly spread.
+            seed (int): Seed of the random phases, for reproducible schedules.
+        """
+
+        if not 0 <= jitter <= 1:
+            raise ValueError("jitter must be within [0, 1]")
+
+        self._jobs = {}
+        self._jitter = jitter
+        self._random = random.Random(seed)
+
+    @property
+    def jobs(self) -> dict[str, ScheduledJob]:
+        """The scheduled jobs by name."""
+        return self._jobs
+
+    def add(self, name, callback, interval, jitter=None) -> ScheduledJob:
+        """
+        Schedule the coroutine function to run every interval seconds.
+
+        Args:
+            name (str): Name identifying the job.
+            callback (coroutine function): Coroutine function run on every tick.
+            interval (float): Period of the job in seconds.
+            jitter (float): Jitter of this job (the scheduler's by default).
+        """
+
+        if name in self._jobs:
+            raise ValueError(f"job {name!r} is already scheduled")
+
+        if jitter is None:
+            jitter = self._jitter
+
+        offset = self._random.uniform(0, jitter * interval)
+        job = ScheduledJob(name, callback, interval, offset)
+        self._jobs[name] = job
+        return job
+
+    def stats(self) -> dict[str, dict]:
+        """Return the counters and the rates of every job."""
+        return {name: job.stats() for name, job in self._jobs.items()}
+
+    async def _run_job(self, job):
+        """
+        Tick the job at its deadlines until cancelled.
+
+        Args:
+            job (ScheduledJob): The job to run.
+        """
+
+        job.started = time.time()
+        tick = job.next_tick(job.started)
+
+        try:
+            while True:
+                await asyncio.sleep(max(0.0, job.deadline(tick) - time.time()))
+
+                if job._running is not None and not job._running.done():
+                    job.skipped += 1
+                else:
+                    job.ticks += 1
+                    job._running = asyncio.create_task(job.callback())
+                    job._running.add_done_callback(job._on_done)
+
+                # skip (and count) the deadlines that already passed
+                upcoming = max(tick + 1, job.next_tick(time.time()))
+                job.skipped += upcoming - tick - 1
+                tick = upcoming
+        finally:
+            if job._running is not None and not job._running.done():
+                job._running.cancel()
+
+    async def run(self):
+        """
+        Run every scheduled job until cancelled.
+        """
+
+        async with asyncio.TaskGroup() as tg:
+            for job in self._jobs.values():
+                tg.create_task(self._run_job(job))
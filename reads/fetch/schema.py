@@ -0,0 +1,153 @@
+"""
+Sensor schema compiled once from the sensors configuration, decoding device
+payloads into compact readings.
+
+Author: Piotr Krzysztof Lis - github.com/straightchlorine
+"""
+
+import json
+from array import array
+
+try:
+    import orjson
+
+    loads = orjson.loads
+except ImportError:  # pragma: no cover - depends on the environment
+    loads = json.loads
+
+NAN = float("nan")
+
+
+class Reading:
+    """
+    Single reading of every parameter of a device.
+
+    Attributes:
+        device (str): Name of the device the reading comes from.
+        timestamp (int): Time of the reading in nanoseconds since the epoch.
+        values (array): Values in the order of the schema fields, missing or
+            malformed values are NaN.
+        errors (dict[str, str]): Problems with particular fields (None if the
+            reading is complete).
+    """
+
+    __slots__ = ("device", "timestamp", "values", "errors")
+
+    device: str  # name of the device the reading comes from
+    timestamp: int  # nanoseconds since the epoch
+    values: array  # values in the order of the schema fields
+    errors: dict[str, str] | None  # problems with particular fields
+
+    def __init__(self, device, timestamp, values, errors=None):
+        self.device = device
+        self.timestamp = timestamp
+        self.values = values
+        self.errors = errors
+
+    def __repr__(self) -> str:
+        return f"Reading({self.device!r}, {self.timestamp}, {list(self.values)})"
+
+
+class SensorSchema:
+    """
+    Extraction plan of the parameters from the payload sent by the device.
+
+    The payload is expected in the form sent by NodeMCU:
+        {"nodemcu": {"<sensor>": {"<parameter>": "<value>", ...}, ...}}
+
+    Attributes:
+        root (str): Key the sensors are nested under within the payload.
+        fields (tuple[str]): Names of the parameters, in the order of values.
+        _plan (tuple[tuple[str, tuple[str]]]): Parameters grouped by sensor.
+    """
+
+    root: str  # key the sensors are nested under within the payload
+    fields: tuple[str, ...]  # names of the parameters in the order of values
+
+    _plan: tuple[tuple[str, tuple[str, ...]], ...]  # parameters by sensor
+
+    def __init__(self, sensors, root="nodemcu"):
+        """
+        Compile the schema.
+
+        Args:
+            sensors (dict): The sensors and their parameters to read.
+            root (str): Key the sensors are nested under ('nodemcu' by default).
+        """
+
+        self.root = root
+        self._plan = tuple((sensor, tuple(sensors[sensor])) for sensor in sensors)
+        self.fields = tuple(param for _, params in self._plan for param in params)
+
+        if len(set(self.fields)) != len(self.fields):
+            raise ValueError("parameter names must be unique across sensors")
+
+    def __len__(self) -> int:
+        return len(self.fields)
+
+    def decode(self, data, device, timestamp) -> Reading:
+        """
+        Extract the parameters from an already parsed payload.
+
+        Problems with particular parameters are reported within the errors
+        of the reading instead of aborting the decoding.
+
+        Args:
+            data (dict): The parsed payload.
+            device (str): Name of the device the payload comes from.
+            timestamp (int): Time of the reading in nanoseconds.
+        """
+
+        values = []
+        errors = None
+
+        sensors = data.get(self.root) if isinstance(data, dict) else None
+        if not isinstance(sensors, dict):
+            errors = {field: f"missing '{self.root}' object" for field in self.fields}
+            return Reading(device, timestamp, array("d", [NAN] * len(self)), errors)
+
+        for sensor, params in self._plan:
+            group = sensors.get(sensor)
+            if not isinstance(group, dict):
+                if errors is None:
+                    errors = {}
+                for param in params:
+                    errors[param] = f"missing sensor '{sensor}'"
+                values.extend([NAN] * len(params))
+                continue
+
+            for param in params:
+                try:
+                    values.append(float(group[param]))
+                except KeyError:
+                    if errors is None:
+                        errors = {}
+                    errors[param] = "missing"
+                    values.append(NAN)
+                except (TypeError, ValueError):
+                    if errors is None:
+                        errors = {}
+                    errors[param] = f"malformed value {group[param]!r}"
+                    values.append(NAN)
+
+        return Reading(device, timestamp, array("d", values), errors)
+
+    def decode_payload(self, payload, device, timestamp) -> Reading:
+        """
+        Parse the raw JSON payload and extract the parameters.
+
+        Uses orjson when it is installed, json otherwise.
+
+        Args:
+            payload (bytes): The raw JSON payload.
+            device (str): Name of the device the payload comes from.
+            timestamp (int): Time of the reading in nanoseconds.
+        """
+
+        try:
+            data = loads(payload)
+        except ValueError as e:
+            errors = {field: f"invalid json: {e}" for field in self.fields}
+            return Reading(device, timestamp, array("d", [NAN] * len(self)), errors)
+
+        return self.decode(data, device, timestamp)
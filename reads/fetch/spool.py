@@ -0,0 +1,157 @@
+"""
+Append-only on-disk spool of line protocol records which could not be written
+into InfluxDB, replayed in bulk once the database is available again.
+
+Author: Piotr Krzysztof Lis - github.com/straightchlorine
+"""
+
+import asyncio
+import os
+from pathlib import Path
+
+
+class Spool:
+    """
+    Segmented, append-only spool of line protocol records.
+
+    Records are appended to the active segment file, which is closed and
+    replaced by a new one once it grows over segment_size bytes. Closed
+    segments are replayed oldest first and removed once every record they
+    hold has been written. Replaying a record twice (e.g. after a crash in
+    the middle of a segment) is harmless, InfluxDB overwrites points with the
+    same measurement, tag set and timestamp.
+
+    Attributes:
+        _directory (Path): Directory holding the segment files.
+        _segment_size (int): Size in bytes after which a segment is closed.
+        _fsync (bool): Whether every append is flushed to the disk.
+        _active (Path): Segment records are currently appended to.
+        _sequence (int): Sequence number of the newest segment.
+        _replayed (dict[Path, int]): Records already replayed per segment.
+    """
+
+    _directory: Path  # directory holding the segment files
+    _segment_size: int  # size in bytes after which a segment is closed
+    _fsync: bool  # whether every append is flushed to the disk
+
+    _active: Path | None  # segment records are appended to
+    _sequence: int  # sequence number of the newest segment
+    _replayed: dict[Path, int]  # records already replayed per segment
+
+    SUFFIX = ".lp"
+
+    def __init__(self, directory, segment_size=4 * 1024 * 1024, fsync=False):
+        """
+        Open the spool, segments left by a previous run become pending.
+
+        Args:
+            directory (str): Directory holding the segment files.
+            segment_size (int): Size in bytes after which a segment is closed.
+            fsync (bool): Flush every append to the disk (slower, but survives
+                a power loss).
+        """
+
+        self._directory = Path(directory)
+        self._directory.mkdir(parents=True, exist_ok=True)
+        self._segment_size = segment_size
+        self._fsync = fsync
+
+        self._file = None
+        self._active = None
+        self._replayed = {}
+
+        segments = self.segments()
+        self._sequence = int(segments[-1].stem) if segments else 0
+
+    def __enter__(self) -> "Spool":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+    def segments(self) -> list[Path]:
+        """Return every segment file, oldest first."""
+        return sorted(self._directory.glob(f"*{self.SUFFIX}"))
+
+    @property
+    def pending(self) -> int:
+        """Number of bytes waiting to be replayed."""
+        return sum(segment.stat().st_size for segment in self.segments())
+
+    def append(self, records: list[str]):
+        """
+        Append the records to the active segment.
+
+        Args:
+            records (list[str]): Records in line protocol.
+        """
+
+        if not records:
+            return
+
+        if self._file is None:
+            self._sequence += 1
+            self._active = self._directory / f"{self._sequence:012d}{self.SUFFIX}"
+            self._file = open(self._active, "a", encoding="utf-8")
+
+        self._file.write("\n".join(records) + "\n")
+        self._file.flush()
+        if self._fsync:
+            os.fsync(self._file.fileno())
+
+        if self._file.tell() >= self._segment_size:
+            self._rotate()
+
+    def _rotate(self):
+        """Close the active segment, so that it can be replayed."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            self._active = None
+
+    @staticmethod
+    def _read_segment(segment) -> list[str]:
+        """Read every record of the segment."""
+        with open(segment, "r", encoding="utf-8") as f:
+            return [line for line in f.read().splitlines() if line]
+
+    async def replay(self, write, batch_size=5000) -> int:
+        """
+        Write every spooled record using the write coroutine function.
+
+        Segments are read in a worker thread and written in batches of
+        batch_size records, yielding to the event loop in between, so that
+        the live ingestion is not stalled. An exception raised by write stops
+        the replay and is propagated, the records which were not written stay
+        in the spool.
+
+        Args:
+            write (coroutine function): Writes a list of records.
+            batch_size (int): Number of records written at once.
+
+        Returns:
+            int: Number of replayed records.
+        """
+
+        # new records are appended into a new segment from now on
+        self._rotate()
+
+        replayed = 0
+        for segment in self.segments():
+            records = await asyncio.to_thread(self._read_segment, segment)
+
+            start = self._replayed.get(segment, 0)
+            for offset in range(start, len(records), batch_size):
+                batch = records[offset : offset + batch_size]
+                await write(batch)
+                self._replayed[segment] = offset + len(batch)
+                replayed += len(batch)
+
+            segment.unlink()
+            self._replayed.pop(segment, None)
+
+        return replayed
+
+    def close(self):
+        """Close the active segment."""
+        self._rotate()
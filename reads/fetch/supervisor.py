@@ -0,0 +1,496 @@
+"""
+Module spreads polling of a fleet of devices over several processes, each
+running its own event loop and InfluxDB write path.
+
+Author: Piotr Krzysztof Lis - github.com/straightchlorine
+"""
+
+import asyncio
+import hashlib
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from typing import Any
+
+from reads.fetch.async_fetch import ERRORS, READINGS, WRITTEN
+from reads.fetch.async_fleet import AsyncFleetFetcher
+from reads.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+WORKERS_ALIVE = REGISTRY.gauge("reads_workers_alive", "Fetcher processes running.")
+WORKER_RESTARTS = REGISTRY.counter(
+    "reads_worker_restarts_total", "Fetcher processes restarted after a crash."
+)
+FLEET_RATE = REGISTRY.gauge(
+    "reads_fleet_readings_per_second", "Readings decoded per second by every worker."
+)
+
+
+def _receive(commands) -> asyncio.Future:
+    """
+    Wait for the next command of the supervisor without blocking the loop.
+
+    A daemon thread is used instead of the default executor, so a worker that
+    fails is not kept alive by a thread blocked on the queue.
+    """
+
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+
+    def receive():
+        command = commands.get()
+        try:
+            loop.call_soon_threadsafe(
+                lambda: future.done() or future.set_result(command)
+            )
+        except RuntimeError:  # the loop is already closed
+            pass
+
+    threading.Thread(target=receive, daemon=True).start()
+    return future
+
+
+async def _report(worker, fetcher, status, report_interval):
+    """
+    Periodically send the counters of the worker to the supervisor.
+    """
+
+    while True:
+        status.put(
+            {
+                "worker": worker,
+                "pid": os.getpid(),
+                "devices": len(fetcher.devices) if fetcher is not None else 0,
+                "readings": READINGS.total(),
+                "written": WRITTEN.total(),
+                "errors": ERRORS.total(),
+                "queue_depth": fetcher.queue_depth if fetcher is not None else 0,
+                "time": time.time(),
+            }
+        )
+        await asyncio.sleep(report_interval)
+
+
+async def _work(worker, devices, connection, options, commands, status, interval):
+    """
+    Poll the assigned devices until the supervisor stops the worker.
+
+    A new assignment replaces the fetcher, the old one flushes its readings
+    before the new one starts polling. A fetcher that finishes on its own
+    ends the worker, the supervisor restarts it.
+    """
+
+    while devices is not None:
+        fetcher = None
+        if devices:
+            fetcher = AsyncFleetFetcher(*connection, devices=devices, **options)
+
+        tasks: list[asyncio.Task] = [
+            asyncio.create_task(_report(worker, fetcher, status, interval))
+        ]
+        if fetcher is not None:
+            tasks.append(asyncio.create_task(fetcher.schedule_fetcher()))
+
+        command = _receive(commands)
+        done, _ = await asyncio.wait(
+            [command, *tasks], return_when=asyncio.FIRST_COMPLETED
+        )
+
+        for task in tasks:
+            task.cancel()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+
+        # a failed fetcher takes the process down, the supervisor restarts it
+        for task, result in zip(tasks, results):
+            if task in done and isinstance(result, BaseException):
+                raise result
+
+        if not command.done():
+            logger.warning("fetcher of worker %d finished, exiting", worker)
+            return
+
+        action, devices = command.result()
+        if action == "stop":
+            devices = None
+
+
+def _run_worker(worker, devices, connection, options, commands, status, interval):
+    """Entry point of the worker process."""
+    try:
+        asyncio.run(
+            _work(worker, devices, connection, options, commands, status, interval)
+        )
+    except KeyboardInterrupt:
+        pass
+
+
+class _Worker:
+    """
+    State of a single worker process, as seen by the supervisor.
+
+    Attributes:
+        slot (int): Index of the worker, devices are assigned to slots.
+        devices (list[Device]): Devices the worker polls.
+        process (multiprocessing.Process): The worker process.
+        commands (multiprocessing.Queue): Commands sent to the worker.
+        started (float): Time the process was last started.
+        restarts (int): Number of times the process was restarted.
+        report (dict): Latest counters sent by the worker.
+        rate (float): Readings per second between the two latest reports.
+    """
+
+    slot: int  # index of the worker
+    devices: list  # devices the worker polls
+    started: float  # time the process was last started
+    restarts: int  # number of times the process was restarted
+    report: dict | None  # latest counters sent by the worker
+    rate: float  # readings per second between the two latest reports
+
+    def __init__(self, slot, devices):
+        self.slot = slot
+        self.devices = devices
+        self.process = None
+        self.commands = None
+        self.started = 0.0
+        self.restarts = 0
+        self.report = None
+        self.rate = 0.0
+
+
+class FetcherSupervisor:
+    """
+    Split the devices among worker processes, each polling its share with an
+    AsyncFleetFetcher in its own event loop.
+
+    Devices are assigned to workers by rendezvous hashing of their names, so
+    changing the number of workers only moves the devices that have to move.
+    Crashed workers are restarted, the workers report their counters
+    periodically and the supervisor aggregates them.
+
+    Attributes:
+        _connection (tuple): Host, port, token, organization and bucket.
+        _devices (list[Device]): Devices to poll.
+        _options (dict): Options of the fetcher of every worker.
+        _context (multiprocessing.context.BaseContext): Context the worker
+            processes are started with.
+        _workers (list[_Worker]): Workers by slot.
+        _status (multiprocessing.Queue): Reports sent by the workers.
+        _check_interval (float): Seconds between checks of the workers.
+        _report_interval (float): Seconds between reports of a worker.
+        _restart_delay (float): Minimal seconds between restarts of a worker.
+    """
+
+    _devices: list  # devices to poll
+    _options: dict  # options of the fetcher of every worker
+    _context: Any  # context the worker processes are started with
+    _check_interval: float  # seconds between checks of the workers
+    _report_interval: float  # seconds between reports of a worker
+    _restart_delay: float  # minimal seconds between restarts of a worker
+
+    def __init__(
+        self,
+        host,
+        port,
+        token,
+        org,
+        bucket,
+        devices,
+        workers=None,
+        check_interval=1.0,
+        report_interval=5.0,
+        restart_delay=1.0,
+        start_method="spawn",
+        **kwargs,
+    ):
+        """
+        Initialize the supervisor.
+
+        Args:
+            host (str): Host of the InfluxDB instance.
+            port (int): Port of the InfluxDB instance.
+            token (str): Token to authenticate with InfluxDB.
+            org (str): Organization to use within InfluxDB.
+            bucket (str): Bucket within InfluxDB where the data will be stored.
+            devices (list[Device]): Devices to poll.
+            workers (int): Number of worker processes (number of cores by
+                default).
+            check_interval (float): Seconds between checks of the workers.
+            report_interval (float): Seconds between reports of a worker.
+            restart_delay (float): Minimal seconds between restarts of a worker.
+            start_method (str): Multiprocessing start method of the workers.
+            **kwargs: Options of the AsyncFleetFetcher of every worker.
+        """
+
+        devices = list(devices)
+        if not devices:
+            raise ValueError("supervisor requires at least one device")
+
+        names = [device.name for device in devices]
+        if len(set(names)) != len(names):
+            raise ValueError("device names within the fleet must be unique")
+
+        self._connection = (host, port, token, org, bucket)
+        self._devices = devices
+        self._options = kwargs
+        self._check_interval = check_interval
+        self._report_interval = report_interval
+        self._restart_delay = restart_delay
+
+        self._context = multiprocessing.get_context(start_method)
+        self._status = None
+        self._size = workers or os.cpu_count() or 1
+        self._workers = []
+        self._running = False
+
+    def _alive(self) -> int:
+        """Number of running worker processes."""
+        return sum(
+            1 for w in self._workers if w.process is not None and w.process.is_alive()
+        )
+
+    def _rate(self) -> float:
+        """Readings per second of every worker."""
+        return sum(worker.rate for worker in self._workers)
+
+    @staticmethod
+    def _score(slot, name) -> int:
+        """Rendezvous hashing weight of the device for the slot."""
+        digest = hashlib.blake2b(f"{slot}:{name}".encode(), digest_size=8).digest()
+        return int.from_bytes(digest, "big")
+
+    def _assign(self, size) -> list[list]:
+        """
+        Split the devices among the given number of workers.
+
+        Args:
+            size (int): Number of workers.
+
+        Returns:
+            list[list[Device]]: Devices of every worker, by slot.
+        """
+
+        shards = [[] for _ in range(size)]
+        for device in self._devices:
+            slot = max(range(size), key=lambda s: self._score(s, device.name))
+            shards[slot].append(device)
+        return shards
+
+    def _spawn(self, worker):
+        """Start the process of the worker."""
+        worker.commands = self._context.Queue()
+        worker.process = self._context.Process(
+            target=_run_worker,
+            args=(
+                worker.slot,
+                worker.devices,
+                self._connection,
+                self._options,
+                worker.commands,
+                self._status,
+                self._report_interval,
+            ),
+            name=f"reads-fetcher-{worker.slot}",
+            daemon=True,
+        )
+        worker.process.start()
+        worker.started = time.monotonic()
+        worker.report = None
+        worker.rate = 0.0
+        logger.info(
+            "started worker %d (pid %d) polling %d devices",
+            worker.slot,
+            worker.process.pid,
+            len(worker.devices),
+        )
+
+    async def _retire(self, worker, timeout=10.0):
+        """Stop the worker, letting it flush its readings first."""
+        process = worker.process
+        if process is None:
+            return
+
+        if process.is_alive():
+            worker.commands.put(("stop", None))
+            await asyncio.to_thread(process.join, timeout)
+            if process.is_alive():
+                logger.warning("worker %d did not stop, terminating it", worker.slot)
+                process.terminate()
+                await asyncio.to_thread(process.join)
+
+        worker.process = None
+        worker.commands.close()
+
+    async def _rebalance(self, size):
+        """
+        Assign the devices to the given number of workers, starting, stopping
+        and reassigning the workers as needed.
+
+        Args:
+            size (int): Number of workers.
+        """
+
+        # removed before they are stopped, so they are not restarted meanwhile
+        retired = self._workers[size:]
+        del self._workers[size:]
+        await asyncio.gather(*(self._retire(worker) for worker in retired))
+
+        for slot, devices in enumerate(self._assign(size)):
+            if slot == len(self._workers):
+                worker = _Worker(slot, devices)
+                self._workers.append(worker)
+                self._spawn(worker)
+                continue
+
+            worker = self._workers[slot]
+            if [d.name for d in worker.devices] != [d.name for d in devices]:
+                worker.devices = devices
+                worker.commands.put(("assign", devices))
+                logger.info("worker %d now polls %d devices", slot, len(devices))
+
+    def _collect(self):
+        """Update the workers with the reports received so far."""
+        assert self._status is not None, "reports collected while not running"
+        while True:
+            try:
+                report = self._status.get_nowait()
+            except queue.Empty:
+                return
+
+            if report["worker"] >= len(self._workers):
+                continue
+            worker = self._workers[report["worker"]]
+            if worker.process is None or report["pid"] != worker.process.pid:
+                continue
+
+            previous = worker.report
+            if previous is not None and report["time"] > previous["time"]:
+                worker.rate = (report["readings"] - previous["readings"]) / (
+                    report["time"] - previous["time"]
+                )
+            worker.report = report
+
+    def _check(self):
+        """Collect the reports and restart the workers that crashed."""
+        self._collect()
+
+        now = time.monotonic()
+        for worker in self._workers:
+            if worker.process.is_alive():
+                continue
+            if now - worker.started < self._restart_delay:
+                continue
+
+            logger.warning(
+                "worker %d exited with code %s, restarting",
+                worker.slot,
+                worker.process.exitcode,
+            )
+            worker.commands.close()
+            worker.restarts += 1
+            WORKER_RESTARTS.inc()
+            self._spawn(worker)
+
+    async def start(self):
+        """Start the worker processes."""
+        if self._running:
+            return
+
+        self._status = self._context.Queue()
+        self._running = True
+        WORKERS_ALIVE.add_callback(self._alive)
+        FLEET_RATE.add_callback(self._rate)
+        await self._rebalance(self._size)
+
+    async def stop(self):
+        """Stop the worker processes, letting them flush their readings."""
+        if not self._running:
+            return
+
+        self._running = False
+        WORKERS_ALIVE.remove_callback(self._alive)
+        FLEET_RATE.remove_callback(self._rate)
+
+        retired, self._workers = self._workers, []
+        await asyncio.gather(*(self._retire(worker) for worker in retired))
+        assert self._status is not None
+        self._status.close()
+        self._status = None
+
+    async def scale(self, workers):
+        """
+        Change the number of worker processes, moving devices among them.
+
+        Args:
+            workers (int): New number of workers.
+        """
+
+        if workers < 1:
+            raise ValueError("at least one worker is required")
+
+        self._size = workers
+        if self._running:
+            await self._rebalance(workers)
+
+    def stats(self) -> dict:
+        """
+        Return the health and throughput of every worker, and their totals.
+
+        A worker is 'alive' if it reported within three report intervals,
+        'stale' if it did not and 'dead' if its process is not running.
+        """
+
+        now = time.time()
+        workers = {}
+        for worker in self._workers:
+            report = worker.report or {}
+            if worker.process is None or not worker.process.is_alive():
+                health = "dead"
+            elif report and now - report["time"] <= 3 * self._report_interval:
+                health = "alive"
+            else:
+                health = "stale"
+
+            workers[worker.slot] = {
+                "health": health,
+                "pid": worker.process.pid if worker.process is not None else None,
+                "devices": len(worker.devices),
+                "restarts": worker.restarts,
+                "readings": report.get("readings", 0),
+                "written": report.get("written", 0),
+                "errors": report.get("errors", 0),
+                "queue_depth": report.get("queue_depth", 0),
+                "readings_per_second": worker.rate,
+            }
+
+        return {
+            "workers": workers,
+            "alive": sum(1 for w in workers.values() if w["health"] == "alive"),
+            "readings": sum(w["readings"] for w in workers.values()),
+            "written": sum(w["written"] for w in workers.values()),
+            "errors": sum(w["errors"] for w in workers.values()),
+            "readings_per_second": self._rate(),
+        }
+
+    async def serve(self):
+        """
+        Run the workers until cancelled.
+        """
+
+        await self.start()
+        try:
+            while True:
+                await asyncio.sleep(self._check_interval)
+                self._check()
+        finally:
+            await self.stop()
+
+    async def __aenter__(self) -> "FetcherSupervisor":
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        await self.stop()
@@ -0,0 +1,141 @@
+"""
+Module buffers records before they are written into InfluxDB, so that many
+readings can be sent as a single line protocol batch.
+
+Author: Piotr Krzysztof Lis - github.com/straightchlorine
+"""
+
+import asyncio
+import time
+
+
+class AsyncWriteBuffer:
+    """
+    Collect line protocol records and flush them as a single batch once either
+    the size or the age limit of the batch is reached, whichever comes first.
+
+    Attributes:
+        _flush_callback (coroutine function): Called with the list of records
+            to write, responsible for the actual write.
+        _batch_size (int): Number of records that triggers a flush.
+        _flush_interval (float): Maximum age of a batch in seconds.
+        _records (list[str]): Records waiting to be flushed.
+        _batch_started (float): Monotonic time the first record was added.
+        _generation (int): Number of batches flushed so far.
+    """
+
+    _batch_size: int  # number of records that triggers a flush
+    _flush_interval: float  # maximum age of a batch in seconds
+
+    _records: list[str]  # records waiting to be flushed
+    _batch_started: float  # monotonic time the current batch was started
+    _generation: int  # number of batches flushed so far
+
+    def __init__(self, flush_callback, batch_size=500, flush_interval=1000):
+        """
+        Initialize the buffer.
+
+        Args:
+            flush_callback (coroutine function): Writes the list of records.
+            batch_size (int): Number of records that triggers a flush.
+            flush_interval (int): Maximum age of a batch in milliseconds.
+        """
+
+        if batch_size < 1:
+            raise ValueError("batch_size must be at least 1")
+        if flush_interval <= 0:
+            raise ValueError("flush_interval must be positive")
+
+        self._flush_callback = flush_callback
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval / 1000
+
+        self._records = []
+        self._batch_started = 0.0
+        self._generation = 0
+
+        self._lock = asyncio.Lock()
+        self._pending = asyncio.Event()
+        self._timer = None
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    @property
+    def batch_size(self) -> int:
+        """Number of records that triggers a flush."""
+        return self._batch_size
+
+    def start(self):
+        """
+        Start the background task flushing batches that grew too old.
+        """
+
+        if self._timer is None:
+            self._timer = asyncio.create_task(self._flush_timer())
+
+    async def add(self, record: str):
+        """
+        Add a record to the current batch, flush if the batch is full.
+
+        Args:
+            record (str): Record in line protocol.
+        """
+
+        if not self._records:
+            self._batch_started = time.monotonic()
+            self._pending.set()
+
+        self._records.append(record)
+
+        if len(self._records) >= self._batch_size:
+            await self.flush()
+
+    async def flush(self):
+        """
+        Write every buffered record as a single batch.
+        """
+
+        async with self._lock:
+            if not self._records:
+                return
+
+            batch = self._records
+            self._records = []
+            self._generation += 1
+            self._pending.clear()
+
+            await self._flush_callback(batch)
+
+    async def _flush_timer(self):
+        """
+        Flush the current batch once it reaches the maximum age.
+        """
+
+        while True:
+            await self._pending.wait()
+
+            generation = self._generation
+            deadline = self._batch_started + self._flush_interval
+            await asyncio.sleep(max(0.0, deadline - time.monotonic()))
+
+            # the batch might have been flushed because it filled up
+            if generation == self._generation:
+                await self.flush()
+
+    async def close(self):
+        """
+        Stop the background task and flush whatever is left in the buffer.
+        """
+
+        if self._timer is not None:
+            # do not interrupt a batch that is currently being written
+            async with self._lock:
+                self._timer.cancel()
+            try:
+                await self._timer
+            except asyncio.CancelledError:
+                pass
+            self._timer = None
+
+        await self.flush()
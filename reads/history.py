@@ -0,0 +1,268 @@
+"""
+Local tier of historical readings, keeping completed days as Parquet files
+partitioned by day and device.
+
+Author: Piotr Krzysztof Lis - github.com/straightchlorine
+"""
+
+import datetime
+import os
+import threading
+from urllib.parse import quote, unquote
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - depends on the environment
+    pa = None
+    pq = None
+
+# name of the file marking a day as completely stored
+_COMPLETE = "_COMPLETE"
+
+# name of the file of readings without the device tag, quote() never leaves
+# a lone percent sign in the name of a device
+_UNTAGGED = "%"
+
+
+class HistoryStore:
+    """
+    Raw readings of completed days, stored as columnar Parquet files.
+
+    Every day is a directory holding a file per device, named after the
+    device percent-encoded (so no name leaves the directory), along with a
+    marker written once every device of the day is stored:
+        <directory>/2024-01-01/nodemcu.parquet
+        <directory>/2024-01-01/_COMPLETE
+
+    Readings without the device tag are kept in a file of their own, named
+    "%.parquet".
+
+    Days are UTC days, a day is closed once lateness seconds passed since its
+    end, only closed days are stored, as they will not change anymore. Files
+    are read memory-mapped, only the requested columns are read.
+
+    Readings might still be written late, e.g. once the fetcher replays its
+    spool. Days of such readings are invalidated and stored again, so is a
+    day with no readings at all, which is never marked complete.
+
+    Requires pyarrow.
+
+    Attributes:
+        directory (str): Directory the days are stored in.
+        lateness (float): Seconds after its end a day is considered closed.
+        reads (int): Days read from the disk.
+        writes (int): Days written to the disk.
+        _versions (dict[datetime.date, int]): Number of times every day was
+            invalidated.
+    """
+
+    directory: str  # directory the days are stored in
+    lateness: float  # seconds after its end a day is considered closed
+
+    reads: int  # days read from the disk
+    writes: int  # days written to the disk
+
+    def __init__(self, directory, lateness=3600.0):
+        """
+        Initialize the store.
+
+        Args:
+            directory (str): Directory the days are stored in, created if it
+                does not exist.
+            lateness (float): Seconds after its end a day is considered closed,
+                readings may arrive late (an hour by default).
+        """
+
+        if pq is None:
+            raise ImportError("HistoryStore requires pyarrow")
+
+        self.directory = str(directory)
+        self.lateness = lateness
+        os.makedirs(self.directory, exist_ok=True)
+
+        self.reads = 0
+        self.writes = 0
+
+        # days are written in worker threads, invalidated in the event loop
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def _path(self, day, name="") -> str:
+        return os.path.join(self.directory, day.isoformat(), name)
+
+    @staticmethod
+    def _file_name(device) -> str:
+        """Return the name of the file of the device (None - untagged)."""
+        if device is None or device != device:  # NaN of a missing tag
+            return f"{_UNTAGGED}.parquet"
+        return f"{quote(str(device), safe='')}.parquet"
+
+    @staticmethod
+    def _device(file_name) -> str | None:
+        """Return the device of the file, inverse of _file_name()."""
+        stem = file_name[: -len(".parquet")]
+        return None if stem == _UNTAGGED else unquote(stem)
+
+    def days(self, start, end) -> list[datetime.date]:
+        """
+        Return the days intersecting the range.
+
+        Args:
+            start (pd.Timestamp): Start of the range, in UTC.
+            end (pd.Timestamp): End of the range (exclusive), in UTC.
+        """
+
+        first = start.tz_convert("UTC").date()
+        last = (end.tz_convert("UTC") - pd.Timedelta(1, "ns")).date()
+        return [
+            first + datetime.timedelta(days=i) for i in range((last - first).days + 1)
+        ]
+
+    def day_start(self, day) -> pd.Timestamp:
+        """Return the start of the day as a timestamp in UTC."""
+        return pd.to_datetime(day, utc=True)
+
+    def closed(self, day, now) -> bool:
+        """
+        Whether the day is over, thus can be stored.
+
+        Args:
+            day (datetime.date): The day.
+            now (pd.Timestamp): The current time.
+        """
+
+        end = self.day_start(day) + pd.Timedelta(days=1)
+        return end + pd.Timedelta(seconds=self.lateness) <= now
+
+    def first_open(self, now) -> pd.Timestamp:
+        """Return the start of the earliest day which is not closed yet."""
+        day = (now - pd.Timedelta(seconds=self.lateness)).tz_convert("UTC").date()
+        return self.day_start(day)
+
+    def complete(self, day) -> bool:
+        """Whether every device of the day is stored."""
+        return os.path.exists(self._path(day, _COMPLETE))
+
+    def version(self, day) -> int:
+        """Return the number of times the day was invalidated."""
+        return self._versions.get(day, 0)
+
+    def invalidate(self, start, end):
+        """
+        Mark the days intersecting the range as incomplete, so that they are
+        stored again.
+
+        Args:
+            start (pd.Timestamp): Start of the range, in UTC.
+            end (pd.Timestamp): End of the range (exclusive), in UTC.
+        """
+
+        with self._lock:
+            for day in self.days(start, end):
+                self._versions[day] = self.version(day) + 1
+                try:
+                    os.remove(self._path(day, _COMPLETE))
+                except FileNotFoundError:
+                    pass
+
+    def write(self, day, frame, version=None) -> bool:
+        """
+        Store readings of the day, a file per device, and mark the day as
+        complete.
+
+        The day is not marked complete if there are no readings or if it was
+        invalidated since the readings were queried, they might be missing
+        readings written late.
+
+        Args:
+            day (datetime.date): The day.
+            frame (pd.DataFrame): Readings of the day, with the device column
+                and the time column in UTC. Devices with no readings have no
+                file.
+            version (int): Version of the day the readings were queried at
+                (the current one by default).
+
+        Returns:
+            bool: Whether the day was marked complete.
+        """
+
+        assert pa is not None and pq is not None
+        if frame.empty:
+            return False
+        os.makedirs(self._path(day), exist_ok=True)
+
+        # readings without the device tag are stored as well, otherwise the
+        # day would be marked complete without them
+        for device, readings in frame.groupby("device", sort=False, dropna=False):
+            table = pa.Table.from_pandas(
+                readings.drop(columns="device").sort_values("time"),
+                preserve_index=False,
+            )
+
+            # written under a temporary name, so a file is either complete or
+            # missing
+            path = self._path(day, self._file_name(device))
+            pq.write_table(table, path + ".tmp")
+            os.replace(path + ".tmp", path)
+
+        with self._lock:
+            if version is not None and version != self.version(day):
+                return False
+            with open(self._path(day, _COMPLETE), "w"):
+                pass
+        self.writes += 1
+        return True
+
+    def read(self, day, columns=None, devices=None) -> pd.DataFrame:
+        """
+        Read readings of the day.
+
+        Args:
+            day (datetime.date): The day.
+            columns (list[str]): Parameters to read (every one by default).
+            devices (list[str]): Devices to read (every one by default).
+
+        Returns:
+            pd.DataFrame: Readings with the device column and the time column
+                in UTC, ordered by device and time.
+        """
+
+        assert pq is not None
+        names = []
+        if os.path.isdir(self._path(day)):  # days with no readings have none
+            names = sorted(
+                name
+                for name in os.listdir(self._path(day))
+                if name.endswith(".parquet")
+            )
+        if devices is not None:
+            names = [name for name in names if self._device(name) in devices]
+
+        frames = []
+        for name in names:
+            path = self._path(day, name)
+            if columns is not None:
+                stored = pq.read_schema(path).names
+                projection = [c for c in columns if c in stored] + ["time"]
+            else:
+                projection = None
+
+            frame = pq.read_table(path, columns=projection, memory_map=True)
+            frame = frame.to_pandas()
+            frame["device"] = self._device(name)
+            frames.append(frame)
+
+        self.reads += 1
+        if not frames:
+            return pd.DataFrame(columns=pd.Index(["device", "time"]))
+        return pd.concat(frames, ignore_index=True)
+
+    def stats(self) -> dict:
+        """
+        Return the number of days read and written.
+        """
+
+        return {"reads": self.reads, "writes": self.writes}
@@ -5,10 +5,20 @@ Author: Piotr Krzysztof Lis - github.com/straightchlorine
 """
 
 import asyncio
+import logging
 
 import pandas as pd
 from reads.fetch.async_fetch import AsyncReadFetcher
+from reads.fetch.async_fleet import AsyncFleetFetcher
+from reads.fetch.device import Device
+from reads.fetch.supervisor import FetcherSupervisor
+from reads.push.async_push import AsyncPushServer
+from reads.metrics import MetricsServer
 from reads.query.async_query import AsyncQuery
+from reads.query.latest import LatestCache
+from reads.query.recent import RecentReadings
+
+logger = logging.getLogger(__name__)
 
 
 class DatabaseInterface:
@@ -18,15 +28,32 @@ class DatabaseInterface:
     _influxdb_organization: str  # organization to use within influxdb
     _influxdb_bucket: str  # bucket to save the data into
 
-    _dev_ip: str  # ip of the device sending the data
-    _dev_port: int  # port of the device sending the data
+    _dev_ip: str | None  # ip of the device sending the data
+    _dev_port: int | None  # port of the device sending the data
     _dev_handle: str  # handle to access the data
 
     _dev_url: str  # address of the device in the network
     _db_url: str  # address of the influxdb instance
 
     def __init__(
-        self, host, port, token, org, bucket, sensors, dev_ip, dev_port, handle=""
+        self,
+        host,
+        port,
+        token,
+        org,
+        bucket,
+        sensors,
+        dev_ip=None,
+        dev_port=None,
+        handle="",
+        devices=None,
+        rollup_buckets=None,
+        enable_gzip=False,
+        raw_csv=False,
+        query_cache=None,
+        history=None,
+        latest_max_age=5.0,
+        recent_capacity=None,
     ):
         """
         Initialize the fetcher with the required information.
@@ -41,6 +68,23 @@ class DatabaseInterface:
             dev_port (str): The port of the device providing the readings.
             handle (str): The http handle to access the data ("" by default).
             sensors (dict): The sensors and their parameters to read.
+            devices (list[Device]): Fleet of devices to poll instead of the
+                single device given by dev_ip, dev_port and handle.
+            rollup_buckets (dict[int, str]): Buckets the fetcher writes
+                aggregates into and historical queries are routed to, by window
+                length in seconds.
+            enable_gzip (bool): Request gzip compressed query responses.
+            raw_csv (bool): Decode query responses in bulk from csv.
+            query_cache (QueryCache): Cache of historical query results.
+            history (HistoryStore): Local tier closed days of historical data
+                are read from.
+            latest_max_age (float): Seconds for which a reading published by
+                the fetcher answers query_latest (None always queries InfluxDB).
+            recent_capacity (int): Number of readings per device published by
+                the fetcher kept in memory, historical queries of ranges they
+                cover are answered from them (disabled by default). Enable
+                only if the fetcher of this interface, started by
+                start_fetching, is the only writer of the bucket.
         """
 
         self._influxdb_host = host
@@ -57,71 +101,320 @@ class DatabaseInterface:
         self._db_url = f"http://{self._influxdb_host}:{self._influxdb_port}"
 
         self.sensors = sensors
+        self._rollup_buckets = rollup_buckets
+
+        if devices:
+            self._fetcher = AsyncFleetFetcher(
+                self._influxdb_host,
+                self._influxdb_port,
+                self._influxdb_token,
+                self._influxdb_organization,
+                self._influxdb_bucket,
+                devices,
+                rollup_buckets=rollup_buckets,
+            )
+        else:
+            self._fetcher = AsyncReadFetcher(
+                self._influxdb_host,
+                self._influxdb_port,
+                self._influxdb_token,
+                self._influxdb_organization,
+                self._influxdb_bucket,
+                self.sensors,
+                self._dev_ip,
+                self._dev_port,
+                self._dev_handle,
+                rollup_buckets=rollup_buckets,
+            )
+
+        # the latest readings of every device are kept in ring buffers
+        self._recent = None
+        if recent_capacity is not None:
+            interval = max(self._fetcher.interval(d) for d in self.devices)
+            self._recent = RecentReadings(recent_capacity, interval)
+            self._fetcher.add_reading_callback(self._recent.update)
 
-        self._fetcher = AsyncReadFetcher(
+        self.query_interface = AsyncQuery(
             self._influxdb_host,
             self._influxdb_port,
             self._influxdb_token,
             self._influxdb_organization,
             self._influxdb_bucket,
             self.sensors,
-            self._dev_ip,
-            self._dev_port,
-            self._dev_handle,
+            rollup_buckets=rollup_buckets,
+            enable_gzip=enable_gzip,
+            raw_csv=raw_csv,
+            cache=query_cache,
+            history=history,
+            recent=self._recent,
         )
 
-        self.query_interface = AsyncQuery(
+        # readings published by the fetcher answer queries of the latest one
+        self._latest = None
+        if latest_max_age is not None:
+            self._latest = LatestCache(latest_max_age)
+            self._fetcher.add_reading_callback(self._latest.update)
+
+        # days stored before the spool of the fetcher was replayed miss the
+        # replayed readings
+        self._history = history
+        if history is not None:
+            self._fetcher.add_replay_callback(self._replayed)
+
+        self._metrics = None
+        self._fetching = None
+
+    def _replayed(self, first, last):
+        """Invalidate the stored days of the readings replayed by the fetcher."""
+        assert self._history is not None
+        self._history.invalidate(
+            pd.to_datetime(first, unit="ns", utc=True),
+            pd.to_datetime(last + 1, unit="ns", utc=True),
+        )
+
+    @property
+    def devices(self) -> list[Device]:
+        """Devices the readings are fetched from."""
+        return self._fetcher.devices
+
+    def enable_metrics(self, port=9100, host="127.0.0.1"):
+        """
+        Expose metrics of fetching, writing and querying in the Prometheus
+        text format on http://<host>:<port>/metrics.
+
+        The endpoint is served alongside the fetching or the push server, thus
+        should be invoked before enable_fetching or enable_push.
+
+        Args:
+            port (int): Port of the metrics endpoint.
+            host (str): Address the endpoint listens on (local only by default).
+        """
+
+        self._metrics = MetricsServer(host=host, port=port)
+
+    async def _serve(self, coroutine):
+        """
+        Run the coroutine, serving the metrics meanwhile if they are enabled.
+
+        Args:
+            coroutine (coroutine): The fetching or the push server.
+        """
+
+        if self._metrics is None:
+            return await coroutine
+
+        await self._metrics.start()
+        try:
+            return await coroutine
+        finally:
+            await self._metrics.stop()
+
+    def enable_fetching(self):
+        """
+        Enable fetching from the device specified by dev_ip, dev_port and handle,
+        or from every device of the fleet.
+
+        Starts the fetching task in the background, thus should be invoked last
+        in order to avoid blocking the main thread. Queries made in another
+        process do not see the readings of this fetcher, in order to answer
+        them from memory use start_fetching instead.
+        """
+
+        asyncio.run(self._serve(self._fetcher.schedule_fetcher()))
+
+    async def start_fetching(self) -> asyncio.Task:
+        """
+        Start fetching within the running event loop, alongside the queries.
+
+        Readings of the fetcher are published to the caches of this interface,
+        thus query_latest and query_historical of recent ranges are answered
+        from memory. Fetching stops once the task is cancelled or the
+        interface is closed.
+
+        Returns:
+            asyncio.Task: The fetching task.
+
+        Raises:
+            RuntimeError: If fetching was already started.
+        """
+
+        if self._fetching is not None and not self._fetching.done():
+            raise RuntimeError("fetching was already started")
+
+        self._fetching = asyncio.create_task(
+            self._serve(self._fetcher.schedule_fetcher())
+        )
+        return self._fetching
+
+    def enable_sharded_fetching(self, workers=None):
+        """
+        Enable fetching from every device, split among several processes.
+
+        Each process polls its share of the devices within its own event loop,
+        crashed processes are restarted. Blocks in the same manner as
+        enable_fetching, thus should be invoked last.
+
+        Args:
+            workers (int): Number of processes (number of cores by default).
+        """
+
+        supervisor = FetcherSupervisor(
             self._influxdb_host,
             self._influxdb_port,
             self._influxdb_token,
             self._influxdb_organization,
             self._influxdb_bucket,
-            self.sensors,
+            self.devices,
+            workers=workers,
+            rollup_buckets=self._rollup_buckets,
         )
+        asyncio.run(self._serve(supervisor.serve()))
 
-    def enable_fetching(self):
+    def enable_push(self, http_port=8080, udp_port=None, host="0.0.0.0", token=None):
         """
-        Enable fetching from the device specified by dev_ip, dev_port and handle.
+        Enable receiving readings pushed by the devices, as an alternative to
+        polling them. Only devices with a token are allowed to push.
 
-        Starts the fetching task in the background, thus should be invoked last
-        in order to avoid blocking the main thread.
+        Blocks in the same manner as enable_fetching, thus should be invoked
+        last.
+
+        Args:
+            http_port (int): Port of the http endpoint (None disables it).
+            udp_port (int): Port of the udp endpoint (None disables it).
+            host (str): Address the endpoints listen on.
+            token (str): Token the device given by dev_ip, dev_port and handle
+                authenticates with, devices of a fleet carry their own.
+
+        Raises:
+            ValueError: If no device has a token, every push would be rejected.
         """
 
-        asyncio.run(self._fetcher.schedule_fetcher())
+        if token is not None:
+            if len(self.devices) > 1:
+                raise ValueError("devices of the fleet carry their own tokens")
+            self.devices[0].token = token
 
-    async def query_latest(self) -> pd.DataFrame:
+        if not any(device.token for device in self.devices):
+            raise ValueError("push requires a token of at least one device")
+
+        server = AsyncPushServer(
+            self._fetcher, host=host, http_port=http_port, udp_port=udp_port
+        )
+        asyncio.run(self._serve(server.serve()))
+
+    async def query_latest(
+        self, sensors=None, params=None, device=None
+    ) -> pd.DataFrame:
         """
-        Query the latest measurement from the InfluxDB.
+        Query the latest measurement.
+
+        Answered from readings published by the fetcher, if the reading of
+        every queried device is not older than latest_max_age, otherwise from
+        the InfluxDB.
+
+        Args:
+            sensors (str | list[str]): Sensors to query (every one by default).
+            params (str | list[str]): Parameters to query (every one of the
+                queried sensors by default).
+            device (str | list[str]): Devices to query (every one by default).
 
         Returns:
             pd.DataFrame: The latest measurement.
         """
 
-        print("<.> querying latest measurement...")
-        query_task = asyncio.create_task(self.query_interface.latest())
+        if self._latest is not None:
+            selection = self.query_interface._selection(sensors, params, device)
+            fields, devices = selection if selection is not None else (None, None)
+            frame = self._latest.frame(fields=fields, devices=devices)
+            if frame is not None:
+                return frame
+
+        logger.debug("querying latest measurement")
+        query_task = asyncio.create_task(
+            self.query_interface.latest(sensors, params, device)
+        )
         await query_task
         result = query_task.result()
         return result
 
-    async def query_historical(self, start: str, end: str) -> pd.DataFrame:
+    async def query_historical(
+        self,
+        start: str,
+        end: str,
+        resolution: float | None = None,
+        window: str | float | None = None,
+        fn: str = "mean",
+        points: int | None = None,
+        sensors: str | list[str] | None = None,
+        params: str | list[str] | None = None,
+        device: str | list[str] | None = None,
+    ) -> pd.DataFrame:
         """
         Query historical data from the database.
 
+        Recent ranges, covered by the readings the fetcher published since it
+        started, are answered from the memory instead.
+
         Args:
             start (str): Start time of the query (e.g., '2024-01-01T00:00:00Z').
             end (str): End time of the query (e.g., '2024-01-02T00:00:00Z').
+            resolution (float): Requested resolution in seconds, selects the
+                rollup bucket to query (derived from the range by default).
+            window (str | float): Aggregation window computed by the database,
+                flux duration (e.g. '5m') or seconds.
+            fn (str): Aggregate of every window ('mean', 'min', 'max', 'last').
+            points (int): Number of points per parameter to aggregate the range
+                into, used if no window is given.
+            sensors (str | list[str]): Sensors to query (every one by default).
+            params (str | list[str]): Parameters to query (every one of the
+                queried sensors by default).
+            device (str | list[str]): Devices to query (every one by default).
 
         Returns:
             pd.DataFrame: Historical data within the specified time range.
         """
-        print("<.> querying historical data...")
+        logger.debug("querying historical data")
         query_task = asyncio.create_task(
-            self.query_interface.historical_data(start, end)
+            self.query_interface.historical_data(
+                start, end, resolution, window, fn, points, sensors, params, device
+            )
         )
         await query_task
         result = query_task.result()
         return result
 
+    async def stream_historical(
+        self,
+        start: str,
+        end: str,
+        resolution: float | None = None,
+        window: str | float | None = None,
+        fn: str = "mean",
+        points: int | None = None,
+        chunk_size: int = 10000,
+    ):
+        """
+        Stream historical data from the database in DataFrame chunks, meant
+        for exports too large to be held in memory at once.
+
+        Args:
+            start (str): Start time of the query (e.g., '2024-01-01T00:00:00Z').
+            end (str): End time of the query (e.g., '2024-01-02T00:00:00Z').
+            resolution (float): Requested resolution in seconds.
+            window (str | float): Aggregation window, flux duration or seconds.
+            fn (str): Aggregate of every window ('mean', 'min', 'max', 'last').
+            points (int): Number of points per parameter to aggregate into.
+            chunk_size (int): Maximum number of rows of a chunk.
+
+        Yields:
+            pd.DataFrame: Consecutive chunks of the historical data.
+        """
+        logger.debug("streaming historical data")
+        async for chunk in self.query_interface.historical_stream(
+            start, end, resolution, window, fn, points, chunk_size
+        ):
+            yield chunk
+
     async def query(self, query: str) -> pd.DataFrame:
         """
         Perform a custom query on the database.
@@ -132,8 +425,24 @@ class DatabaseInterface:
         Returns:
             pd.DataFrame: The result of the custom query.
         """
-        print("<.> custom query...")
+        logger.debug("custom query")
         query_task = asyncio.create_task(self.query_interface.query(query))
         await query_task
         result = query_task.result()
         return result
+
+    async def close(self):
+        """
+        Stop fetching started by start_fetching and close the pooled
+        connections of the query interface.
+        """
+
+        fetching, self._fetching = self._fetching, None
+        if fetching is not None:
+            fetching.cancel()
+            try:
+                await fetching
+            except asyncio.CancelledError:
+                pass
+
+        await self.query_interface.stop()
@@ -0,0 +1,375 @@
+"""
+Metrics of the fetching, writing and querying, exposed in the Prometheus text
+format on a small local http endpoint.
+
+Author: Piotr Krzysztof Lis - github.com/straightchlorine
+"""
+
+import bisect
+import math
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from aiohttp import web
+
+# upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+
+def _format_value(value) -> str:
+    """Format the value the way Prometheus expects it."""
+    if value == math.inf:
+        return "+Inf"
+    if value == -math.inf:
+        return "-Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+# characters escaped within label values
+_ESCAPE_LABEL = str.maketrans({"\\": r"\\", '"': r"\"", "\n": r"\n"})
+
+
+def _format_labels(names, values, extra="") -> str:
+    """Format the label set, e.g. '{stage="write"}'."""
+    pairs = [
+        f'{name}="{str(value).translate(_ESCAPE_LABEL)}"'
+        for name, value in zip(names, values)
+    ]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """
+    Monotonically increasing value, e.g. number of written readings.
+
+    Attributes:
+        name (str): Name of the metric.
+        help (str): Description of the metric.
+        labels (tuple[str]): Names of the labels.
+        _values (dict[tuple, float]): Value per label values.
+    """
+
+    type = "counter"
+
+    name: str  # name of the metric
+    help: str  # description of the metric
+    labels: tuple[str, ...]  # names of the labels
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+
+    def inc(self, *values, amount=1):
+        """
+        Increase the counter.
+
+        Args:
+            values (str): Values of the labels, in the order of the names.
+            amount (float): Increment, must not be negative.
+        """
+
+        self._values[values] = self._values.get(values, 0) + amount
+
+    def value(self, *values) -> float:
+        """Return the value of the counter for the label values."""
+        return self._values.get(values, 0)
+
+    def total(self) -> float:
+        """Return the sum of the counter over every label values."""
+        return sum(self._values.values())
+
+    def samples(self):
+        """Yield the lines of the metric."""
+        for values, value in self._values.items():
+            labels = _format_labels(self.labels, values)
+            yield f"{self.name}{labels} {_format_value(value)}"
+
+
+class Gauge:
+    """
+    Value that can go up and down, e.g. depth of a queue.
+
+    The value is either set explicitly or read from callbacks when the metrics
+    are collected, in which case the values of every callback are summed.
+
+    Attributes:
+        name (str): Name of the metric.
+        help (str): Description of the metric.
+        _value (float): Value set explicitly.
+        _callbacks (list[callable]): Functions returning the value.
+    """
+
+    type = "gauge"
+
+    name: str  # name of the metric
+    help: str  # description of the metric
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self._value = 0
+        self._callbacks = []
+
+    def set(self, value):
+        """Set the value of the gauge."""
+        self._value = value
+
+    def add_callback(self, callback):
+        """Read the value from the callback on every collection."""
+        self._callbacks.append(callback)
+
+    def remove_callback(self, callback):
+        """Stop reading the value from the callback."""
+        if callback in self._callbacks:
+            self._callbacks.remove(callback)
+
+    def value(self) -> float:
+        """Return the value of the gauge."""
+        if self._callbacks:
+            return sum(callback() for callback in self._callbacks)
+        return self._value
+
+    def samples(self):
+        """Yield the lines of the metric."""
+        yield f"{self.name} {_format_value(self.value())}"
+
+
+class Histogram:
+    """
+    Distribution of observed values, e.g. latency of a database write.
+
+    Attributes:
+        name (str): Name of the metric.
+        help (str): Description of the metric.
+        labels (tuple[str]): Names of the labels.
+        buckets (tuple[float]): Upper bounds of the buckets.
+        _series (dict[tuple, list]): Bucket counts, sum and count per label
+            values.
+    """
+
+    type = "histogram"
+
+    name: str  # name of the metric
+    help: str  # description of the metric
+    labels: tuple[str, ...]  # names of the labels
+    buckets: tuple[float, ...]  # upper bounds of the buckets
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+
+    def observe(self, value, *values):
+        """
+        Record the value.
+
+        Args:
+            value (float): The observed value.
+            values (str): Values of the labels, in the order of the names.
+        """
+
+        series = self._series.get(values)
+        if series is None:
+            series = self._series[values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    @contextmanager
+    def time(self, *values):
+        """Observe the time spent within the block, in seconds."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *values)
+
+    def count(self, *values) -> int:
+        """Return the number of observations for the label values."""
+        series = self._series.get(values)
+        return series[2] if series is not None else 0
+
+    def samples(self):
+        """Yield the lines of the metric."""
+        for values, (counts, total, count) in self._series.items():
+            cumulative = 0
+            for bound, bucket in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket
+                le = f'le="{_format_value(float(bound))}"'
+                labels = _format_labels(self.labels, values, le)
+                yield f"{self.name}_bucket{labels} {cumulative}"
+
+            labels = _format_labels(self.labels, values)
+            yield f"{self.name}_sum{labels} {_format_value(total)}"
+            yield f"{self.name}_count{labels} {count}"
+
+
+class Rate:
+    """
+    Per-second rate of a counter over a sliding window, used as a gauge
+    callback.
+
+    Attributes:
+        counter (Counter): The counter whose rate is computed.
+        window (float): Length of the window in seconds.
+        _samples (deque[tuple[float, float]]): Time and value of the counter.
+    """
+
+    window: float  # length of the window in seconds
+
+    def __init__(self, counter, window=10.0):
+        self.counter = counter
+        self.window = window
+        self._samples = deque([(time.monotonic(), self.counter.total())])
+
+    def __call__(self) -> float:
+        now = time.monotonic()
+        self._samples.append((now, self.counter.total()))
+
+        # keep a single sample older than the window as the reference
+        while len(self._samples) > 2 and self._samples[1][0] <= now - self.window:
+            self._samples.popleft()
+
+        (start, first), (end, last) = self._samples[0], self._samples[-1]
+        if end <= start:
+            return 0.0
+        return (last - first) / (end - start)
+
+
+class MetricsRegistry:
+    """
+    Collection of metrics rendered together.
+
+    Attributes:
+        _metrics (dict[str, object]): Metrics by name.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+
+    def _register(self, metric):
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            if type(existing) is not type(metric):
+                raise ValueError(f"metric {metric.name!r} is already registered")
+            return existing
+
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help, labels=()) -> Counter:
+        """Create the counter, or return the one registered under the name."""
+        return self._register(Counter(name, help, labels))
+
+    def gauge(self, name, help) -> Gauge:
+        """Create the gauge, or return the one registered under the name."""
+        return self._register(Gauge(name, help))
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS) -> Histogram:
+        """Create the histogram, or return the one registered under the name."""
+        return self._register(Histogram(name, help, labels, buckets))
+
+    def get(self, name):
+        """Return the metric registered under the name, None if there is none."""
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        """
+        Render every metric in the Prometheus text exposition format.
+        """
+
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+# registry shared by the fetcher, the query interface and the endpoint
+REGISTRY = MetricsRegistry()
+
+
+class MetricsServer:
+    """
+    Http endpoint serving the metrics to Prometheus.
+
+    Attributes:
+        _registry (MetricsRegistry): Metrics served by the endpoint.
+        _host (str): Address the server listens on.
+        _port (int): Port the server listens on.
+        _path (str): Path of the endpoint.
+    """
+
+    _host: str  # address the server listens on
+    _port: int  # port the server listens on
+    _path: str  # path of the endpoint
+
+    def __init__(self, registry=None, host="127.0.0.1", port=9100, path="/metrics"):
+        """
+        Initialize the server.
+
+        Args:
+            registry (MetricsRegistry): Metrics to serve (REGISTRY by default).
+            host (str): Address the server listens on (local only by default).
+            port (int): Port the server listens on.
+            path (str): Path of the endpoint.
+        """
+
+        self._registry = registry if registry is not None else REGISTRY
+        self._host = host
+        self._port = port
+        self._path = path
+        self._runner = None
+
+    async def _handle(self, request):
+        return web.Response(text=self._registry.render(), content_type="text/plain")
+
+    async def start(self):
+        """Start serving the metrics."""
+        if self._runner is not None:
+            return
+
+        app = web.Application()
+        app.router.add_get(self._path, self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self._host, self._port).start()
+
+    async def stop(self):
+        """Stop serving the metrics."""
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def __aenter__(self) -> "MetricsServer":
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        await self.stop()
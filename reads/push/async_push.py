@@ -0,0 +1,267 @@
+"""
+Module receives readings pushed by the devices, either via http POST or as UDP
+datagrams, and writes them into InfluxDB through the fetcher's write path.
+
+Author: Piotr Krzysztof Lis - github.com/straightchlorine
+"""
+
+import asyncio
+import hmac
+import logging
+import time
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+
+class _DatagramProtocol(asyncio.DatagramProtocol):
+    """Passes received datagrams to the push server."""
+
+    def __init__(self, server):
+        self._server = server
+
+    def datagram_received(self, data, addr):
+        self._server._receive_datagram(data, addr)
+
+
+class AsyncPushServer:
+    """
+    Ingestion endpoint for devices that push their readings on their own.
+
+    Accepts the same JSON payload the devices serve on their http handle:
+        - http: POST /<path>/<device name> with 'Authorization: Token <token>'
+        - udp: datagram starting with '<device name> <token>' line, followed by
+          the payload
+
+    Accepted payloads are put into a bounded queue and consumed by workers,
+    which decode and store them via AsyncReadFetcher.ingest(). When the queue
+    is full, http requests are answered with 503 and datagrams are dropped.
+
+    Attributes:
+        _fetcher (AsyncReadFetcher): Fetcher whose write path is used.
+        _devices (dict[str, Device]): Devices allowed to push, by name.
+        _host (str): Address the server listens on.
+        _http_port (int): Port of the http endpoint (None disables it).
+        _udp_port (int): Port of the udp endpoint (None disables it).
+        _path (str): Path of the http endpoint.
+        _queue (asyncio.Queue): Received payloads waiting to be stored.
+        _workers (int): Number of tasks consuming the queue.
+        stats (dict[str, int]): Accepted, rejected, dropped and failed payloads.
+    """
+
+    _host: str  # address the server listens on
+    _http_port: int | None  # port of the http endpoint
+    _udp_port: int | None  # port of the udp endpoint
+    _path: str  # path of the http endpoint
+    _workers: int  # number of tasks consuming the queue
+
+    stats: dict[str, int]  # accepted, rejected, dropped and failed payloads
+
+    def __init__(
+        self,
+        fetcher,
+        devices=None,
+        host="0.0.0.0",
+        http_port=8080,
+        udp_port=None,
+        path="/ingest",
+        queue_size=10000,
+        workers=1,
+    ):
+        """
+        Initialize the server.
+
+        Args:
+            fetcher (AsyncReadFetcher): Fetcher whose write path is used.
+            devices (list[Device]): Devices allowed to push (devices of the
+                fetcher by default), only devices with a token are accepted.
+            host (str): Address the server listens on.
+            http_port (int): Port of the http endpoint (None disables it).
+            udp_port (int): Port of the udp endpoint (None disables it).
+            path (str): Path of the http endpoint.
+            queue_size (int): Number of payloads that can wait to be stored.
+            workers (int): Number of tasks consuming the queue.
+        """
+
+        if devices is None:
+            devices = fetcher.devices
+
+        self._fetcher = fetcher
+        self._devices = {device.name: device for device in devices if device.token}
+        self._host = host
+        self._http_port = http_port
+        self._udp_port = udp_port
+        self._path = path.rstrip("/")
+        self._queue = asyncio.Queue(maxsize=queue_size)
+        self._workers = workers
+
+        self.stats = {"accepted": 0, "rejected": 0, "dropped": 0, "failed": 0}
+
+        self._runner = None
+        self._transport = None
+        self._tasks = []
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of payloads waiting to be stored."""
+        return self._queue.qsize()
+
+    def _authenticate(self, name, token):
+        """
+        Return the device if the token matches, None otherwise.
+
+        Args:
+            name (str): Name of the device.
+            token (str): Token sent by the device.
+        """
+
+        device = self._devices.get(name)
+        if device is None or token is None:
+            return None
+        if not hmac.compare_digest(device.token.encode(), token.encode()):
+            return None
+        return device
+
+    def _enqueue(self, payload, device) -> bool:
+        """
+        Put the payload into the queue, False if the queue is full.
+
+        Args:
+            payload (bytes): The raw JSON payload.
+            device (Device): The device that sent the payload.
+        """
+
+        try:
+            self._queue.put_nowait((payload, device, time.time_ns()))
+        except asyncio.QueueFull:
+            self.stats["dropped"] += 1
+            return False
+
+        self.stats["accepted"] += 1
+        return True
+
+    async def _handle_post(self, request):
+        """
+        Handle readings pushed via http POST.
+
+        Args:
+            request (web.Request): The received request.
+        """
+
+        scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+        device = self._authenticate(
+            request.match_info["device"], token if scheme == "Token" else None
+        )
+        if device is None:
+            self.stats["rejected"] += 1
+            raise web.HTTPUnauthorized()
+
+        payload = await request.read()
+        if not self._enqueue(payload, device):
+            raise web.HTTPServiceUnavailable(headers={"Retry-After": "1"})
+
+        return web.Response(status=202)
+
+    def _receive_datagram(self, data, addr):
+        """
+        Handle readings pushed as a udp datagram.
+
+        Args:
+            data (bytes): The received datagram.
+            addr (tuple): Address of the sender.
+        """
+
+        header, _, payload = data.partition(b"\n")
+        name, _, token = header.decode(errors="replace").strip().partition(" ")
+
+        device = self._authenticate(name, token)
+        if device is None:
+            self.stats["rejected"] += 1
+            logger.warning("rejected datagram from %s", addr)
+            return
+
+        self._enqueue(payload, device)
+
+    async def _consume(self):
+        """
+        Store the received payloads, until cancelled. Payloads that fail to
+        be stored are logged and counted.
+        """
+
+        while True:
+            payload, device, timestamp = await self._queue.get()
+            try:
+                await self._fetcher.ingest(payload, device, timestamp)
+            except Exception as e:
+                # a single payload must not stop the worker, stop() waits for
+                # the queue to be consumed
+                self.stats["failed"] += 1
+                logger.error("failed to store payload of %s: %r", device.name, e)
+            finally:
+                self._queue.task_done()
+
+    async def start(self):
+        """
+        Start the fetcher's write path, the workers and the endpoints.
+        """
+
+        await self._fetcher.start()
+
+        self._tasks = [
+            asyncio.create_task(self._consume()) for _ in range(self._workers)
+        ]
+
+        if self._http_port is not None:
+            app = web.Application()
+            app.router.add_post(f"{self._path}/{{device}}", self._handle_post)
+            self._runner = web.AppRunner(app)
+            await self._runner.setup()
+            site = web.TCPSite(self._runner, self._host, self._http_port)
+            await site.start()
+
+        if self._udp_port is not None:
+            loop = asyncio.get_running_loop()
+            self._transport, _ = await loop.create_datagram_endpoint(
+                lambda: _DatagramProtocol(self),
+                local_addr=(self._host, self._udp_port),
+            )
+
+    async def stop(self):
+        """
+        Stop receiving, store the payloads still queued and stop the fetcher.
+        """
+
+        if self._transport is not None:
+            self._transport.close()
+            self._transport = None
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+        if self._tasks:
+            await self._queue.join()
+            for task in self._tasks:
+                task.cancel()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+            self._tasks = []
+
+        await self._fetcher.stop()
+
+    async def __aenter__(self) -> "AsyncPushServer":
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        await self.stop()
+
+    async def serve(self):
+        """
+        Run the server until cancelled.
+        """
+
+        await self.start()
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await self.stop()
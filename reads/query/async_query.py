@@ -4,12 +4,138 @@ Interface for passing queries to the database.
 Author: Piotr Krzysztof Lis - github.com/straightchlorine
 """
 
-from datetime import datetime, timedelta
+import asyncio
+import functools
+import io
+import logging
+import math
+import re
 
+from influxdb_client import Dialect
 from influxdb_client.client.exceptions import InfluxDBError
 from influxdb_client.client.influxdb_client_async import InfluxDBClientAsync
 
+import aiohttp
+import numpy as np
 import pandas as pd
+from dateutil.tz import tzlocal
+
+from reads.history import HistoryStore
+from reads.metrics import REGISTRY
+from reads.query.cache import QueryCache
+from reads.query.recent import RecentReadings
+
+logger = logging.getLogger(__name__)
+
+QUERY_SECONDS = REGISTRY.histogram(
+    "reads_query_seconds", "Time spent querying InfluxDB.", ("method",)
+)
+ERRORS = REGISTRY.counter(
+    "reads_errors_total", "Errors by the stage they occurred in.", ("stage",)
+)
+COALESCED = REGISTRY.counter(
+    "reads_query_coalesced_total",
+    "Queries answered by an identical query already in flight.",
+    ("method",),
+)
+
+# units of flux duration literals, in seconds
+_DURATION_UNITS = {
+    "ns": 1e-9,
+    "us": 1e-6,
+    "ms": 1e-3,
+    "s": 1,
+    "m": 60,
+    "h": 3600,
+    "d": 86400,
+    "w": 604800,
+    "mo": 2629746,
+    "y": 31556952,
+}
+_DURATION = re.compile(r"(\d+)(ns|us|ms|mo|s|m|h|d|w|y)")
+
+# aggregates historical queries can be downsampled with
+AGGREGATES = ("mean", "min", "max", "last")
+
+# csv responses decoded in bulk carry no annotations, only the header rows
+CSV_DIALECT = Dialect(
+    header=True,
+    delimiter=",",
+    comment_prefix="#",
+    annotations=[],
+    date_time_format="RFC3339",
+)
+
+
+def parse_flux_duration(value) -> float | None:
+    """
+    Turn a flux duration literal (e.g. '1h30m') into seconds.
+
+    Args:
+        value (str): The duration literal.
+
+    Returns:
+        float: Length of the duration in seconds, None if it is not a duration.
+    """
+
+    value = str(value).strip()
+    parts = _DURATION.findall(value)
+    if not parts or "".join(n + u for n, u in parts) != value:
+        return None
+    return sum(int(n) * _DURATION_UNITS[u] for n, u in parts)
+
+
+def parse_flux_time(value, now=None) -> pd.Timestamp | None:
+    """
+    Turn a flux range boundary into a timestamp.
+
+    Args:
+        value (str): RFC3339 time, relative duration (e.g. '-7d') or 'now()'.
+        now (pd.Timestamp): Time relative durations refer to (now by default).
+
+    Returns:
+        pd.Timestamp: The time in UTC, None if it could not be parsed.
+    """
+
+    if now is None:
+        now = pd.Timestamp.now(tz="UTC")
+
+    value = str(value).strip()
+    if value == "now()":
+        return now
+
+    sign = -1 if value.startswith("-") else 1
+    seconds = parse_flux_duration(value.lstrip("-+"))
+    if seconds is not None:
+        return now + pd.to_timedelta(sign * seconds, unit="s")
+
+    try:
+        timestamp = pd.Timestamp(value)
+    except ValueError:
+        return None
+    if not isinstance(timestamp, pd.Timestamp):
+        return None  # NaT
+    if timestamp.tzinfo is None:
+        return timestamp.tz_localize("UTC")
+    return timestamp.tz_convert("UTC")
+
+
+def flux_string(value) -> str:
+    """
+    Turn the value into a flux string literal.
+
+    Backslashes, double quotes and the start of interpolation are escaped,
+    so the value cannot end the literal or be evaluated within it.
+
+    Args:
+        value (str): The value, e.g. the name of a device.
+
+    Returns:
+        str: The quoted literal.
+    """
+
+    value = str(value).replace("\\", "\\\\").replace('"', '\\"')
+    return '"' + value.replace("${", "\\${") + '"'
 
 
 class AsyncQuery:
@@ -23,6 +149,26 @@ class AsyncQuery:
         _influxdb_organization (str): The organization to use within InfluxDB.
         _influxdb_bucket (str): Bucket within InfluxDB where the data will be stored.
         _db_url (str): The URL of the InfluxDB instance.
+        _rollup_buckets (dict[int, str]): Downsampled buckets by window length.
+        _max_points (int): Points per parameter a historical query aims for.
+        _connection_limit (int): Maximum number of pooled connections.
+        _enable_gzip (bool): Whether query responses are gzip compressed.
+        _timeout (float): Seconds InfluxDB may stay silent during a query.
+        _cache (QueryCache): Cache of historical query results.
+        _history (HistoryStore): Local tier of readings of closed days.
+        _recent (RecentReadings): Ring buffers of recent readings.
+        _measurement (str): Measurement the readings are written into.
+        _raw_csv (bool): Whether responses are decoded in bulk from csv.
+        _max_parallel (int): Maximum number of queries run at once.
+        _split_rows (int): Rows per parameter a single query aims for.
+        _sample_interval (float): Seconds between raw readings of a device.
+        _semaphore (asyncio.Semaphore): Limits the queries run at once, bound
+            to the event loop of the pooled client.
+        _inflight (dict[tuple[str, str], asyncio.Task]): Queries in flight by
+            method and normalized text, shared by identical queries.
+        _executed (int): Queries passed to the database.
+        _coalesced (int): Queries answered by an identical query in flight.
+        _client (InfluxDBClientAsync): Pooled client, reused by every query.
         sensors_and_params (dict): The sensors and their parameters to read.
     """
 
@@ -34,9 +180,46 @@ class AsyncQuery:
 
     _db_url: str  # address of the influxdb instance
 
+    _rollup_buckets: dict[int, str]  # downsampled buckets by window in seconds
+    _max_points: int  # points per parameter a historical query aims for
+
+    _connection_limit: int  # maximum number of pooled connections
+    _enable_gzip: bool  # whether query responses are gzip compressed
+    _timeout: float  # seconds influxdb may stay silent during a query
+    _cache: QueryCache | None  # cache of historical query results
+    _history: HistoryStore | None  # local tier of readings of closed days
+    _recent: RecentReadings | None  # ring buffers of recent readings
+    _measurement: str  # measurement the readings are written into
+    _raw_csv: bool  # whether responses are decoded in bulk from csv
+    _max_parallel: int  # maximum number of queries run at once
+    _split_rows: int  # rows per parameter a single query aims for
+    _sample_interval: float  # seconds between raw readings of a device
+    _client: InfluxDBClientAsync | None  # pooled client reused by every query
+
     sensors: dict  # sensors and their parameters to read
 
-    def __init__(self, host, port, token, org, bucket, sensors):
+    def __init__(
+        self,
+        host,
+        port,
+        token,
+        org,
+        bucket,
+        sensors,
+        rollup_buckets=None,
+        max_points=2000,
+        connection_limit=10,
+        enable_gzip=False,
+        timeout=10.0,
+        cache=None,
+        max_parallel=4,
+        split_rows=100000,
+        sample_interval=1.0,
+        history=None,
+        recent=None,
+        measurement="sensor_data",
+        raw_csv=False,
+    ):
         """
         Initialize the fetcher with the required information.
 
@@ -47,6 +230,32 @@ class AsyncQuery:
             org (str): The organization to use within InfluxDB.
             bucket (str): Bucket within InfluxDB where the data will be stored.
             sensors (dict): The sensors and their parameters to read.
+            rollup_buckets (dict[int, str]): Buckets holding aggregates written
+                by the fetcher, by window length in seconds.
+            max_points (int): Number of points per parameter, historical
+                queries without explicit resolution are downsampled to.
+            connection_limit (int): Maximum number of pooled connections to
+                InfluxDB.
+            enable_gzip (bool): Request gzip compressed query responses.
+            timeout (float): Time in seconds InfluxDB may stay silent, while
+                connecting or between two reads of the response, before the
+                query fails. Streamed responses may take longer as a whole.
+            cache (QueryCache): Cache of historical query results (None
+                disables caching).
+            max_parallel (int): Maximum number of queries of historical data
+                run at once, ranges are split into at most as many sub-ranges.
+            split_rows (int): Expected number of rows per parameter above
+                which a range of historical data is split.
+            sample_interval (float): Seconds between readings of a device,
+                estimates the number of rows of raw readings.
+            history (HistoryStore): Local tier closed days of historical data
+                are read from (None queries InfluxDB for every day).
+            recent (RecentReadings): Ring buffers of recent readings, ranges
+                they cover are answered from (None disables them).
+            measurement (str): Measurement the fetcher writes the readings
+                into, selected queries are filtered by it.
+            raw_csv (bool): Request the csv response and decode it in bulk
+                into columns, instead of creating a FluxRecord per row.
         """
 
         self._influxdb_host = host
@@ -58,164 +267,1557 @@ class AsyncQuery:
         self._db_url = f"http://{self._influxdb_host}:{self._influxdb_port}"
 
         self.sensors = sensors
+        self._measurement = measurement
+        self._raw_csv = raw_csv
 
-    async def _get_InfluxDB_client(self) -> InfluxDBClientAsync:
-        """Returns an InfluxDB client."""
-        return InfluxDBClientAsync(
+        self._rollup_buckets = dict(rollup_buckets or {})
+        self._max_points = max_points
+
+        self._connection_limit = connection_limit
+        self._enable_gzip = enable_gzip
+        self._timeout = timeout
+        self._cache = cache
+        self._history = history
+        self._recent = recent
+
+        # large historical queries are split into concurrent sub-ranges
+        self._max_parallel = max_parallel
+        self._split_rows = split_rows
+        self._sample_interval = sample_interval
+        self._semaphore = None
+
+        # identical concurrent queries share a single request
+        self._inflight = {}
+        self._executed = 0
+        self._coalesced = 0
+
+        self._client = None
+        self._client_loop = None
+
+    async def __aenter__(self) -> "AsyncQuery":
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        await self.stop()
+
+    @property
+    def started(self) -> bool:
+        """Whether the pooled client is currently open."""
+        return self._client is not None
+
+    async def start(self):
+        """
+        Open the pooled InfluxDB client.
+
+        The client is kept alive until stop() is called, so that every query
+        reuses already established connections. Calling start() on a started
+        query interface does nothing.
+
+        The client is bound to the event loop it was opened in, if it is used
+        from another loop (e.g. asyncio.run() per query), it is replaced.
+        """
+
+        loop = asyncio.get_running_loop()
+        if self._client is not None:
+            if self._client_loop is loop:
+                return
+            await self._discard_client()
+
+        self._client = InfluxDBClientAsync(
             url=self._db_url,
             token=self._influxdb_token,
             org=self._influxdb_organization,
+            enable_gzip=self._enable_gzip,
+            connection_pool_maxsize=self._connection_limit,
+            # the client passes an aiohttp timeout through, despite annotating
+            # the argument as milliseconds
+            timeout=aiohttp.ClientTimeout(  # type: ignore
+                total=None, sock_connect=self._timeout, sock_read=self._timeout
+            ),
         )
+        self._client_loop = loop
+        self._semaphore = asyncio.Semaphore(self._max_parallel)
+
+    async def _discard_client(self):
+        """
+        Drop the client opened within another event loop, closing its pooled
+        connections without awaiting on the current loop.
+        """
+
+        client, loop = self._client, self._client_loop
+        assert client is not None and loop is not None
+        self._client = None
+        self._client_loop = None
+
+        if loop.is_running():
+            asyncio.run_coroutine_threadsafe(client.close(), loop)
+            return
+
+        # the connector closes its connections synchronously, awaiting only
+        # completes the call
+        assert client.api_client is not None
+        try:
+            await client.api_client.rest_client.pool_manager.connector.close()
+        except RuntimeError:  # transports of an already closed loop
+            pass
 
-    def _convert_to_local_time(self, timestamps):
+    async def stop(self):
+        """
+        Close the pooled InfluxDB client.
+
+        Safe to call multiple times, as well as on a query interface that was
+        never started.
+        """
+
+        client = self._client
+        if client is None:
+            return
+
+        if self._client_loop is not asyncio.get_running_loop():
+            await self._discard_client()
+            return
+
+        self._client = None
+        self._client_loop = None
+        await client.close()
+
+    async def close(self):
+        """Alias of stop(), closes every pooled connection."""
+        await self.stop()
+
+    def _select_bucket(self, start, end, resolution=None) -> tuple[str, bool]:
+        """
+        Pick the coarsest bucket whose window does not exceed the resolution.
+
+        Args:
+            start (str): Start time of the query.
+            end (str): End time of the query.
+            resolution (float): Requested resolution in seconds (derived from
+                the length of the range and max_points by default).
+
+        Returns:
+            tuple[str, bool]: The bucket and whether it is a rollup bucket.
+        """
+
+        if not self._rollup_buckets:
+            return self._influxdb_bucket, False
+
+        if resolution is None:
+            now = pd.Timestamp.now(tz="UTC")
+            start_time = parse_flux_time(start, now)
+            end_time = parse_flux_time(end, now)
+            if start_time is None or end_time is None:
+                return self._influxdb_bucket, False
+            resolution = (end_time - start_time).total_seconds() / self._max_points
+
+        windows = [window for window in self._rollup_buckets if window <= resolution]
+        if not windows:
+            return self._influxdb_bucket, False
+        return self._rollup_buckets[max(windows)], True
+
+    async def _get_InfluxDB_client(self) -> InfluxDBClientAsync:
+        """Returns the pooled InfluxDB client, opening it if needed."""
+        await self.start()
+        assert self._client is not None
+        return self._client
+
+    def _convert_to_local_time(self, timestamps) -> pd.DatetimeIndex:
         """
         Convert a collection of UTC timestamps to local time.
 
         Args:
             timestamps (list): A list of UTC timestamps.
         Returns:
-            list: A list of timestamps in local time.
+            pd.DatetimeIndex: The timestamps in the local time zone.
         """
 
-        local_timestamps = []
-
-        # get the local offset from UTC
-        local_offset = timedelta(
-            seconds=datetime.now().astimezone().utcoffset().total_seconds()
+        return pd.DatetimeIndex(pd.to_datetime(timestamps, utc=True)).tz_convert(
+            tzlocal()
         )
 
-        # add the offset to the timestamps
-        for timestamp in timestamps:
-            utc_time = pd.to_datetime(timestamp)
-            local_time = utc_time + local_offset
-            local_timestamps.append(local_time)
-
-        return local_timestamps
+    @staticmethod
+    def _as_float(values) -> np.ndarray:
+        """Turn the values into a float64 array, non-numeric values are NaN."""
+        try:
+            return np.asarray(values, dtype=np.float64)
+        except (TypeError, ValueError):
+            return np.asarray(
+                pd.to_numeric(pd.Series(values), errors="coerce"), dtype=np.float64
+            )
 
-    def _into_dataframe(self, tables) -> pd.DataFrame:
+    def _into_dataframe(self, tables, device=False) -> pd.DataFrame:
         """
         Turns the tables into a pandas DataFrame.
+
+        Every table holds a single parameter of a single device. Values are
+        pivoted by parameter into float64 columns aligned by time, readings of
+        several devices are told apart by the device column.
+
         Args:
             tables (list): The tables to turn into a DataFrame.
+            device (bool): Keep the device column even for a single device.
         Returns:
             pd.DataFrame: procured measurements as a DataFrame.
         """
 
-        read: dict = {}
-        timestamps = set()
+        columns = {}  # column of every parameter, in the order received
+        devices = {}  # row of every timestamp, per device
+        parts = []
 
-        # unpacking the table
+        # field and device are part of the group key, constant within a table
         for table in tables:
-            for record in table.records:
-                # get the measurements
-                parameter = record.get_field()
-                measurement = record.get_value()
-                timestamps.add(record.get_time())
+            records = table.records
+            if not records:
+                continue
+
+            first = records[0].values
+            column = columns.setdefault(first.get("_field", "_value"), len(columns))
+            rows = devices.setdefault(first.get("device"), {})
+            parts.append(
+                (
+                    first.get("device"),
+                    column,
+                    [rows.setdefault(r.values["_time"], len(rows)) for r in records],
+                    [r.values["_value"] for r in records],
+                )
+            )
 
-                # ensure every parameter is present in the dict
-                if parameter not in read:
-                    read[parameter] = []
-                read[parameter].append(float(measurement))
+        if not parts:
+            return pd.DataFrame(
+                columns=pd.Index(["device", "time"] if device else ["time"])
+            )
 
-        # convert timestamps to local time
-        local_timestamps = self._convert_to_local_time(timestamps)
+        offsets = {}
+        total = 0
+        for name, rows in devices.items():
+            offsets[name] = total
+            total += len(rows)
 
-        # if there is no time key, create one
-        if "time" not in read:
-            read["time"] = []
+        # scatter the values of every table into their rows and column
+        matrix = np.full((total, len(columns)), np.nan)
+        for name, column, rows, values in parts:
+            rows = np.asarray(rows, dtype=np.intp) + offsets[name]
+            matrix[rows, column] = self._as_float(values)
 
-        # add the timestamps to the data dict
-        for timestamp in local_timestamps:
-            read["time"].append(pd.to_datetime(timestamp))
+        frame = pd.DataFrame(matrix, columns=pd.Index(list(columns)))
+        order = ["time", "device"] if len(devices) > 1 else ["time"]
+        if device or len(devices) > 1:
+            frame["device"] = np.repeat(
+                np.array(list(devices), dtype=object),
+                [len(rows) for rows in devices.values()],
+            )
 
-        # return the data as a DataFrame
-        return pd.DataFrame(read)
+        # timestamps are converted once, the distinct ones only
+        frame["time"] = self._convert_to_local_time(
+            [timestamp for rows in devices.values() for timestamp in rows]
+        )
+
+        if len(devices) > 1 or not frame["time"].is_monotonic_increasing:
+            frame = frame.sort_values(order, kind="stable", ignore_index=True)
+        return frame
 
-    async def latest(self) -> pd.DataFrame:
+    async def _run_query(self, query, method, limited=False) -> list | str | None:
         """
-        Query the database for the latest measurement.
+        Pass the query to the database.
+
+        Args:
+            query (str): The flux query.
+            method (str): Name of the method, labels the latency metric.
+            limited (bool): Whether the query counts towards max_parallel.
 
         Returns:
-            pd.DataFrame: The latest measurement of every parameter.
+            list[FluxTable] | str: The result, the csv response if raw_csv is
+                enabled, None if the query failed.
         """
 
         # get the connection to the database via query api
         client = await self._get_InfluxDB_client()
         query_api = client.query_api()
 
-        # query the latest measurement
-        query = f'from(bucket:"{self._influxdb_bucket}") |> range(start: -1h) |> last()'
+        if self._raw_csv:
+            run = functools.partial(query_api.query_raw, query, dialect=CSV_DIALECT)
+        else:
+            run = functools.partial(query_api.query, query)
 
-        tables = None
+        self._executed += 1
         try:
-            tables = await query_api.query(query)
+            if limited:
+                assert self._semaphore is not None
+                async with self._semaphore:
+                    with QUERY_SECONDS.time(method):
+                        return await run()
+            with QUERY_SECONDS.time(method):
+                return await run()
         except InfluxDBError as e:
-            print(f"Exception caught while querying the database:\n\n {e.message}")
+            ERRORS.inc("query")
+            logger.error("exception caught while querying the database: %s", e.message)
+            return None
 
-        # close the connection
-        await client.close()
+    async def _shared_query(self, query, method, limited=False) -> list | str | None:
+        """
+        Pass the query to the database, unless an identical one is already in
+        flight, in which case its result is shared instead.
+
+        Queries are identical if they come from the same method and their
+        text matches exactly, whitespace within string literals and regular
+        expressions is significant. The request runs in a task of its own, so
+        cancelling one of the callers does not affect the others. The
+        tables are only read when turned into DataFrames, every caller builds
+        its own.
+
+        Args:
+            query (str): The flux query.
+            method (str): Name of the method, labels the latency metric.
+            limited (bool): Whether the query counts towards max_parallel.
+
+        Returns:
+            list[FluxTable] | str: The result, None if the query failed.
+        """
+
+        key = (method, query)
+        loop = asyncio.get_running_loop()
+
+        task = self._inflight.get(key)
+        if task is not None and task.get_loop() is loop:
+            self._coalesced += 1
+            COALESCED.inc(method)
+            return await asyncio.shield(task)
+
+        task = loop.create_task(self._run_query(query, method, limited))
+        self._inflight[key] = task
+
+        def done(task):
+            if self._inflight.get(key) is task:
+                del self._inflight[key]
+
+        task.add_done_callback(done)
+        return await asyncio.shield(task)
+
+    def single_flight_stats(self) -> dict:
+        """
+        Return the number of queries passed to the database and the number of
+        queries answered by an identical one in flight.
+        """
+
+        return {
+            "executed": self._executed,
+            "coalesced": self._coalesced,
+            "in_flight": len(self._inflight),
+        }
+
+    def _selection(self, sensors=None, params=None, device=None) -> tuple | None:
+        """
+        Resolve the selectors of a query into fields and devices.
+
+        Args:
+            sensors (str | list[str]): Sensors whose parameters are selected.
+            params (str | list[str]): Parameters selected (among those of the
+                selected sensors).
+            device (str | list[str]): Devices selected.
+
+        Returns:
+            tuple[list[str] | None, list[str] | None]: Selected fields and
+                devices (None selects every one), None if nothing is selected.
+        """
+
+        if sensors is None and params is None and device is None:
+            return None
+
+        fields = None
+        if sensors is not None or params is not None:
+            if isinstance(sensors, str):
+                sensors = [sensors]
+            if isinstance(params, str):
+                params = [params]
+
+            unknown = set(sensors or ()) - set(self.sensors)
+            if unknown:
+                raise ValueError(f"unknown sensors {sorted(unknown)}")
+            known = {param for values in self.sensors.values() for param in values}
+            unknown = set(params or ()) - known
+            if unknown:
+                raise ValueError(f"unknown parameters {sorted(unknown)}")
+
+            fields = [
+                param
+                for sensor in (sensors if sensors is not None else self.sensors)
+                for param in self.sensors[sensor]
+                if params is None or param in params
+            ]
+
+        devices = [device] if isinstance(device, str) else device
+        return fields, devices
+
+    def _selection_filter(self, selection) -> str:
+        """
+        Return the flux filter of the selected fields and devices, placed
+        right after the range so that only they are scanned.
+
+        Args:
+            selection (tuple): Fields and devices, see _selection().
+        """
+
+        if selection is None:
+            return ""
+
+        fields, devices = selection
+        predicates = [f"r._measurement == {flux_string(self._measurement)}"]
+        for column, values in (("_field", fields), ("device", devices)):
+            if values is not None:
+                alternatives = " or ".join(
+                    f"r.{column} == {flux_string(v)}" for v in values
+                )
+                predicates.append(f"({alternatives or 'false'})")
+        return f" |> filter(fn: (r) => {' and '.join(predicates)})"
+
+    async def latest(self, sensors=None, params=None, device=None) -> pd.DataFrame:
+        """
+        Query the database for the latest measurement.
+
+        Args:
+            sensors (str | list[str]): Sensors to query (every one by default).
+            params (str | list[str]): Parameters to query (every one of the
+                queried sensors by default).
+            device (str | list[str]): Devices to query (every one by default).
+
+        Returns:
+            pd.DataFrame: The latest measurement of every selected parameter,
+                a row per device.
+        """
+
+        selection = self._selection(sensors, params, device)
+
+        # query the latest measurement
+        query = (
+            f'from(bucket:"{self._influxdb_bucket}") |> range(start: -1h)'
+            f"{self._selection_filter(selection)} |> last()"
+        )
+        tables = await self._shared_query(query, "latest")
 
         # turn the tables into a DataFrame and return it
         if tables is not None:
-            return self._into_dataframe(tables)
+            return self._merge_latest(self._decode(tables))
         else:
             return pd.DataFrame()
 
-    async def historical_data(self, start: str, end: str) -> pd.DataFrame:
+    @staticmethod
+    def _merge_latest(frame) -> pd.DataFrame:
+        """
+        Merge the last values of every parameter into a single row per device.
+
+        Compressed parameters are written at different times, so their last
+        values do not share a row. The time of the merged row is the time of
+        the newest value.
+
+        Args:
+            frame (pd.DataFrame): Last value of every parameter, ordered by time.
+        """
+
+        if len(frame) <= 1:
+            return frame
+
+        if "device" not in frame.columns:
+            return frame.ffill().tail(1).reset_index(drop=True)
+
+        # the last non-missing value of every column, per device
+        merged = frame.groupby("device", sort=False).last().reset_index()
+        merged = merged.sort_values(["time", "device"], ignore_index=True)
+        return merged[list(frame.columns)]
+
+    def _aggregate_window(self, start, end, window=None, points=None) -> str | None:
+        """
+        Return the flux duration of the aggregation window.
+
+        Args:
+            start (str): Start time of the query.
+            end (str): End time of the query.
+            window (str | float): Flux duration literal or seconds.
+            points (int): Number of points per parameter the window is derived
+                from, if no window is given.
+
+        Returns:
+            str: The window as a flux duration, None if there is none.
+        """
+
+        if window is None:
+            if points is None:
+                return None
+
+            now = pd.Timestamp.now(tz="UTC")
+            start_time = parse_flux_time(start, now)
+            end_time = parse_flux_time(end, now)
+            if start_time is None or end_time is None:
+                raise ValueError(f"cannot derive the window of {start} - {end}")
+            window = max((end_time - start_time).total_seconds() / points, 1)
+
+        if isinstance(window, str):
+            if parse_flux_duration(window) is None:
+                raise ValueError(f"invalid aggregation window {window!r}")
+            return window
+        return f"{math.ceil(window)}s"
+
+    def _historical_query(
+        self,
+        start,
+        end,
+        resolution=None,
+        window=None,
+        fn="mean",
+        points=None,
+        pivot=False,
+        selection=None,
+    ) -> tuple[str, bool]:
+        """
+        Build the flux query of historical data.
+
+        Args:
+            start (str): Start time of the query.
+            end (str): End time of the query.
+            resolution (float): Requested resolution in seconds.
+            window (str | float): Aggregation window, flux duration or seconds.
+            fn (str): Aggregate of every window, one of AGGREGATES.
+            points (int): Number of points per parameter, derives the window.
+            pivot (bool): Pivot the raw readings as well.
+            selection (tuple): Fields and devices to query, see _selection().
+
+        Returns:
+            tuple[str, bool]: The query and whether its result is pivoted.
+        """
+
+        if fn not in AGGREGATES:
+            raise ValueError(f"unknown aggregate {fn!r}, expected one of {AGGREGATES}")
+
+        every = self._aggregate_window(start, end, window, points)
+        if every is not None and resolution is None:
+            resolution = parse_flux_duration(every)
+
+        # rollups hold min, max and mean of every window, but not the last value
+        if every is not None and fn == "last":
+            bucket, rollup = self._influxdb_bucket, False
+        else:
+            bucket, rollup = self._select_bucket(start, end, resolution)
+
+        query = f'from(bucket:"{bucket}") |> range(start: {start}, stop: {end})'
+        query += self._selection_filter(selection)
+        if rollup:
+            stat = fn if every is not None else "mean"
+            query += f' |> filter(fn: (r) => r.stat == "{stat}")'
+
+        if every is None and not pivot:
+            return query, False
+
+        if every is not None:
+            query += (
+                f" |> aggregateWindow(every: {every}, fn: {fn}, createEmpty: false)"
+            )
+        query += (
+            ' |> pivot(rowKey: ["_time"], columnKey: ["_field"], valueColumn: "_value")'
+        )
+        return query, True
+
+    def _rows_into_dataframe(self, records) -> pd.DataFrame:
+        """
+        Turns records of pivoted tables into a pandas DataFrame.
+
+        Every table holds the parameters of a single device as columns, the
+        rows only need to be collected. Records of consecutive tables are
+        handled table by table.
+
+        Args:
+            records (list[FluxRecord]): The pivoted records.
+        Returns:
+            pd.DataFrame: procured measurements, with the device column.
+        """
+
+        params = [param for sensor in self.sensors for param in self.sensors[sensor]]
+
+        # split the records into runs of the same table
+        bounds = [0]
+        bounds.extend(
+            i
+            for i in range(1, len(records))
+            if records[i].table != records[i - 1].table
+        )
+        bounds.append(len(records))
+
+        frames = []
+        for begin, end in zip(bounds, bounds[1:]):
+            rows = records[begin:end]
+            if not rows:
+                continue
+
+            first = rows[0].values
+            columns: dict = {
+                param: self._as_float([r.values.get(param) for r in rows])
+                for param in params
+                if param in first
+            }
+            columns["device"] = first.get("device")
+            columns["time"] = self._convert_to_local_time(
+                [r.values["_time"] for r in rows]
+            )
+            frames.append(pd.DataFrame(columns))
+
+        if not frames:
+            return pd.DataFrame(columns=pd.Index(["device", "time"]))
+
+        frame = pd.concat(frames, ignore_index=True)
+        order = [param for param in params if param in frame.columns]
+        return frame.loc[:, order + ["device", "time"]]
+
+    def _pivoted_into_dataframe(self, tables, device=False) -> pd.DataFrame:
+        """
+        Turns the tables pivoted by the database into a pandas DataFrame.
+
+        Args:
+            tables (list): The pivoted tables to turn into a DataFrame.
+            device (bool): Keep the device column even for a single device.
+        Returns:
+            pd.DataFrame: procured measurements as a DataFrame.
+        """
+
+        tables = [table for table in tables if table.records]
+        frame = self._rows_into_dataframe(
+            [record for table in tables for record in table.records]
+        )
+
+        if not device:
+            frame = self._single_device(frame)
+        if len(tables) > 1:
+            frame = frame.sort_values("time", kind="stable", ignore_index=True)
+        return frame
+
+    def _decode(self, result, pivoted=False, device=False) -> pd.DataFrame:
+        """
+        Turn the result of a query into a pandas DataFrame.
+
+        Args:
+            result (list[FluxTable] | str): Tables or the csv response.
+            pivoted (bool): Whether the result is pivoted by the database.
+            device (bool): Keep the device column even for a single device,
+                so that results of several queries can be concatenated.
+        Returns:
+            pd.DataFrame: procured measurements as a DataFrame.
+        """
+
+        if isinstance(result, str):
+            return self._csv_into_dataframe(result, pivoted, device)
+        if pivoted:
+            return self._pivoted_into_dataframe(result, device)
+        return self._into_dataframe(result, device)
+
+    @staticmethod
+    def _single_device(frame) -> pd.DataFrame:
+        """
+        Drop the device column of readings of a single device.
+
+        Results concatenated from several parts are decoded with the device
+        column, it is dropped once for the whole result, so every part ends
+        up with the same columns.
+
+        Args:
+            frame (pd.DataFrame): Readings, with or without the device column.
+        Returns:
+            pd.DataFrame: The readings.
+        """
+
+        if "device" in frame.columns and frame["device"].nunique(dropna=False) <= 1:
+            frame = frame.drop(columns="device")
+        return frame
+
+    def _csv_blocks(self, text, columns) -> list[pd.DataFrame]:
+        """
+        Parse the csv response by the C parser of pandas.
+
+        Tables sharing their columns are sent as a single block under a
+        single header, blocks are separated by an empty line. Annotation rows
+        are skipped, in case the response carries them.
+
+        Args:
+            text (str): The csv response.
+            columns (set[str]): Columns to parse, the others are skipped.
+        Returns:
+            list[pd.DataFrame]: Columns of every block.
+        """
+
+        separator = "\r\n\r\n" if "\r\n" in text else "\n\n"
+
+        blocks = []
+        for block in text.split(separator):
+            if not block.strip():
+                continue
+
+            # annotation rows precede the header
+            block = block.lstrip()
+            annotations, offset = 0, 0
+            while block.startswith("#", offset):
+                annotations += 1
+                offset = block.find("\n", offset) + 1
+                if offset == 0:
+                    break
+            if annotations and offset == 0:
+                continue
+
+            frame = pd.read_csv(
+                io.StringIO(block),
+                skiprows=annotations,
+                usecols=lambda column: column in columns or column == "error",
+                dtype={"_field": str, "device": str, "_time": str},
+            )
+            if "error" in frame.columns:
+                ERRORS.inc("query")
+                logger.error(
+                    "exception caught while querying the database: %s",
+                    frame["error"].iloc[0] if len(frame) else "",
+                )
+                continue
+            blocks.append(frame)
+        return blocks
+
+    def _csv_into_dataframe(self, text, pivoted=False, device=False) -> pd.DataFrame:
+        """
+        Turns the csv response into a pandas DataFrame, in the same form as
+        _into_dataframe() or _pivoted_into_dataframe() do.
+
+        Every column is decoded at once, no object is created per row. Values
+        of the unpivoted response are scattered into the parameter columns
+        by the codes of their field and of their time and device.
+
+        Args:
+            text (str): The csv response.
+            pivoted (bool): Whether the result is pivoted by the database.
+            device (bool): Keep the device column even for a single device.
+        Returns:
+            pd.DataFrame: procured measurements as a DataFrame.
+        """
+
+        params = [p for sensor in self.sensors for p in self.sensors[sensor]]
+        if pivoted:
+            columns = {*params, "device", "_time"}
+        else:
+            columns = {"_time", "_value", "_field", "device"}
+
+        blocks = [block for block in self._csv_blocks(text, columns) if len(block)]
+        if not blocks:
+            return pd.DataFrame(
+                columns=pd.Index(["device", "time"] if device else ["time"])
+            )
+
+        if pivoted:
+            frames = []
+            for block in blocks:
+                data: dict = {
+                    param: self._as_float(block[param])
+                    for param in params
+                    if param in block.columns
+                }
+                data["device"] = block["device"] if "device" in block else None
+                data["time"] = block["_time"]
+                frames.append(pd.DataFrame(data))
+
+            frame = pd.concat(frames, ignore_index=True)
+            frame["time"] = pd.to_datetime(
+                frame["time"], format="ISO8601", utc=True
+            ).dt.tz_convert(tzlocal())
+            order = [param for param in params if param in frame.columns]
+            frame = frame.loc[:, order + ["device", "time"]]
+        else:
+            frame = pd.concat(
+                [
+                    block.reindex(columns=["_time", "_value", "_field", "device"])
+                    for block in blocks
+                ],
+                ignore_index=True,
+            )
+
+            # codes of every field, device and time, in the order received
+            field_codes, fields = pd.factorize(frame["_field"])
+            device_codes, devices = pd.factorize(frame["device"], use_na_sentinel=False)
+            time_codes, times = pd.factorize(frame["_time"])
+            row_codes, rows = pd.factorize(
+                device_codes.astype(np.int64) * len(times) + time_codes
+            )
+
+            matrix = np.full((len(rows), len(fields)), np.nan)
+            matrix[row_codes, field_codes] = self._as_float(frame["_value"])
+
+            frame = pd.DataFrame(matrix, columns=pd.Index(list(fields)))
+            frame["device"] = np.asarray(devices, dtype=object)[rows // len(times)]
+            frame["time"] = pd.DatetimeIndex(
+                pd.to_datetime(times, format="ISO8601", utc=True)
+            ).tz_convert(tzlocal())[rows % len(times)]
+
+        several = frame["device"].nunique() > 1
+        if several or not frame["time"].is_monotonic_increasing:
+            order = ["time", "device"] if several and not pivoted else ["time"]
+            frame = frame.sort_values(order, kind="stable", ignore_index=True)
+        if not device and not several:
+            frame = self._single_device(frame)
+        return frame
+
+    async def historical_data(
+        self,
+        start: str,
+        end: str,
+        resolution: float | None = None,
+        window: str | float | None = None,
+        fn: str = "mean",
+        points: int | None = None,
+        sensors: str | list[str] | None = None,
+        params: str | list[str] | None = None,
+        device: str | list[str] | None = None,
+    ) -> pd.DataFrame:
         """
         Query historical data from the database.
 
+        If rollup buckets are configured, the coarsest one still meeting the
+        resolution is queried instead of the raw readings.
+
+        If a window or a number of points is given, the values are aggregated
+        into windows and pivoted by InfluxDB, so only a row per window is
+        transferred.
+
+        Ranges expected to hold more than split_rows rows per parameter are
+        split into up to max_parallel sub-ranges queried concurrently, see
+        _split_range().
+
+        If the history store is configured, closed days are read from the
+        local disk and only the rest of the range is queried from InfluxDB,
+        see _stored_historical_data().
+
+        Ranges covered by the ring buffers of recent readings are answered
+        from the memory, see _recent_historical_data().
+
         Args:
             start (str): Start time of the query (e.g., '2024-01-01T00:00:00Z').
             end (str): End time of the query (e.g., '2024-01-02T00:00:00Z').
+            resolution (float): Requested resolution in seconds (by default
+                derived from the length of the range and max_points).
+            window (str | float): Aggregation window, flux duration (e.g. '5m')
+                or seconds.
+            fn (str): Aggregate of every window ('mean', 'min', 'max', 'last').
+            points (int): Number of points per parameter to aggregate the range
+                into, used if no window is given.
+            sensors (str | list[str]): Sensors to query (every one by default).
+            params (str | list[str]): Parameters to query (every one of the
+                queried sensors by default).
+            device (str | list[str]): Devices to query (every one by default).
 
         Returns:
             pd.DataFrame: Historical data within the specified time range.
         """
 
-        # get the connection to the database via query api
-        client = await self._get_InfluxDB_client()
-        query_api = client.query_api()
+        selection = self._selection(sensors, params, device)
 
-        # query the data from specified start and finish
-        query = f'from(bucket:"{self._influxdb_bucket}") |> range(start: {start}, stop: {end})'
+        if self._recent is not None:
+            frame = self._recent_historical_data(
+                start, end, resolution, window, fn, points, selection
+            )
+            if frame is not None:
+                return frame
 
-        tables = None
-        try:
-            tables = await query_api.query(query)
-        except InfluxDBError as e:
-            print(f"Exception caught while querying the database:\n\n {e.message}")
+        if self._history is not None:
+            frame = await self._stored_historical_data(
+                start, end, resolution, window, fn, points, selection
+            )
+            if frame is not None:
+                return frame
 
-        await client.close()
+        return await self._queried_historical_data(
+            start, end, resolution, window, fn, points, selection
+        )
 
-        if tables is not None:
-            return self._into_dataframe(tables)
+    async def _queried_historical_data(
+        self, start, end, resolution, window, fn, points, selection=None, device=False
+    ) -> pd.DataFrame:
+        """
+        Query historical data from InfluxDB, through the cache if it is
+        configured. Accepts the arguments of historical_data(), device keeps
+        the device column even for a single device.
+        """
+
+        if self._cache is not None:
+            frame = await self._cached_historical_data(
+                start, end, resolution, window, fn, points, selection
+            )
+            if frame is not None:
+                return frame if device else self._single_device(frame)
+
+        bounds = self._split_range(start, end, resolution, window, points)
+        if bounds is None:
+            query, pivoted = self._historical_query(
+                start, end, resolution, window, fn, points, selection=selection
+            )
+            frame = await self._historical_frame(query, pivoted, device)
+            return frame if frame is not None else pd.DataFrame()
+
+        # every sub-range is queried with the window and the bucket resolved
+        # for the whole range, so the results stitch together seamlessly
+        every = self._aggregate_window(start, end, window, points)
+        if resolution is None and every is not None:
+            resolution = parse_flux_duration(every)
+        elif resolution is None:
+            resolution = (bounds[-1] - bounds[0]).total_seconds() / self._max_points
+
+        queries = [
+            self._historical_query(
+                first.isoformat(),
+                last.isoformat(),
+                resolution,
+                every,
+                fn,
+                selection=selection,
+            )
+            for first, last in zip(bounds, bounds[1:])
+        ]
+        results = await asyncio.gather(
+            *(self._historical_frame(q, pivoted, True) for q, pivoted in queries)
+        )
+        frames = [frame for frame in results if frame is not None]
+        if len(frames) < len(results):
+            return pd.DataFrame()
+
+        parts = [frame for frame in frames if not frame.empty]
+        frame = pd.concat(parts, ignore_index=True) if parts else frames[0]
+        return frame if device else self._single_device(frame)
+
+    def _split_range(
+        self, start, end, resolution=None, window=None, points=None
+    ) -> list[pd.Timestamp] | None:
+        """
+        Split the range of a historical query into sub-ranges of similar
+        expected number of rows.
+
+        The number of rows per parameter is estimated from the length of the
+        range and the aggregation window, the window of the selected rollup
+        bucket or sample_interval. Boundaries are aligned to the window, so
+        no window is cut in two and each is returned by a single sub-range.
+        As flux ranges are half-open, rows at a boundary are not duplicated.
+
+        Args:
+            start (str): Start time of the query.
+            end (str): End time of the query.
+            resolution (float): Requested resolution in seconds.
+            window (str | float): Aggregation window, flux duration or seconds.
+            points (int): Number of points per parameter, derives the window.
+
+        Returns:
+            list[pd.Timestamp]: Boundaries of the sub-ranges, None if the range
+                is not worth splitting (or cannot be split).
+        """
+
+        if self._max_parallel < 2:
+            return None
+
+        now = pd.Timestamp.now(tz="UTC")
+        start_time = parse_flux_time(start, now)
+        end_time = parse_flux_time(end, now)
+        if start_time is None or end_time is None or end_time <= start_time:
+            return None
+        seconds = (end_time - start_time).total_seconds()
+
+        every = self._aggregate_window(start, end, window, points)
+        if every is not None:
+            # calendar windows differ in length, they cannot be aligned
+            step = parse_flux_duration(every)
+            if step is None or re.search(r"mo|y", every):
+                return None
         else:
+            if resolution is None:
+                resolution = seconds / self._max_points
+            bucket, rollup = self._select_bucket(start, end, resolution)
+            step = self._sample_interval
+            if rollup:
+                windows = {name: w for w, name in self._rollup_buckets.items()}
+                step = windows[bucket]
+
+        parts = min(math.ceil(seconds / step / self._split_rows), self._max_parallel)
+        if parts < 2:
+            return None
+
+        length = math.ceil(seconds / parts / step) * step
+        origin = math.floor(start_time.timestamp() / step) * step
+
+        bounds = [start_time]
+        for i in range(1, parts):
+            bound = pd.to_datetime(origin + i * length, unit="s", utc=True)
+            if bound > bounds[-1] and bound < end_time:
+                bounds.append(bound)
+        bounds.append(end_time)
+        return bounds
+
+    async def _historical_frame(
+        self, query, pivoted, device=False
+    ) -> pd.DataFrame | None:
+        """
+        Run the historical query and turn its result into a DataFrame.
+
+        Args:
+            query (str): The flux query.
+            pivoted (bool): Whether the result is pivoted by the database.
+            device (bool): Keep the device column even for a single device.
+
+        Returns:
+            pd.DataFrame: The result, None if the query failed.
+        """
+
+        tables = await self._shared_query(query, "historical_data", limited=True)
+        if tables is None:
+            return None
+        return self._decode(tables, pivoted, device)
+
+    async def _cached_historical_data(
+        self, start, end, resolution, window, fn, points, selection=None
+    ) -> pd.DataFrame | None:
+        """
+        Answer the historical query from the cache, querying only the buckets
+        missing from it and the open bucket at the end of the range.
+
+        Consecutive missing buckets are fetched by a single query, every
+        bucket is queried with the same window and from the same bucket of
+        InfluxDB, so the results stitch together seamlessly.
+
+        Only windows the range covers entirely are cached. The windows cut by
+        the start or the end of the range are aggregated over the part within
+        the range, they are queried with the exact bounds, as InfluxDB does
+        without the cache.
+
+        Every part is decoded with the device column, the cached buckets
+        included, it is up to the caller to drop it.
+
+        Returns:
+            pd.DataFrame: The result, None if the query cannot be cached
+            (the range cannot be parsed, it lies within a single window or the
+            window does not divide the cache buckets).
+        """
+
+        assert self._cache is not None
+        now = pd.Timestamp.now(tz="UTC")
+        start_time = parse_flux_time(start, now)
+        end_time = parse_flux_time(end, now)
+        if start_time is None or end_time is None or end_time <= start_time:
+            return None
+
+        # resolve everything derived from the length of the whole range
+        every = self._aggregate_window(start, end, window, points)
+        step = None
+        if every is not None:
+            step = parse_flux_duration(every)
+            if step is None or self._cache.bucket_seconds % step:
+                return None
+            if resolution is None:
+                resolution = step
+        elif resolution is None:
+            resolution = (end_time - start_time).total_seconds() / self._max_points
+
+        # the query with placeholders of the range identifies cached results
+        key, pivoted = self._historical_query(
+            "__start__", "__stop__", resolution, every, fn, selection=selection
+        )
+
+        def ranged(first, last):
+            return key.replace("__start__", first.isoformat()).replace(
+                "__stop__", last.isoformat()
+            )
+
+        # windows aligned to the epoch, entirely within the range
+        first, last = start_time, end_time
+        edges = []
+        if step is not None:
+            freq = f"{round(step * 1e9)}ns"
+            first, last = start_time.ceil(freq), end_time.floor(freq)
+            if first > last:
+                return None
+            edges = [
+                (a, b) for a, b in ((start_time, first), (last, end_time)) if a < b
+            ]
+
+        frames = {}
+        missing = []
+        buckets = self._cache.buckets(first, last) if first < last else []
+        for bucket in buckets:
+            if not self._cache.closed(bucket, now):
+                self._cache.tail += 1
+                missing.append(bucket)
+                continue
+
+            frame = self._cache.get(key, bucket)
+            if frame is None:
+                missing.append(bucket)
+            else:
+                frames[bucket] = frame
+
+        # consecutive missing buckets are fetched by a single query
+        runs = []
+        for bucket in missing:
+            if runs and runs[-1][-1] + self._cache.bucket_seconds == bucket:
+                runs[-1].append(bucket)
+            else:
+                runs.append([bucket])
+
+        bounds = [
+            (
+                self._cache.bucket_time(run[0]),
+                self._cache.bucket_time(run[-1] + self._cache.bucket_seconds),
+            )
+            for run in runs
+        ]
+        results = await asyncio.gather(
+            *(
+                self._historical_frame(ranged(a, b), pivoted, True)
+                for a, b in bounds + edges
+            )
+        )
+        fetched = [frame for frame in results if frame is not None]
+        if len(fetched) < len(results):
             return pd.DataFrame()
 
-    async def query(self, query: str) -> pd.DataFrame:
+        for run, frame in zip(runs, fetched):
+            for bucket, part in self._cache.split(
+                frame, run, every is not None
+            ).items():
+                frames[bucket] = part
+                if self._cache.closed(bucket, now):
+                    self._cache.put(key, bucket, part)
+
+        parts = [
+            frames[bucket] for bucket in sorted(frames) if not frames[bucket].empty
+        ]
+        if parts:
+            # buckets cover more than the requested range
+            frame = pd.concat(parts, ignore_index=True)
+            times = frame["time"]
+            if every is not None:
+                mask = (times > first) & (times <= last)
+            else:
+                mask = (times >= first) & (times < last)
+            parts = [frame.loc[mask]]
+
+        parts += [frame for frame in fetched[len(runs) :] if not frame.empty]
+        parts = [part for part in parts if not part.empty]
+        if not parts:
+            return pd.DataFrame(columns=pd.Index(["device", "time"]))
+        frame = pd.concat(parts, ignore_index=True)
+        if edges:
+            frame = frame.sort_values("time", kind="stable", ignore_index=True)
+        return frame
+
+    async def _stored_historical_data(
+        self, start, end, resolution, window, fn, points, selection=None
+    ) -> pd.DataFrame | None:
         """
-        Perform a custom query on the database.
+        Read closed days of historical data from the history store, query
+        only the rest of the range from InfluxDB.
+
+        Days missing from the store are queried from InfluxDB in full and
+        stored first. The store holds raw readings, aggregation windows (and
+        windows of the rollup bucket the resolution would select) are
+        computed locally the same way InfluxDB does. Accepts the arguments
+        of historical_data().
+
+        Returns:
+            pd.DataFrame: The result, None if no closed day is covered by the
+            range or the store cannot be used for it.
+        """
+
+        assert self._history is not None
+        now = pd.Timestamp.now(tz="UTC")
+        start_time = parse_flux_time(start, now)
+        end_time = parse_flux_time(end, now)
+        if start_time is None or end_time is None or end_time <= start_time:
+            return None
+
+        local = self._local_window(
+            start, end, start_time, end_time, resolution, window, fn, points
+        )
+        if local is None:
+            return None
+        every, resolution, step, stat, rollup = local
+
+        # the stored part ends with a window, so no window is cut in two, the
+        # last window of a rollup bucket is always left to the bucket, as it
+        # holds the readings past the end of the range as well
+        boundary = min(end_time, self._history.first_open(now))
+        if step is not None and (boundary < end_time or rollup):
+            aligned = math.floor(boundary.timestamp() / step) * step
+            boundary = pd.to_datetime(aligned, unit="s", utc=True)
+        if boundary <= start_time:
+            return None
+
+        days = self._history.days(start_time, boundary)
+        missing = [day for day in days if not self._history.complete(day)]
+        stored = await asyncio.gather(*(self._store_day(day) for day in missing))
+        if not all(stored):
+            return None
+
+        fields, devices = selection if selection is not None else (None, None)
+        params = fields
+        if params is None:
+            params = [p for sensor in self.sensors for p in self.sensors[sensor]]
+        frame = await asyncio.to_thread(
+            self._read_stored, days, params, devices, start_time, boundary
+        )
+        frame = self._local_frame(
+            frame, params, step, stat, start_time, boundary, rollup
+        )
+
+        if boundary < end_time:
+            rest = await self._queried_historical_data(
+                boundary.isoformat(), end, resolution, every, fn, None, selection, True
+            )
+            if not rest.empty:
+                frame = pd.concat([frame, rest], ignore_index=True)
+
+        return self._single_device(frame)
+
+    def _local_window(
+        self, start, end, start_time, end_time, resolution, window, fn, points
+    ) -> tuple | None:
+        """
+        Resolve the window raw readings of the range are aggregated into,
+        when historical data is computed locally rather than by InfluxDB.
+
+        Without an aggregation window, the window of the rollup bucket the
+        resolution would select is used, so the result matches the one of
+        InfluxDB. Accepts the arguments of historical_data() along with the
+        parsed range.
+
+        Returns:
+            tuple[str | None, float, float | None, str, bool]: The aggregation
+                window, the resolution, length of the window in seconds, the
+                aggregate and whether the windows are those of a rollup bucket
+                (None if the window differs in length).
+        """
+
+        # resolve everything derived from the length of the whole range
+        every = self._aggregate_window(start, end, window, points)
+        step, stat, rollup = None, fn, False
+        if every is not None:
+            # calendar windows differ in length, they cannot be aligned
+            if re.search(r"mo|y", every):
+                return None
+            step = parse_flux_duration(every)
+            if resolution is None:
+                resolution = step
+        else:
+            if resolution is None:
+                resolution = (end_time - start_time).total_seconds() / self._max_points
+            bucket, rollup = self._select_bucket(start, end, resolution)
+            if rollup:
+                windows = {name: w for w, name in self._rollup_buckets.items()}
+                step, stat = windows[bucket], "mean"
+
+        return every, resolution, step, stat, rollup
+
+    def _local_frame(
+        self, frame, params, step, stat, start, stop, rollup=False
+    ) -> pd.DataFrame:
+        """
+        Aggregate raw readings read locally, if a window is given, and bring
+        them into the form of the result of InfluxDB.
 
         Args:
-            query (str): The InfluxDB query to execute.
+            frame (pd.DataFrame): Readings with the device column and the time
+                column in UTC.
+            params (list[str]): The queried parameters, in order.
+            step (float): Length of the window in seconds (None if the
+                readings are not aggregated).
+            stat (str): Aggregate of every window, one of AGGREGATES.
+            start (pd.Timestamp): Start of the range.
+            stop (pd.Timestamp): End of the range.
+            rollup (bool): Whether the windows are those of a rollup bucket.
 
         Returns:
-            pd.DataFrame: The result of the custom query.
+            pd.DataFrame: The readings, with the device column.
+        """
+
+        if step is not None:
+            frame = self._aggregate_stored(frame, step, stat, start, stop, rollup)
+
+        order = [param for param in params if param in frame.columns]
+        frame = frame.loc[:, order + ["device", "time"]].sort_values(
+            ["time", "device"], ignore_index=True
+        )
+        frame["time"] = frame["time"].dt.tz_convert(tzlocal())
+        return frame
+
+    def _recent_historical_data(
+        self, start, end, resolution, window, fn, points, selection=None
+    ) -> pd.DataFrame | None:
+        """
+        Answer the historical query from the ring buffers of recent readings
+        published by the fetcher.
+
+        Aggregation windows (and windows of the rollup bucket the resolution
+        would select) are computed locally the same way InfluxDB does.
+        Accepts the arguments of historical_data().
+
+        Returns:
+            pd.DataFrame: The result, None if the range is not covered by the
+            buffers.
+        """
+
+        assert self._recent is not None
+        now = pd.Timestamp.now(tz="UTC")
+        start_time = parse_flux_time(start, now)
+        end_time = parse_flux_time(end, now)
+        if start_time is None or end_time is None or end_time <= start_time:
+            return None
+        fields, devices = selection if selection is not None else (None, None)
+        if not self._recent.covers(
+            start_time.value, end_time.value, now.value, devices
+        ):
+            self._recent.misses += 1
+            return None
+
+        local = self._local_window(
+            start, end, start_time, end_time, resolution, window, fn, points
+        )
+        if local is None:
+            return None
+        _, _, step, stat, rollup = local
+
+        params = fields
+        if params is None:
+            params = [p for sensor in self.sensors for p in self.sensors[sensor]]
+
+        # covered again, readings might have been published meanwhile
+        frame = self._recent.frame(
+            start_time.value, end_time.value, params, devices, now.value
+        )
+        if frame is None:
+            return None
+
+        # the open window of a rollup bucket is not written into it yet
+        frame = self._local_frame(
+            frame, params, step, stat, start_time, end_time, rollup
+        )
+        return self._single_device(frame)
+
+    def recent_stats(self) -> dict:
+        """
+        Return the hit and miss counters of the ring buffers of recent
+        readings, see RecentReadings.stats().
+        """
+
+        if self._recent is None:
+            return {}
+        return self._recent.stats()
+
+    async def _store_day(self, day) -> bool:
+        """
+        Query raw readings of the closed day and put them into the history
+        store.
+
+        Args:
+            day (datetime.date): The day.
+
+        Returns:
+            bool: Whether the day can be read from the store, even if it was
+                not marked complete.
+        """
+
+        assert self._history is not None
+        version = self._history.version(day)
+        first = self._history.day_start(day)
+        last = first + pd.to_timedelta(1, unit="D")
+        query = (
+            f'from(bucket:"{self._influxdb_bucket}")'
+            f" |> range(start: {first.isoformat()}, stop: {last.isoformat()})"
+            ' |> pivot(rowKey: ["_time"], columnKey: ["_field"], valueColumn: "_value")'
+        )
+
+        tables = await self._shared_query(query, "history", limited=True)
+        if tables is None:
+            return False
+
+        if isinstance(tables, str):
+            frame = self._csv_into_dataframe(tables, pivoted=True, device=True)
+        else:
+            frame = self._rows_into_dataframe(
+                [record for table in tables for record in table.records]
+            )
+        frame["time"] = pd.to_datetime(frame["time"], utc=True)
+        await asyncio.to_thread(self._history.write, day, frame, version)
+        return True
+
+    def _read_stored(self, days, params, devices, start, end) -> pd.DataFrame:
+        """
+        Read the days from the history store, trimmed to the range.
+
+        Args:
+            days (list[datetime.date]): The days.
+            params (list[str]): The parameters to read.
+            devices (list[str]): The devices to read (every one if None).
+            start (pd.Timestamp): Start of the range.
+            end (pd.Timestamp): End of the range (exclusive).
+        """
+
+        assert self._history is not None
+        frames = [self._history.read(day, params, devices) for day in days]
+        frame = pd.concat(frames, ignore_index=True)
+        frame["time"] = pd.to_datetime(frame["time"], utc=True)
+
+        mask = (frame["time"] >= start) & (frame["time"] < end)
+        return frame.loc[mask].reset_index(drop=True)
+
+    @staticmethod
+    def _aggregate_stored(frame, step, fn, start, stop, rollup=False) -> pd.DataFrame:
+        """
+        Aggregate stored readings into windows, as aggregateWindow() does.
+
+        Windows are aligned to the epoch, every one is timed by its end (or
+        by the end of the range, if the range ends sooner) and empty windows
+        are left out.
+
+        Windows of a rollup bucket are timed by their start instead, as the
+        fetcher writes them, and only those within the range entirely are
+        kept, the bucket holds no window cut by the range.
+
+        Args:
+            frame (pd.DataFrame): Readings with the device and time columns.
+            step (float): Length of the window in seconds.
+            fn (str): Aggregate of every window, one of AGGREGATES.
+            start (pd.Timestamp): Start of the range.
+            stop (pd.Timestamp): End of the range.
+            rollup (bool): Whether the windows are those of a rollup bucket.
+        """
+
+        if frame.empty:
+            return frame
+
+        window = int(step * 1_000_000_000)
+        times = frame["time"].astype("int64").to_numpy()
+        if rollup:
+            stamps = times // window * window
+            full = (stamps >= start.value) & (stamps + window <= stop.value)
+            frame, stamps = frame[full], stamps[full]
+        else:
+            stamps = np.minimum(times // window * window + window, stop.value)
+
+        frame = frame.assign(time=pd.to_datetime(stamps, utc=True))
+        return frame.groupby(["device", "time"], sort=False).agg(fn).reset_index()
+
+    def history_stats(self) -> dict:
+        """
+        Return the number of days read and written by the history store, see
+        HistoryStore.stats().
         """
+
+        if self._history is None:
+            return {}
+        return self._history.stats()
+
+    def cache_stats(self) -> dict:
+        """
+        Return the hit and miss counters of the cache, see QueryCache.stats().
+        """
+
+        if self._cache is None:
+            return {}
+        return self._cache.stats()
+
+    async def _stream(self, query, method, chunk_size):
+        """
+        Stream the records of the query in lists of at most chunk_size.
+
+        Args:
+            query (str): The flux query.
+            method (str): Name of the method, labels the latency metric.
+            chunk_size (int): Maximum number of records of a chunk.
+        """
+
         client = await self._get_InfluxDB_client()
         query_api = client.query_api()
 
-        tables = None
-
         try:
-            tables = await query_api.query(query)
+            with QUERY_SECONDS.time(method):
+                records = await query_api.query_stream(query)
+
+            chunk = []
+            async for record in records:
+                chunk.append(record)
+                if len(chunk) >= chunk_size:
+                    yield chunk
+                    chunk = []
+            if chunk:
+                yield chunk
         except InfluxDBError as e:
-            print(f"Exception caught while querying the database:\n\n {e.message}")
+            ERRORS.inc("query")
+            logger.error("exception caught while querying the database: %s", e.message)
 
-        await client.close()
+    async def historical_stream(
+        self,
+        start: str,
+        end: str,
+        resolution: float | None = None,
+        window: str | float | None = None,
+        fn: str = "mean",
+        points: int | None = None,
+        chunk_size: int = 10000,
+    ):
+        """
+        Stream historical data from the database in DataFrame chunks.
+
+        Accepts the arguments of historical_data(). The readings are pivoted
+        by the database, every chunk holds at most chunk_size rows along with
+        the device column. Only a single chunk is held in memory and the
+        first one is yielded as soon as its rows arrive.
+
+        Args:
+            start (str): Start time of the query (e.g., '2024-01-01T00:00:00Z').
+            end (str): End time of the query (e.g., '2024-01-02T00:00:00Z').
+            resolution (float): Requested resolution in seconds.
+            window (str | float): Aggregation window, flux duration or seconds.
+            fn (str): Aggregate of every window ('mean', 'min', 'max', 'last').
+            points (int): Number of points per parameter to aggregate into.
+            chunk_size (int): Maximum number of rows of a chunk.
+
+        Yields:
+            pd.DataFrame: Consecutive chunks of the historical data.
+        """
+
+        query, _ = self._historical_query(
+            start, end, resolution, window, fn, points, pivot=True
+        )
+
+        async for records in self._stream(query, "historical_stream", chunk_size):
+            yield self._rows_into_dataframe(records)
+
+    async def query_stream(self, query: str, chunk_size: int = 10000):
+        """
+        Stream the result of a custom query in DataFrame chunks.
+
+        Every chunk holds at most chunk_size records, with a column per
+        column of the result.
+
+        Args:
+            query (str): The InfluxDB query to execute.
+            chunk_size (int): Maximum number of rows of a chunk.
+
+        Yields:
+            pd.DataFrame: Consecutive chunks of the result.
+        """
+
+        async for records in self._stream(query, "query_stream", chunk_size):
+            yield pd.DataFrame.from_records([record.values for record in records]).drop(
+                columns=["result", "table"], errors="ignore"
+            )
+
+    async def query(self, query: str) -> pd.DataFrame:
+        """
+        Perform a custom query on the database.
+
+        Args:
+            query (str): The InfluxDB query to execute.
+
+        Returns:
+            pd.DataFrame: The result of the custom query.
+        """
+        tables = await self._shared_query(query, "query")
 
         if tables is not None:
-            return self._into_dataframe(tables)
+            return self._decode(tables)
         else:
             return pd.DataFrame()
@@ -0,0 +1,196 @@
+"""
+Cache of historical query results, split into buckets of aligned time ranges.
+
+Author: Piotr Krzysztof Lis - github.com/straightchlorine
+"""
+
+import math
+from collections import OrderedDict
+
+import pandas as pd
+
+
+class QueryCache:
+    """
+    Results of historical queries cached per aligned time bucket.
+
+    A requested range is split into buckets aligned to multiples of
+    bucket_seconds since the epoch. Buckets that ended long enough ago to be
+    complete (closed) are kept until the memory cap evicts the least recently
+    used ones. The bucket containing now (open) is never cached, as readings
+    keep arriving into it.
+
+    Attributes:
+        bucket_seconds (int): Length of a bucket in seconds.
+        max_bytes (int): Memory cap of the cached results.
+        lateness (float): Seconds after its end a bucket is considered closed.
+        _entries (OrderedDict[tuple, tuple[pd.DataFrame, int]]): Results and
+            their sizes by query and bucket, the least recently used first.
+        _bytes (int): Memory used by the cached results.
+        hits (int): Closed buckets answered from the cache.
+        misses (int): Closed buckets queried from the database.
+        tail (int): Open buckets queried from the database.
+        evictions (int): Buckets evicted due to the memory cap.
+    """
+
+    bucket_seconds: int  # length of a bucket in seconds
+    max_bytes: int  # memory cap of the cached results
+    lateness: float  # seconds after its end a bucket is considered closed
+
+    hits: int  # closed buckets answered from the cache
+    misses: int  # closed buckets queried from the database
+    tail: int  # open buckets queried from the database
+    evictions: int  # buckets evicted due to the memory cap
+
+    def __init__(self, bucket_seconds=3600, max_bytes=64 * 2**20, lateness=60.0):
+        """
+        Initialize the cache.
+
+        Args:
+            bucket_seconds (int): Length of a bucket in seconds (an hour by
+                default).
+            max_bytes (int): Memory cap of the cached results (64 MiB by
+                default).
+            lateness (float): Seconds after its end a bucket is considered
+                closed, readings may arrive late.
+        """
+
+        self.bucket_seconds = int(bucket_seconds)
+        self.max_bytes = max_bytes
+        self.lateness = lateness
+
+        self._entries = OrderedDict()
+        self._bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.tail = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def buckets(self, start, end) -> list[int]:
+        """
+        Return the buckets covering the range.
+
+        Args:
+            start (pd.Timestamp): Start of the range.
+            end (pd.Timestamp): End of the range (exclusive).
+
+        Returns:
+            list[int]: Start of every bucket, in seconds since the epoch.
+        """
+
+        first = (
+            math.floor(start.timestamp() / self.bucket_seconds) * self.bucket_seconds
+        )
+        return list(range(first, math.ceil(end.timestamp()), self.bucket_seconds))
+
+    def bucket_time(self, bucket) -> pd.Timestamp:
+        """Return the start of the bucket as a timestamp."""
+        return pd.to_datetime(bucket, unit="s", utc=True)
+
+    def closed(self, bucket, now) -> bool:
+        """
+        Whether the bucket is complete, thus can be cached.
+
+        Args:
+            bucket (int): Start of the bucket in seconds since the epoch.
+            now (pd.Timestamp): The current time.
+        """
+
+        return bucket + self.bucket_seconds + self.lateness <= now.timestamp()
+
+    def get(self, key, bucket) -> pd.DataFrame | None:
+        """
+        Return the cached result of the closed bucket, None if there is none.
+
+        Args:
+            key (str): Query the result belongs to.
+            bucket (int): Start of the bucket in seconds since the epoch.
+        """
+
+        entry = self._entries.get((key, bucket))
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end((key, bucket))
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key, bucket, frame):
+        """
+        Cache the result of the closed bucket, evicting the least recently
+        used buckets over the memory cap.
+
+        Args:
+            key (str): Query the result belongs to.
+            bucket (int): Start of the bucket in seconds since the epoch.
+            frame (pd.DataFrame): The result.
+        """
+
+        size = int(frame.memory_usage(deep=True).sum())
+        if size > self.max_bytes:
+            return
+
+        previous = self._entries.pop((key, bucket), None)
+        if previous is not None:
+            self._bytes -= previous[1]
+
+        self._entries[(key, bucket)] = (frame, size)
+        self._bytes += size
+
+        while self._bytes > self.max_bytes:
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self._bytes -= evicted
+            self.evictions += 1
+
+    def split(self, frame, buckets, window_end=False) -> dict[int, pd.DataFrame]:
+        """
+        Split the result of a query over consecutive buckets by bucket.
+
+        Args:
+            frame (pd.DataFrame): The result, with the time column.
+            buckets (list[int]): The buckets the query covered.
+            window_end (bool): Whether rows are timed by the end of their
+                aggregation window, i.e. belong to (start, end] of a bucket.
+
+        Returns:
+            dict[int, pd.DataFrame]: Rows of every bucket.
+        """
+
+        if frame.empty:
+            return {bucket: frame for bucket in buckets}
+
+        nanoseconds = frame["time"].astype("int64").to_numpy()
+        parts = {}
+        for bucket in buckets:
+            start = bucket * 1_000_000_000
+            end = (bucket + self.bucket_seconds) * 1_000_000_000
+            if window_end:
+                mask = (nanoseconds > start) & (nanoseconds <= end)
+            else:
+                mask = (nanoseconds >= start) & (nanoseconds < end)
+            parts[bucket] = frame[mask].reset_index(drop=True)
+        return parts
+
+    def clear(self):
+        """Drop every cached result."""
+        self._entries.clear()
+        self._bytes = 0
+
+    def stats(self) -> dict:
+        """
+        Return the hit and miss counters and the memory used.
+        """
+
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "tail": self.tail,
+            "evictions": self.evictions,
+            "buckets": len(self._entries),
+            "bytes": self._bytes,
+        }
@@ -0,0 +1,145 @@
+"""
+Cache of the latest reading of every device, fed by the fetcher, answering
+queries for the latest measurement without reaching the database.
+
+Author: Piotr Krzysztof Lis - github.com/straightchlorine
+"""
+
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+from dateutil.tz import tzlocal
+
+
+class LatestCache:
+    """
+    Latest decoded reading of every device.
+
+    Readings are published by the fetcher as soon as they are decoded. Those
+    older than max_age are considered stale. A query is answered only if the
+    reading of every requested device (or every known device) is fresh,
+    otherwise the cache is cold and the database has to be queried instead,
+    so no device is silently left out. The cache is fed only by a fetcher
+    running within the same process, see DatabaseInterface.start_fetching().
+
+    Readings are kept behind a lock, so the fetcher might publish them from
+    another thread than the one queries are answered in.
+
+    Attributes:
+        max_age (float): Seconds after which a reading is considered stale.
+        _readings (dict[str, tuple[Reading, tuple[str]]]): Latest reading and
+            names of its values, by device name.
+        hits (int): Queries answered from the cache.
+        misses (int): Queries the cache was cold for.
+    """
+
+    max_age: float  # seconds after which a reading is considered stale
+
+    hits: int  # queries answered from the cache
+    misses: int  # queries the cache was cold for
+
+    def __init__(self, max_age=5.0):
+        """
+        Initialize the cache.
+
+        Args:
+            max_age (float): Seconds after which a reading is considered
+                stale (5 seconds by default).
+        """
+
+        self.max_age = max_age
+        self._readings = {}
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._readings)
+
+    def update(self, reading, fields):
+        """
+        Keep the reading, unless a newer one of the device is already kept.
+
+        Args:
+            reading (Reading): The decoded sensor readings.
+            fields (tuple[str]): Names of the values, in their order.
+        """
+
+        with self._lock:
+            current = self._readings.get(reading.device)
+            if current is None or current[0].timestamp <= reading.timestamp:
+                self._readings[reading.device] = (reading, fields)
+
+    def frame(self, now=None, fields=None, devices=None) -> pd.DataFrame | None:
+        """
+        Return the fresh readings in the form of AsyncQuery.latest().
+
+        Args:
+            now (int): The current time in nanoseconds (now by default).
+            fields (list[str]): Parameters to return (every one by default).
+            devices (list[str]): Devices to return (every one by default).
+
+        Returns:
+            pd.DataFrame: Latest reading of every device, None if the cache is
+                cold (the reading of a device is stale or missing).
+        """
+
+        if now is None:
+            now = time.time_ns()
+        oldest = now - int(self.max_age * 1_000_000_000)
+
+        with self._lock:
+            if devices is None:
+                kept = list(self._readings.values())
+            else:
+                kept = [self._readings.get(device) for device in dict.fromkeys(devices)]
+        fresh = [
+            entry
+            for entry in kept
+            if entry is not None and entry[0].timestamp >= oldest
+        ]
+        if not fresh or len(fresh) < len(kept):
+            self.misses += 1
+            return None
+        self.hits += 1
+
+        # parameters in the order of their first appearance
+        columns = {}
+        for _, names in fresh:
+            for name in names:
+                columns.setdefault(name, len(columns))
+
+        matrix = np.full((len(fresh), len(columns)), np.nan)
+        for row, (reading, names) in enumerate(fresh):
+            matrix[row, [columns[name] for name in names]] = reading.values
+
+        frame = pd.DataFrame(matrix, columns=pd.Index(list(columns)))
+        if fields is not None:
+            frame = frame.loc[:, [field for field in columns if field in fields]]
+        # every requested device has a row, the column tells several apart
+        several = len(fresh) > 1
+        if several:
+            frame["device"] = np.array([r.device for r, _ in fresh], dtype=object)
+
+        frame["time"] = pd.DatetimeIndex(
+            pd.to_datetime([r.timestamp for r, _ in fresh], unit="ns", utc=True)
+        ).tz_convert(tzlocal())
+
+        if several:
+            frame = frame.sort_values(["time", "device"], ignore_index=True)
+        return frame
+
+    def clear(self):
+        """Drop every kept reading."""
+        with self._lock:
+            self._readings.clear()
+
+    def stats(self) -> dict:
+        """
+        Return the hit and miss counters and the number of devices kept.
+        """
+
+        return {"hits": self.hits, "misses": self.misses, "devices": len(self)}
@@ -0,0 +1,309 @@
+"""
+Fixed-capacity ring buffers of recent readings, fed by the fetcher, answering
+queries of the last minutes without reaching the database.
+
+Author: Piotr Krzysztof Lis - github.com/straightchlorine
+"""
+
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+
+class RingBuffer:
+    """
+    Latest readings of a single device, a column per parameter.
+
+    Timestamps and values are kept in preallocated arrays of twice the
+    capacity, every reading is written twice, capacity apart. Any window of
+    the buffer is thus a contiguous slice of the arrays, so views of it are
+    returned without copying.
+
+    Attributes:
+        fields (tuple[str]): Names of the parameters, in the order of columns.
+        capacity (int): Number of readings kept.
+        _times (np.ndarray): Timestamps in nanoseconds since the epoch.
+        _values (np.ndarray): Values, a column per parameter.
+        _start (int): Position of the oldest reading.
+        _size (int): Number of readings kept.
+        dropped (int): Readings older than the latest one, which were dropped.
+    """
+
+    fields: tuple[str, ...]  # names of the parameters in the order of columns
+    capacity: int  # number of readings kept
+
+    _times: np.ndarray  # int64 timestamps in nanoseconds since the epoch
+    _values: np.ndarray  # float64 values, a column per parameter
+
+    dropped: int  # readings older than the latest one
+
+    def __init__(self, fields, capacity):
+        """
+        Initialize the buffer.
+
+        Args:
+            fields (tuple[str]): Names of the parameters.
+            capacity (int): Number of readings kept.
+        """
+
+        if capacity < 1:
+            raise ValueError("capacity must be positive")
+
+        self.fields = tuple(fields)
+        self.capacity = capacity
+        self._columns = {field: i for i, field in enumerate(self.fields)}
+
+        self._times = np.zeros(2 * capacity, dtype=np.int64)
+        self._values = np.full((2 * capacity, len(self.fields)), np.nan)
+        self._start = 0
+        self._size = 0
+
+        self.dropped = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def append(self, timestamp, values):
+        """
+        Add the reading, overwriting the oldest one if the buffer is full.
+
+        Readings must arrive in the order of time, older ones are dropped.
+
+        Args:
+            timestamp (int): Time of the reading in nanoseconds.
+            values (array): Values in the order of the fields.
+        """
+
+        if self._size and timestamp < self._times[self._start + self._size - 1]:
+            self.dropped += 1
+            return
+
+        if self._size < self.capacity:
+            position = (self._start + self._size) % self.capacity
+            self._size += 1
+        else:
+            position = self._start
+            self._start = (self._start + 1) % self.capacity
+
+        for offset in (position, position + self.capacity):
+            self._times[offset] = timestamp
+            self._values[offset] = values
+
+    @property
+    def oldest(self) -> int | None:
+        """Time of the oldest reading kept, None if the buffer is empty."""
+        return int(self._times[self._start]) if self._size else None
+
+    @property
+    def newest(self) -> int | None:
+        """Time of the latest reading kept, None if the buffer is empty."""
+        if not self._size:
+            return None
+        return int(self._times[self._start + self._size - 1])
+
+    def view(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Return the read-only views of the timestamps and the values, from the
+        oldest reading to the latest one.
+        """
+
+        return self._read_only(self._start, self._start + self._size)
+
+    def slice(self, start, end) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Return the read-only views of the readings within the range.
+
+        Args:
+            start (int): Start of the range in nanoseconds.
+            end (int): End of the range (exclusive) in nanoseconds.
+        """
+
+        times = self._times[self._start : self._start + self._size]
+        first = self._start + int(np.searchsorted(times, start, side="left"))
+        last = self._start + int(np.searchsorted(times, end, side="left"))
+        return self._read_only(first, last)
+
+    def column(self, field) -> np.ndarray:
+        """Return the read-only view of values of the parameter."""
+        return self.view()[1][:, self._columns[field]]
+
+    def _read_only(self, first, last) -> tuple[np.ndarray, np.ndarray]:
+        """Return the views of the positions, which cannot be written into."""
+        times = self._times[first:last]
+        values = self._values[first:last]
+        times.flags.writeable = False
+        values.flags.writeable = False
+        return times, values
+
+
+class RecentReadings:
+    """
+    Ring buffer of recent readings of every device.
+
+    Readings are published by the fetcher as soon as they are decoded. A range
+    can be answered if it starts with or after the first reading received,
+    none of its readings were overwritten yet and the latest reading of every
+    device is at most an interval older than the end of the range (or now),
+    other ranges are left to the database. The latter fails once the fetcher
+    stops, so stale readings are never returned.
+
+    The buffers hold only the readings of the fetcher of this process, thus
+    they answer queries correctly only if it is the only writer of the
+    bucket.
+
+    Buffers are kept behind a lock, so the fetcher might publish readings
+    from another thread than the one queries are answered in, the returned
+    readings are copied.
+
+    Attributes:
+        capacity (int): Number of readings kept per device.
+        interval (float): Seconds between readings of a device.
+        since (int): Time of the first reading received, in nanoseconds.
+        _buffers (dict[str, RingBuffer]): Buffer of every device by name.
+        hits (int): Ranges answered from the buffers.
+        misses (int): Ranges not covered by the buffers.
+    """
+
+    capacity: int  # number of readings kept per device
+    interval: float  # seconds between readings of a device
+    since: int | None  # time of the first reading received, in nanoseconds
+
+    hits: int  # ranges answered from the buffers
+    misses: int  # ranges not covered by the buffers
+
+    def __init__(self, capacity=3600, interval=1.0):
+        """
+        Initialize the store.
+
+        Args:
+            capacity (int): Number of readings kept per device (an hour of
+                readings taken every second by default).
+            interval (float): Seconds between readings of a device, the
+                longest one if they differ.
+        """
+
+        self.capacity = capacity
+        self.interval = interval
+        self.since = None
+        self._buffers = {}
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._buffers)
+
+    def update(self, reading, fields):
+        """
+        Add the reading into the buffer of its device.
+
+        Args:
+            reading (Reading): The decoded sensor readings.
+            fields (tuple[str]): Names of the values, in their order.
+        """
+
+        with self._lock:
+            buffer = self._buffers.get(reading.device)
+            if buffer is None or buffer.fields != tuple(fields):
+                buffer = RingBuffer(fields, self.capacity)
+                self._buffers[reading.device] = buffer
+
+            if self.since is None:
+                self.since = reading.timestamp
+            buffer.append(reading.timestamp, reading.values)
+
+    def buffer(self, device) -> RingBuffer | None:
+        """Return the buffer of the device, None if it sent no readings."""
+        return self._buffers.get(device)
+
+    def covers(self, start, end, now=None, devices=None) -> bool:
+        """
+        Whether every reading within the range is kept.
+
+        Args:
+            start (int): Start of the range in nanoseconds.
+            end (int): End of the range (exclusive) in nanoseconds.
+            now (int): The current time in nanoseconds (now by default).
+            devices (list[str]): Devices of the range (every one by default).
+        """
+
+        with self._lock:
+            return self._covers(start, end, now, devices)
+
+    def _covers(self, start, end, now, devices) -> bool:
+        """Implementation of covers(), the lock has to be held."""
+        if self.since is None or start < self.since:
+            return False
+
+        if now is None:
+            now = time.time_ns()
+        latest = min(end, now) - int(self.interval * 1_000_000_000)
+
+        # devices the fetcher did not publish any reading of are left out
+        if devices is not None and not all(d in self._buffers for d in devices):
+            return False
+
+        buffers = [
+            buffer
+            for device, buffer in self._buffers.items()
+            if devices is None or device in devices
+        ]
+        return all(
+            # a full buffer lost its readings older than the oldest kept one
+            (len(buffer) < buffer.capacity or buffer.oldest <= start)
+            # readings stopped arriving, e.g. the fetcher is not running
+            and buffer.newest >= latest
+            for buffer in buffers
+        )
+
+    def frame(
+        self, start, end, fields=None, devices=None, now=None
+    ) -> pd.DataFrame | None:
+        """
+        Return the readings within the range.
+
+        Args:
+            start (int): Start of the range in nanoseconds.
+            end (int): End of the range (exclusive) in nanoseconds.
+            fields (list[str]): Parameters to return (every one by default).
+            devices (list[str]): Devices to return (every one by default).
+            now (int): The current time in nanoseconds (now by default).
+
+        Returns:
+            pd.DataFrame: Readings with the device column and the time column
+                in UTC, None if the range is not covered by the buffers.
+        """
+
+        with self._lock:
+            if not self._covers(start, end, now, devices):
+                self.misses += 1
+                return None
+            self.hits += 1
+
+            frames = []
+            for device, buffer in self._buffers.items():
+                if devices is not None and device not in devices:
+                    continue
+
+                # copied, the buffer is overwritten once the lock is released
+                times, values = buffer.slice(start, end)
+                names = [f for f in buffer.fields if fields is None or f in fields]
+                columns = {n: values[:, buffer.fields.index(n)] for n in names}
+                frame = pd.DataFrame(columns, copy=True)
+                frame["device"] = device
+                frame["time"] = pd.to_datetime(times, unit="ns", utc=True)
+                frames.append(frame)
+
+        if not frames:
+            return pd.DataFrame(columns=pd.Index(["device", "time"]))
+        return pd.concat(frames, ignore_index=True)
+
+    def stats(self) -> dict:
+        """
+        Return the hit and miss counters and the number of devices kept.
+        """
+
+        return {"hits": self.hits, "misses": self.misses, "devices": len(self)}
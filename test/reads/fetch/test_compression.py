@@ -0,0 +1,88 @@
+"""
+Test class for ReadingCompressor.
+
+Author: Piotr Krzysztof Lis - github.com/straightchlorine
+"""
+
+import math
+from array import array
+
+import numpy as np
+import pytest
+
+from reads.fetch.compression import Deadband, ReadingCompressor, SwingingDoor
+from reads.fetch.schema import Reading
+
+SECOND = 1_000_000_000
+
+
+class TestCompression:
+    """
+    Test class for the compression filters and the ReadingCompressor class.
+    """
+
+    @staticmethod
+    def run(param_filter, values):
+        written = []
+        for second, value in enumerate(values):
+            written += param_filter.update(second * SECOND, value)
+        return [(t // SECOND, v) for t, v in written + param_filter.flush()]
+
+    def test_deadband(self):
+        written = self.run(Deadband(0.5), [10.0, 10.2, 10.4, 10.6, 10.7, 9.9])
+
+        assert written == [(0, 10.0), (3, 10.6), (5, 9.9)]
+
+    def test_deadband_heartbeat(self):
+        written = self.run(Deadband(0.5, heartbeat=2), [10.0] * 6)
+
+        assert written == [(0, 10.0), (2, 10.0), (4, 10.0)]
+
+    def test_swinging_door_linear_trend(self):
+        # points on a straight line are represented by its ends
+        written = self.run(SwingingDoor(0.1), [float(i) for i in range(10)])
+
+        assert written == [(0, 0.0), (9, 9.0)]
+
+    def test_swinging_door_breakpoint(self):
+        values = [0.0, 0.0, 0.0, 0.0, 5.0, 10.0, 15.0]
+        written = self.run(SwingingDoor(0.1), values)
+
+        assert written == [(0, 0.0), (3, 0.0), (6, 15.0)]
+
+    def test_swinging_door_ramp_then_heartbeat(self):
+        deviation = 0.1
+        values = [0.0, 1.0, 2.0, 3.0, 3.0, 3.0]
+        written = self.run(SwingingDoor(deviation, heartbeat=4), values)
+
+        # the end of the ramp is written before the heartbeat opens the doors
+        assert written == [(0, 0.0), (3, 3.0), (4, 3.0), (5, 3.0)]
+
+        # linear interpolation of the written points reconstructs the values
+        times, points = zip(*written)
+        reconstructed = np.interp(range(len(values)), times, points)
+        assert np.max(np.abs(reconstructed - values)) <= deviation
+
+    def test_heartbeat_bounds(self):
+        compressor = ReadingCompressor(("co2",), {"co2": {"mode": "swinging_door"}})
+        assert compressor._filters[0].heartbeat == 600 * SECOND
+
+        for heartbeat in (0, 3600, 7200):
+            with pytest.raises(ValueError):
+                ReadingCompressor(("co2",), {"co2": {"heartbeat": heartbeat}})
+
+    def test_compressor(self):
+        compressor = ReadingCompressor(
+            ("co2", "temperature", "altitude"),
+            {"altitude": {"mode": "deadband", "threshold": 1.0}},
+        )
+
+        first = compressor.compress(Reading("d", 0, array("d", [400.0, 20.0, 150.0])))
+        second = compressor.compress(
+            Reading("d", SECOND, array("d", [401.0, 20.0, 150.2]))
+        )
+
+        assert [list(r.values) for r in first] == [[400.0, 20.0, 150.0]]
+        assert len(second) == 1
+        assert second[0].values[:2] == array("d", [401.0, 20.0])
+        assert math.isnan(second[0].values[2])
@@ -0,0 +1,142 @@
+"""
+Test class for AsyncFleetFetcher.
+
+Author: Piotr Krzysztof Lis - github.com/straightchlorine
+"""
+
+import asyncio
+import json
+
+import pytest
+
+from reads.fetch.async_fleet import AsyncFleetFetcher
+from reads.fetch.device import Device
+
+
+class TestFleet:
+    """
+    Test class for the AsyncFleetFetcher class.
+
+    Attributes:
+        sensors (dict): Sensors of the tested devices.
+        batches (list[list[str]]): Batches passed to the database.
+        active (int): Requests currently in progress.
+        peak (int): Maximum number of requests in progress at once.
+    """
+
+    sensors: dict = {"bmp180": ["temperature"]}
+    batches: list[list[str]]
+    active: int
+    peak: int
+
+    def set_up(self, devices=3, failing=(), **kwargs):
+        fleet = AsyncFleetFetcher(
+            "localhost", 8086, "token", "org", "bucket",
+            [
+                Device("10.0.0.%d" % i, 80, "", self.sensors, f"dev{i}")
+                for i in range(devices)
+            ],
+            batch_size=1, **kwargs
+        )  # fmt: skip
+        self.batches = []
+        self.active = 0
+        self.peak = 0
+
+        async def write_to_db(batch, bucket=None):
+            self.batches.append(batch)
+
+        async def request(session, url=None):
+            if any(url.startswith(f"http://10.0.0.{i}:") for i in failing):
+                raise RuntimeError("device failure")
+
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+            await asyncio.sleep(0.02)
+            self.active -= 1
+
+            value = url.split(".")[3].split(":")[0]
+            return json.dumps({"nodemcu": {"bmp180": {"temperature": value}}})
+
+        fleet._write_to_db = write_to_db
+        fleet._request_sensor_readings = request
+        return fleet
+
+    def written(self) -> list[str]:
+        return [record for batch in self.batches for record in batch]
+
+    def test_requires_unique_devices(self):
+        device = Device("10.0.0.1", 80, "", self.sensors, "dev")
+
+        with pytest.raises(ValueError):
+            AsyncFleetFetcher("localhost", 8086, "t", "o", "b", [])
+        with pytest.raises(ValueError):
+            AsyncFleetFetcher("localhost", 8086, "t", "o", "b", [device, device])
+
+    @pytest.mark.asyncio
+    async def test_concurrency_bounded(self):
+        fleet = self.set_up(devices=10, max_concurrency=3)
+
+        async with fleet:
+            await asyncio.gather(*(fleet._request_and_store(d) for d in fleet.devices))
+            await fleet._queue.join()
+
+        assert self.peak == 3
+        assert len(self.written()) == 10
+
+    @pytest.mark.asyncio
+    async def test_readings_tagged_per_device(self):
+        fleet = self.set_up(devices=3)
+
+        async with fleet:
+            await asyncio.gather(*(fleet._request_and_store(d) for d in fleet.devices))
+
+        # records without their timestamps
+        assert sorted(r.rsplit(" ", 1)[0] for r in self.written()) == [
+            f"sensor_data,device=dev{i} temperature={i}.0" for i in range(3)
+        ]
+
+    @pytest.mark.asyncio
+    async def test_failing_device_isolated(self):
+        fleet = self.set_up(devices=3, failing=(1,), interval=0.05)
+
+        async with fleet:
+            loop = asyncio.create_task(fleet._fetching_loop())
+            await asyncio.sleep(0.3)
+            loop.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await loop
+
+        stats = fleet.scheduler_stats()
+        assert stats["dev1"]["errors"] > 0
+        assert stats["dev0"]["completed"] > 0 and stats["dev2"]["completed"] > 0
+
+        devices = {
+            record.split(",device=")[1].split(" ")[0] for record in self.written()
+        }
+        assert devices == {"dev0", "dev2"}
+
+    def test_from_config(self):
+        fleet = AsyncFleetFetcher.from_config(
+            "localhost", 8086, "token", "org", "bucket",
+            [
+                {"ip": "10.0.0.1", "port": 80, "sensors": self.sensors},
+                {
+                    "ip": "10.0.0.2", "port": 8080, "handle": "data",
+                    "sensors": self.sensors, "name": "kitchen", "interval": 5.0,
+                    "token": "secret",
+                },
+            ],
+            max_concurrency=5,
+        )  # fmt: skip
+
+        first, second = fleet.devices
+        assert first.name == "10.0.0.1:80"
+        assert first.url == "http://10.0.0.1:80/"
+        assert first.interval is None and first.token is None
+
+        assert second.name == "kitchen"
+        assert second.url == "http://10.0.0.2:8080/data"
+        assert (second.interval, second.token) == (5.0, "secret")
+
+        assert fleet._max_concurrency == 5
+        assert fleet._connection_limit == 5
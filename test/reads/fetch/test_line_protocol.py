@@ -0,0 +1,53 @@
+"""
+Test class for LineProtocolEncoder.
+
+Author: Piotr Krzysztof Lis - github.com/straightchlorine
+"""
+
+from influxdb_client.client.write.point import Point
+
+from reads.fetch.line_protocol import LineProtocolEncoder
+
+
+class TestLineProtocol:
+    """
+    Test class for the LineProtocolEncoder class.
+    """
+
+    sensors = {
+        "bmp180": ["altitude", "pressure", "temperature", "seaLevelPressure"],
+        "mq135": ["aceton", "alcohol", "co", "co2", "nh4", "toulen"],
+    }
+    values = [149.56, 998.42, 26.0, 1016.34, 2.57, 6.62, 28.88, 412.1, 15.12, 3.14]
+
+    def test_matches_point(self):
+        encoder = LineProtocolEncoder(self.sensors)
+        line = encoder.encode("nodemcu", self.values, 1715000000000000000)
+
+        point = Point("sensor_data").tag("device", "nodemcu")
+        for field, value in zip(encoder.fields, self.values):
+            point.field(field, value)
+        point.time(1715000000000000000)
+
+        # same line, up to the order of the fields and the float formatting
+        def parse(line):
+            head, fields, timestamp = line.split(" ")
+            fields = {k: float(v) for k, v in (f.split("=") for f in fields.split(","))}
+            return head, fields, timestamp
+
+        assert parse(line) == parse(point.to_line_protocol())
+
+    def test_escaping(self):
+        encoder = LineProtocolEncoder({"s": ["a b", "c=d", "{e}"]}, measurement="m,1")
+        line = encoder.encode("dev 1", [1.0, 2.0, 3.0], 10)
+
+        assert line == r"m\,1,device=dev\ 1 a\ b=1.0,c\=d=2.0,{e}=3.0 10"
+
+    def test_non_finite_values_skipped(self):
+        encoder = LineProtocolEncoder({"s": ["a", "b"]})
+
+        assert (
+            encoder.encode("d", [float("nan"), 2.0], 10)
+            == "sensor_data,device=d b=2.0 10"
+        )
+        assert encoder.encode("d", [float("inf"), float("nan")], 10) is None
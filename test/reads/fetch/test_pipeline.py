@@ -0,0 +1,113 @@
+"""
+Test class for the queue between polling and writing within AsyncReadFetcher.
+
+Author: Piotr Krzysztof Lis - github.com/straightchlorine
+"""
+
+import asyncio
+from array import array
+
+import pytest
+
+from reads.fetch.async_fetch import AsyncReadFetcher
+from reads.fetch.schema import Reading
+
+
+class TestPipeline:
+    """
+    Test class for the overflow policies and the writers of AsyncReadFetcher.
+
+    Attributes:
+        sensors (dict): Sensors of the tested device.
+        batches (list[list[str]]): Batches passed to the database.
+    """
+
+    sensors: dict = {"bmp180": ["temperature"]}
+    batches: list[list[str]]
+
+    def set_up(self, **kwargs):
+        fetcher = AsyncReadFetcher(
+            "localhost", 8086, "token", "org", "bucket", self.sensors,
+            "localhost", 5000, **kwargs
+        )  # fmt: skip
+        self.batches = []
+
+        async def write_to_db(batch, bucket=None):
+            self.batches.append(batch)
+
+        fetcher._write_to_db = write_to_db
+        return fetcher
+
+    def reading(self, value):
+        return Reading("nodemcu", value, array("d", [float(value)]))
+
+    @pytest.mark.asyncio
+    async def test_drop_oldest(self):
+        fetcher = self.set_up(queue_size=2, overflow="drop_oldest")
+        fetcher._queue = asyncio.Queue(maxsize=2)
+
+        for i in range(4):
+            await fetcher._store_sensor_readings(self.reading(i), fetcher.devices[0])
+
+        assert fetcher.queue_depth == 2
+        assert [r.timestamp for r, _ in fetcher._queue._queue] == [2, 3]
+        assert fetcher.pipeline_stats()["dropped"] == 2
+
+    @pytest.mark.asyncio
+    async def test_spool_overflow(self, tmp_path):
+        fetcher = self.set_up(queue_size=1, overflow="spool", spool_dir=tmp_path)
+        fetcher._queue = asyncio.Queue(maxsize=1)
+
+        for i in range(3):
+            await fetcher._store_sensor_readings(self.reading(i), fetcher.devices[0])
+
+        fetcher._spools["bucket"].close()
+
+        assert fetcher.queue_depth == 1
+        assert fetcher.pipeline_stats()["spooled"] == 2
+        assert fetcher._spools["bucket"].pending > 0
+
+    def test_spool_overflow_requires_directory(self):
+        with pytest.raises(ValueError):
+            self.set_up(overflow="spool")
+
+    @pytest.mark.asyncio
+    async def test_writers_batch_readings(self):
+        fetcher = self.set_up(batch_size=3, flush_interval=50)
+        fetcher._queue = asyncio.Queue()
+
+        for i in range(4):
+            await fetcher._store_sensor_readings(self.reading(i), fetcher.devices[0])
+
+        writer = asyncio.create_task(fetcher._writer())
+        await asyncio.wait_for(fetcher._queue.join(), 1)
+        writer.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await writer
+
+        assert [len(batch) for batch in self.batches] == [3, 1]
+        assert self.batches[0][0] == "sensor_data,device=nodemcu temperature=0.0 0"
+
+    @pytest.mark.asyncio
+    async def test_failed_batch_does_not_stop_writer(self):
+        fetcher = self.set_up(batch_size=1, flush_interval=50)
+        fetcher._queue = asyncio.Queue()
+
+        async def write_to_db(batch, bucket=None):
+            if batch[0].endswith(" 0"):
+                raise OSError("spool cannot be written")
+            self.batches.append(batch)
+
+        fetcher._write_to_db = write_to_db
+        for i in range(3):
+            await fetcher._store_sensor_readings(self.reading(i), fetcher.devices[0])
+
+        writer = asyncio.create_task(fetcher._writer())
+        await asyncio.wait_for(fetcher._queue.join(), 1)
+
+        assert not writer.done()
+        writer.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await writer
+
+        assert [batch[0].rsplit(" ", 1)[1] for batch in self.batches] == ["1", "2"]
@@ -0,0 +1,148 @@
+"""
+Test class for Rollup.
+
+Author: Piotr Krzysztof Lis - github.com/straightchlorine
+"""
+
+import math
+from array import array
+from types import SimpleNamespace
+
+import pytest
+from influxdb_client.client.flux_table import FluxRecord, FluxTable
+
+from reads.fetch.async_fetch import AsyncReadFetcher
+from reads.fetch.rollup import Rollup
+from reads.fetch.schema import Reading
+
+SECOND = 1_000_000_000
+
+
+class TestRollup:
+    """
+    Test class for the Rollup class.
+    """
+
+    @staticmethod
+    def reading(second, co2, temperature):
+        return Reading("d", second * SECOND, array("d", [co2, temperature]))
+
+    def test_window_aggregates(self):
+        rollup = Rollup(("co2", "temperature"), window=60)
+
+        assert rollup.add(self.reading(60, 400.0, 20.0)) is None
+        assert rollup.add(self.reading(90, 410.0, math.nan)) is None
+        assert rollup.add(self.reading(119, 420.0, 22.0)) is None
+
+        closed = rollup.add(self.reading(120, 430.0, 23.0))
+
+        assert closed["min"].timestamp == 60 * SECOND
+        assert list(closed["min"].values) == [400.0, 20.0]
+        assert list(closed["max"].values) == [420.0, 22.0]
+        assert list(closed["mean"].values) == [410.0, 21.0]
+        assert list(closed["count"].values) == [3.0, 2.0]
+
+    def test_flush_incomplete_window(self):
+        rollup = Rollup(("co2", "temperature"), window=3600)
+        rollup.add(self.reading(10, 400.0, math.nan))
+
+        flushed = rollup.flush("d")
+
+        assert list(flushed["mean"].values)[0] == 400.0
+        assert math.isnan(flushed["mean"].values[1])
+        assert rollup.flush("d") is None
+
+    def test_late_reading_does_not_reopen_window(self):
+        rollup = Rollup(("co2", "temperature"), window=60)
+        rollup.add(self.reading(60, 400.0, 20.0))
+        rollup.add(self.reading(120, 410.0, 21.0))
+
+        assert rollup.add(self.reading(119, 1000.0, 99.0)) is None
+        assert rollup.late == 1
+        assert list(rollup.flush("d")["max"].values) == [410.0, 21.0]
+
+    def test_restart_merges_stored_window(self):
+        before = Rollup(("co2", "temperature"), window=60)
+        before.add(self.reading(60, 400.0, 20.0))
+        before.add(self.reading(70, 420.0, math.nan))
+        flushed = before.flush("d")
+
+        # aggregates flushed on stop, as stored in the bucket
+        stored = {stat: list(reading.values) for stat, reading in flushed.items()}
+
+        after = Rollup(("co2", "temperature"), window=60)
+        after.merge(after.window_start(80 * SECOND), stored)
+        after.add(self.reading(80, 410.0, 22.0))
+        closed = after.add(self.reading(120, 0.0, 0.0))
+
+        assert closed["min"].timestamp == 60 * SECOND
+        assert list(closed["min"].values) == [400.0, 20.0]
+        assert list(closed["max"].values) == [420.0, 22.0]
+        assert list(closed["mean"].values) == [410.0, 21.0]
+        assert list(closed["count"].values) == [3.0, 2.0]
+
+
+class TestFetcherRollup:
+    """
+    Test class for the rollups written by AsyncReadFetcher.
+
+    Attributes:
+        sensors (dict): Sensors of the tested device.
+        batches (dict[str, list[str]]): Records written, per bucket.
+        queries (list[str]): Queries of the stored aggregates.
+    """
+
+    sensors: dict = {"bmp180": ["temperature"]}
+    batches: dict[str, list[str]]
+    queries: list[str]
+
+    def set_up(self, stored):
+        fetcher = AsyncReadFetcher(
+            "localhost", 8086, "token", "org", "bucket", self.sensors,
+            "localhost", 5000, rollup_buckets={60: "sensors_1m"}
+        )  # fmt: skip
+        self.batches = {}
+
+        async def write_to_db(batch, bucket=None):
+            self.batches.setdefault(bucket, []).extend(batch)
+
+        fetcher._write_to_db = write_to_db
+        self.queries = []
+
+        async def query(query):
+            self.queries.append(query)
+            table = FluxTable()
+            table.records = [
+                FluxRecord(0, {"stat": stat, "_field": "temperature", "_value": v})
+                for stat, v in stored.items()
+            ]
+            return [table]
+
+        return fetcher, SimpleNamespace(query=query)
+
+    def payload(self, temperature) -> bytes:
+        return b'{"nodemcu": {"bmp180": {"temperature": "%d"}}}' % temperature
+
+    @pytest.mark.asyncio
+    async def test_restart_keeps_window_written_on_stop(self):
+        stored = {"min": 18.0, "max": 20.0, "mean": 19.0, "count": 2.0}
+        fetcher, query_api = self.set_up(stored)
+
+        await fetcher.start()
+        fetcher._client.query_api = lambda: query_api
+        device = fetcher.devices[0]
+        await fetcher.ingest(self.payload(22), device, 90 * SECOND)
+        await fetcher.ingest(self.payload(24), device, 100 * SECOND)
+        await fetcher.stop()
+
+        # the stored window is queried once, at the first reading
+        assert len(self.queries) == 1
+        assert "time(v: 60000000000)" in self.queries[0]
+
+        records = sorted(r.rsplit(" ", 1)[0] for r in self.batches["sensors_1m"])
+        assert records == [
+            "sensor_data,device=nodemcu,stat=count temperature=4.0",
+            "sensor_data,device=nodemcu,stat=max temperature=24.0",
+            "sensor_data,device=nodemcu,stat=mean temperature=21.0",
+            "sensor_data,device=nodemcu,stat=min temperature=18.0",
+        ]
@@ -0,0 +1,69 @@
+"""
+Test class for FixedRateScheduler.
+
+Author: Piotr Krzysztof Lis - github.com/straightchlorine
+"""
+
+import asyncio
+
+import pytest
+
+from reads.fetch.scheduler import FixedRateScheduler, ScheduledJob
+
+
+class TestScheduler:
+    """
+    Test class for the FixedRateScheduler class.
+    """
+
+    def test_ticks_aligned(self):
+        job = ScheduledJob("job", None, 0.5, offset=0.1)
+
+        tick = job.next_tick(100.05)
+        assert job.deadline(tick) == pytest.approx(100.1)
+
+        tick = job.next_tick(100.1)
+        assert job.deadline(tick) == pytest.approx(100.6)
+
+    def test_jitter_spreads_jobs(self):
+        scheduler = FixedRateScheduler(jitter=1.0, seed=1)
+        offsets = {scheduler.add(str(i), None, 1.0).offset for i in range(10)}
+
+        assert len(offsets) == 10
+        assert all(0 <= offset < 1.0 for offset in offsets)
+
+    @pytest.mark.asyncio
+    async def test_fixed_rate(self):
+        scheduler = FixedRateScheduler()
+
+        async def fast():
+            await asyncio.sleep(0.01)
+
+        job = scheduler.add("fast", fast, 0.05)
+        task = asyncio.create_task(scheduler.run())
+        await asyncio.sleep(0.52)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+        # the duration of a run does not delay the following ticks
+        assert 9 <= job.ticks <= 11
+        assert job.skipped == 0
+        assert scheduler.stats()["fast"]["target_rate"] == pytest.approx(20)
+
+    @pytest.mark.asyncio
+    async def test_overlapping_ticks_skipped(self):
+        scheduler = FixedRateScheduler()
+
+        async def slow():
+            await asyncio.sleep(0.12)
+
+        job = scheduler.add("slow", slow, 0.05)
+        task = asyncio.create_task(scheduler.run())
+        await asyncio.sleep(0.52)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+        assert job.skipped >= job.ticks
+        assert job.stats()["actual_rate"] < job.target_rate
@@ -0,0 +1,89 @@
+"""
+Test class for SensorSchema.
+
+Author: Piotr Krzysztof Lis - github.com/straightchlorine
+"""
+
+import json
+import math
+
+from reads.fetch.schema import SensorSchema
+
+
+class TestSchema:
+    """
+    Test class for the SensorSchema class.
+    """
+
+    sensors = {
+        "bmp180": ["altitude", "pressure", "temperature", "seaLevelPressure"],
+        "mq135": ["aceton", "alcohol", "co", "co2", "nh4", "toulen"],
+    }
+
+    # payload sent by the development server
+    example_json = {
+        "nodemcu": {
+            "bmp180": {
+                "altitude": "149.56",
+                "pressure": "998.42",
+                "seaLevelPressure": "1016.34",
+                "temperature": "26.00",
+            },
+            "mq135": {
+                "aceton": "2.57",
+                "alcohol": "6.62",
+                "co": "28.88",
+                "co2": "412.10",
+                "nh4": "15.12",
+                "toulen": "3.14",
+            },
+        }
+    }
+
+    def test_decode_payload(self):
+        schema = SensorSchema(self.sensors)
+        payload = json.dumps(self.example_json).encode()
+
+        reading = schema.decode_payload(payload, "nodemcu", 10)
+
+        assert reading.errors is None
+        assert reading.device == "nodemcu"
+        assert reading.timestamp == 10
+        assert dict(zip(schema.fields, reading.values)) == {
+            "altitude": 149.56,
+            "pressure": 998.42,
+            "temperature": 26.0,
+            "seaLevelPressure": 1016.34,
+            "aceton": 2.57,
+            "alcohol": 6.62,
+            "co": 28.88,
+            "co2": 412.1,
+            "nh4": 15.12,
+            "toulen": 3.14,
+        }
+
+    def test_errors_reported_per_field(self):
+        schema = SensorSchema(self.sensors)
+        data = {
+            "nodemcu": {
+                "bmp180": {"altitude": "1.5", "pressure": "n/a", "temperature": None}
+            }
+        }
+
+        reading = schema.decode(data, "nodemcu", 10)
+        values = dict(zip(schema.fields, reading.values))
+
+        assert values["altitude"] == 1.5
+        assert all(math.isnan(values[f]) for f in schema.fields if f != "altitude")
+        assert reading.errors["pressure"].startswith("malformed")
+        assert reading.errors["temperature"].startswith("malformed")
+        assert reading.errors["seaLevelPressure"] == "missing"
+        assert reading.errors["co2"] == "missing sensor 'mq135'"
+
+    def test_invalid_json(self):
+        schema = SensorSchema(self.sensors)
+
+        reading = schema.decode_payload(b"{not json", "nodemcu", 10)
+
+        assert set(reading.errors) == set(schema.fields)
+        assert all(math.isnan(value) for value in reading.values)
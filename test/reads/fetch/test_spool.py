@@ -0,0 +1,69 @@
+"""
+Test class for Spool.
+
+Author: Piotr Krzysztof Lis - github.com/straightchlorine
+"""
+
+import pytest
+
+from reads.fetch.spool import Spool
+
+
+class TestSpool:
+    """
+    Test class for the Spool class.
+    """
+
+    @staticmethod
+    def records(start, stop):
+        return [f"sensor_data,device=nodemcu co2={i}" for i in range(start, stop)]
+
+    @pytest.mark.asyncio
+    async def test_replay_in_batches(self, tmp_path):
+        spool = Spool(tmp_path, segment_size=100)
+        spool.append(self.records(0, 5))
+        spool.append(self.records(5, 10))
+        assert len(spool.segments()) > 1
+
+        batches = []
+
+        async def write(batch):
+            batches.append(batch)
+
+        replayed = await spool.replay(write, batch_size=3)
+
+        assert replayed == 10
+        assert [r for batch in batches for r in batch] == self.records(0, 10)
+        assert all(len(batch) <= 3 for batch in batches)
+        assert spool.segments() == []
+
+    @pytest.mark.asyncio
+    async def test_failed_replay_resumes(self, tmp_path):
+        spool = Spool(tmp_path)
+        spool.append(self.records(0, 6))
+
+        written = []
+
+        async def flaky_write(batch):
+            if len(written) == 2:
+                raise ConnectionError("database unavailable")
+            written.append(batch)
+
+        with pytest.raises(ConnectionError):
+            await spool.replay(flaky_write, batch_size=2)
+        assert spool.pending > 0
+
+        async def write(batch):
+            written.append(batch)
+
+        assert await spool.replay(write, batch_size=2) == 2
+        assert [r for batch in written for r in batch] == self.records(0, 6)
+
+    def test_segments_survive_restart(self, tmp_path):
+        with Spool(tmp_path) as spool:
+            spool.append(self.records(0, 3))
+
+        with Spool(tmp_path) as reopened:
+            reopened.append(self.records(3, 4))
+
+            assert len(reopened.segments()) == 2
@@ -0,0 +1,201 @@
+"""
+Test class for FetcherSupervisor and its worker processes.
+
+Author: Piotr Krzysztof Lis - github.com/straightchlorine
+"""
+
+import asyncio
+import itertools
+import queue
+
+import pytest
+
+from reads.fetch import supervisor as supervisor_module
+from reads.fetch.device import Device
+from reads.fetch.supervisor import FetcherSupervisor, _work
+
+_pids = itertools.count(1000)
+
+
+class FakeProcess:
+    """Worker process, alive until stopped by a command or killed."""
+
+    def __init__(self, commands):
+        self.commands = commands
+        self.pid = next(_pids)
+        self.exitcode = None
+
+    def is_alive(self) -> bool:
+        if self.exitcode is None and ("stop", None) in self.commands.sent:
+            self.exitcode = 0
+        return self.exitcode is None
+
+    def join(self, timeout=None):
+        pass
+
+    def terminate(self):
+        self.exitcode = -15
+
+
+class FakeQueue(queue.Queue):
+    """Queue of commands, remembering every command sent."""
+
+    def __init__(self):
+        super().__init__()
+        self.sent = []
+
+    def put(self, item, block=True, timeout=None):
+        self.sent.append(item)
+        super().put(item, block, timeout)
+
+    def close(self):
+        pass
+
+
+class TestSupervisor:
+    """
+    Test class for the FetcherSupervisor class.
+
+    Attributes:
+        devices (list[Device]): Devices of the tested fleet.
+    """
+
+    devices: list[Device]
+
+    def set_up(self, count=100, **kwargs):
+        sensors = {"bmp180": ["temperature"]}
+        self.devices = [
+            Device("localhost", 5000, f"dev{i}", sensors, f"dev{i}")
+            for i in range(count)
+        ]
+        kwargs.setdefault("workers", 4)
+        return FetcherSupervisor(
+            "localhost", 8086, "token", "org", "bucket", self.devices, **kwargs
+        )
+
+    def fake_processes(self, supervisor):
+        """Replace the worker processes and queues by in-process fakes."""
+        supervisor._context = None
+
+        def spawn(worker):
+            worker.commands = FakeQueue()
+            worker.process = FakeProcess(worker.commands)
+            worker.report = None
+
+        supervisor._spawn = spawn
+        supervisor._status = queue.Queue()
+
+    def test_every_device_is_assigned_once(self):
+        supervisor = self.set_up()
+
+        shards = supervisor._assign(4)
+
+        names = sorted(device.name for shard in shards for device in shard)
+        assert names == sorted(device.name for device in self.devices)
+        assert all(shards)
+
+    def test_scaling_moves_only_necessary_devices(self):
+        supervisor = self.set_up()
+
+        before = supervisor._assign(4)
+        after = supervisor._assign(5)
+
+        # devices either stay or move to the new worker
+        for slot in range(4):
+            kept = {d.name for d in after[slot]}
+            assert kept <= {d.name for d in before[slot]}
+        moved = sum(len(before[slot]) - len(after[slot]) for slot in range(4))
+        assert moved == len(after[4])
+
+    def test_unique_names_are_required(self):
+        self.set_up()
+        with pytest.raises(ValueError):
+            FetcherSupervisor(
+                "localhost", 8086, "token", "org", "bucket", self.devices * 2
+            )
+
+    @pytest.mark.asyncio
+    async def test_exited_worker_is_restarted(self):
+        supervisor = self.set_up(restart_delay=0)
+        self.fake_processes(supervisor)
+        supervisor._running = True
+        await supervisor._rebalance(4)
+
+        crashed = supervisor._workers[1]
+        pid = crashed.process.pid
+        crashed.process.exitcode = 1
+        supervisor._check()
+
+        assert crashed.restarts == 1
+        assert crashed.process.is_alive() and crashed.process.pid != pid
+        assert [w.restarts for w in supervisor._workers] == [0, 1, 0, 0]
+
+    @pytest.mark.asyncio
+    async def test_scale_rebalances_workers(self):
+        supervisor = self.set_up()
+        self.fake_processes(supervisor)
+        supervisor._running = True
+        await supervisor._rebalance(4)
+        workers = list(supervisor._workers)
+
+        await supervisor.scale(5)
+
+        # existing workers are reassigned the devices they keep
+        assert len(supervisor._workers) == 5
+        for worker, devices in zip(workers, supervisor._assign(5)):
+            assert worker.commands.sent == [("assign", devices)]
+        assert sum(len(w.devices) for w in supervisor._workers) == 100
+
+        await supervisor.scale(2)
+
+        assert len(supervisor._workers) == 2
+        for worker in workers[2:]:
+            assert worker.commands.sent[-1] == ("stop", None)
+            assert worker.process is None
+        assert sum(len(w.devices) for w in supervisor._workers) == 100
+
+    @pytest.mark.asyncio
+    async def test_worker_exits_when_fetcher_finishes(self, monkeypatch):
+        created = []
+
+        class FinishingFetcher:
+            def __init__(self, *args, devices, **kwargs):
+                created.append(devices)
+                self.devices = devices
+                self.queue_depth = 0
+
+            async def schedule_fetcher(self):
+                pass
+
+        monkeypatch.setattr(supervisor_module, "AsyncFleetFetcher", FinishingFetcher)
+        self.set_up(count=2)
+
+        # no command was sent, the worker ends instead of reading one
+        await asyncio.wait_for(
+            _work(0, self.devices, (), {}, queue.Queue(), queue.Queue(), 60), 1
+        )
+        assert created == [self.devices]
+
+    @pytest.mark.asyncio
+    async def test_worker_follows_commands(self, monkeypatch):
+        created = []
+
+        class PollingFetcher:
+            def __init__(self, *args, devices, **kwargs):
+                created.append(devices)
+                self.devices = devices
+                self.queue_depth = 0
+
+            async def schedule_fetcher(self):
+                await asyncio.Event().wait()
+
+        monkeypatch.setattr(supervisor_module, "AsyncFleetFetcher", PollingFetcher)
+        self.set_up(count=2)
+
+        commands = queue.Queue()
+        commands.put(("assign", self.devices[:1]))
+        commands.put(("stop", None))
+        await asyncio.wait_for(
+            _work(0, self.devices, (), {}, commands, queue.Queue(), 60), 1
+        )
+        assert created == [self.devices, self.devices[:1]]
@@ -0,0 +1,68 @@
+"""
+Test class for AsyncWriteBuffer.
+
+Author: Piotr Krzysztof Lis - github.com/straightchlorine
+"""
+
+import asyncio
+
+import pytest
+
+from reads.fetch.write_buffer import AsyncWriteBuffer
+
+
+class TestWriteBuffer:
+    """
+    Test class for the AsyncWriteBuffer class.
+
+    Attributes:
+        batches (list[list[str]]): Batches passed to the flush callback.
+    """
+
+    batches: list[list[str]]
+
+    def set_up(self, batch_size, flush_interval):
+        self.batches = []
+
+        async def flush_callback(batch):
+            self.batches.append(batch)
+
+        return AsyncWriteBuffer(flush_callback, batch_size, flush_interval)
+
+    @pytest.mark.asyncio
+    async def test_flush_on_size(self):
+        buffer = self.set_up(batch_size=3, flush_interval=60_000)
+
+        for i in range(7):
+            await buffer.add(f"m v={i}")
+
+        assert self.batches == [
+            ["m v=0", "m v=1", "m v=2"],
+            ["m v=3", "m v=4", "m v=5"],
+        ]
+        assert len(buffer) == 1
+
+    @pytest.mark.asyncio
+    async def test_flush_on_interval(self):
+        buffer = self.set_up(batch_size=100, flush_interval=50)
+        buffer.start()
+
+        await buffer.add("m v=1")
+        await buffer.add("m v=2")
+        assert self.batches == []
+
+        await asyncio.sleep(0.1)
+        assert self.batches == [["m v=1", "m v=2"]]
+
+        await buffer.close()
+
+    @pytest.mark.asyncio
+    async def test_flush_on_close(self):
+        buffer = self.set_up(batch_size=100, flush_interval=60_000)
+        buffer.start()
+
+        await buffer.add("m v=1")
+        await buffer.close()
+
+        assert self.batches == [["m v=1"]]
+        assert len(buffer) == 0
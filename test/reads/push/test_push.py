@@ -0,0 +1,265 @@
+"""
+Test class for AsyncPushServer.
+
+Author: Piotr Krzysztof Lis - github.com/straightchlorine
+"""
+
+import asyncio
+import json
+
+import aiohttp
+import pytest
+
+from reads.fetch.async_fetch import AsyncReadFetcher
+from reads.fetch.device import Device
+from reads.interface import DatabaseInterface
+from reads.push.async_push import AsyncPushServer
+
+
+class TestPush:
+    """
+    Test class for the AsyncPushServer class.
+
+    Attributes:
+        sensors (dict): Sensors of the tested device.
+        batches (list[list[str]]): Batches passed to the database.
+        buckets (list[str]): Buckets the batches were written into.
+    """
+
+    sensors: dict = {"bmp180": ["temperature"]}
+    batches: list[list[str]]
+    buckets: list[str]
+
+    def set_up(self, fetcher_options=None, **kwargs):
+        fetcher = AsyncReadFetcher(
+            "localhost", 8086, "token", "org", "bucket", self.sensors,
+            "localhost", 5000, batch_size=1, **(fetcher_options or {})
+        )  # fmt: skip
+        self.batches = []
+        self.buckets = []
+
+        async def write_to_db(batch, bucket=None):
+            self.batches.append(batch)
+            self.buckets.append(bucket)
+
+        fetcher._write_to_db = write_to_db
+
+        devices = [Device("10.0.0.1", 80, "", self.sensors, "kitchen", token="s3")]
+        kwargs.setdefault("http_port", 0)
+        return AsyncPushServer(fetcher, devices, host="127.0.0.1", **kwargs)
+
+    @staticmethod
+    def payload(value) -> bytes:
+        return json.dumps({"nodemcu": {"bmp180": {"temperature": value}}}).encode()
+
+    @staticmethod
+    def url(server, device="kitchen") -> str:
+        host, port = server._runner.addresses[0][:2]
+        return f"http://{host}:{port}/ingest/{device}"
+
+    def written(self) -> list[str]:
+        # records without their timestamps
+        return [r.rsplit(" ", 1)[0] for batch in self.batches for r in batch]
+
+    @pytest.mark.asyncio
+    async def test_http_readings_stored(self):
+        server = self.set_up()
+
+        async with server, aiohttp.ClientSession() as session:
+            headers = {"Authorization": "Token s3"}
+            async with session.post(
+                self.url(server), data=self.payload("21.5"), headers=headers
+            ) as response:
+                assert response.status == 202
+
+        assert self.written() == ["sensor_data,device=kitchen temperature=21.5"]
+        assert server.stats["accepted"] == 1
+
+    @pytest.mark.asyncio
+    async def test_http_rejects_unauthorized(self):
+        server = self.set_up()
+
+        async with server, aiohttp.ClientSession() as session:
+            for device, headers in (
+                ("kitchen", {}),
+                ("kitchen", {"Authorization": "Token wrong"}),
+                ("kitchen", {"Authorization": "Bearer s3"}),
+                ("garage", {"Authorization": "Token s3"}),
+            ):
+                async with session.post(
+                    self.url(server, device), data=self.payload("1"), headers=headers
+                ) as response:
+                    assert response.status == 401
+
+        assert server.stats["rejected"] == 4
+        assert self.batches == []
+
+    @pytest.mark.asyncio
+    async def test_http_backpressure(self):
+        # without workers the queue is never consumed
+        server = self.set_up(queue_size=1, workers=0)
+
+        async with server, aiohttp.ClientSession() as session:
+            headers = {"Authorization": "Token s3"}
+            statuses = []
+            for _ in range(2):
+                async with session.post(
+                    self.url(server), data=self.payload("1"), headers=headers
+                ) as response:
+                    statuses.append(response.status)
+                    retry_after = response.headers.get("Retry-After")
+
+        assert statuses == [202, 503]
+        assert retry_after == "1"
+        assert server.stats["dropped"] == 1
+
+    @pytest.mark.asyncio
+    async def test_udp_framing(self):
+        server = self.set_up(http_port=None, udp_port=0)
+
+        async with server:
+            address = server._transport.get_extra_info("sockname")
+            loop = asyncio.get_running_loop()
+            transport, _ = await loop.create_datagram_endpoint(
+                asyncio.DatagramProtocol, remote_addr=address
+            )
+            transport.sendto(b"kitchen s3\n" + self.payload("19.0"))
+            transport.sendto(b"kitchen wrong\n" + self.payload("20.0"))
+            transport.sendto(b"kitchen s3")
+            transport.close()
+
+            for _ in range(100):
+                if sum(server.stats.values()) == 3:
+                    break
+                await asyncio.sleep(0.01)
+
+        # the payload is everything after the first line, a datagram without
+        # one carries an empty payload, stored as an incomplete reading
+        assert server.stats["rejected"] == 1
+        assert server.stats["accepted"] == 2
+        assert self.written()[0] == "sensor_data,device=kitchen temperature=19.0"
+
+    @pytest.mark.asyncio
+    async def test_failed_payload_does_not_stop_workers(self):
+        server = self.set_up(http_port=None)
+        ingest = server._fetcher.ingest
+
+        async def flaky_ingest(payload, device, timestamp=None):
+            if payload == b"fail":
+                raise OSError("disk full")
+            await ingest(payload, device, timestamp)
+
+        server._fetcher.ingest = flaky_ingest
+        device = server._devices["kitchen"]
+
+        async with server:
+            server._enqueue(b"fail", device)
+            server._enqueue(self.payload("18.0"), device)
+            await asyncio.wait_for(server._queue.join(), 1)
+
+        assert server.stats["failed"] == 1
+        assert self.written() == ["sensor_data,device=kitchen temperature=18.0"]
+
+    @pytest.mark.asyncio
+    async def test_held_back_values_written_on_stop(self):
+        server = self.set_up(
+            {
+                "compression": {"*": {"mode": "swinging_door", "deviation": 5}},
+                "rollup_buckets": {3600: "rollup_1h"},
+            },
+            http_port=None,
+        )
+
+        async def stored_rollup(bucket, device, start, rollup):
+            return None
+
+        server._fetcher._stored_rollup = stored_rollup
+        device = server._devices["kitchen"]
+
+        async with server:
+            for value in ("1.0", "2.0", "3.0"):
+                server._enqueue(self.payload(value), device)
+            await asyncio.wait_for(server._queue.join(), 1)
+
+            # the pushing device is not polled by the fetcher
+            assert device not in server._fetcher.devices
+            assert self.written() == ["sensor_data,device=kitchen temperature=1.0"]
+
+        # the last point held back by the compression and the aggregates of
+        # the incomplete window
+        assert self.written()[1] == "sensor_data,device=kitchen temperature=3.0"
+        rollups = [
+            record
+            for batch, bucket in zip(self.batches, self.buckets)
+            if bucket == "rollup_1h"
+            for record in batch
+        ]
+        assert any("stat=mean temperature=2.0" in record for record in rollups)
+
+    @pytest.mark.asyncio
+    async def test_readings_dropped_while_stopping(self):
+        server = self.set_up(http_port=None)
+        fetcher = server._fetcher
+        device = server._devices["kitchen"]
+        release = asyncio.Event()
+
+        async def slow_write(batch, bucket=None):
+            await release.wait()
+            self.batches.append(batch)
+
+        fetcher._write_to_db = slow_write
+        await fetcher.ingest(self.payload("1.0"), device)
+
+        # the queue is drained while the reading arrives
+        stopping = asyncio.create_task(fetcher.stop())
+        await asyncio.sleep(0)
+        await fetcher.ingest(self.payload("2.0"), device)
+        release.set()
+        await stopping
+
+        assert not fetcher.started
+        assert self.written() == ["sensor_data,device=kitchen temperature=1.0"]
+
+
+class TestInterfacePush:
+    """
+    Test class for DatabaseInterface.enable_push().
+    """
+
+    sensors: dict = {"bmp180": ["temperature"]}
+
+    def set_up(self, **kwargs):
+        return DatabaseInterface(
+            "localhost", 8086, "token", "org", "bucket", self.sensors,
+            "10.0.0.1", 80, **kwargs
+        )  # fmt: skip
+
+    def test_requires_token(self):
+        interface = self.set_up()
+
+        with pytest.raises(ValueError):
+            interface.enable_push()
+
+    def test_token_of_single_device(self, monkeypatch):
+        interface = self.set_up()
+        served = []
+
+        async def serve(server):
+            served.append(server._devices)
+
+        monkeypatch.setattr(AsyncPushServer, "serve", serve)
+        interface.enable_push(token="s3")
+
+        assert served == [{"nodemcu": interface.devices[0]}]
+        assert interface.devices[0].token == "s3"
+
+    def test_fleet_tokens_per_device(self):
+        interface = self.set_up(
+            devices=[
+                Device("10.0.0.1", 80, "", self.sensors, "a", token="s1"),
+                Device("10.0.0.2", 80, "", self.sensors, "b"),
+            ]
+        )
+
+        with pytest.raises(ValueError):
+            interface.enable_push(token="s3")
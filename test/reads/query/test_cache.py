@@ -0,0 +1,153 @@
+"""
+Test class for the bucketed cache of historical query results.
+
+Author: Piotr Krzysztof Lis - github.com/straightchlorine
+"""
+
+import re
+
+import pandas as pd
+import pytest
+
+from reads.query.async_query import AsyncQuery, parse_flux_duration
+from reads.query.cache import QueryCache
+
+
+class TestQueryCache:
+    """
+    Test class for the QueryCache class and its use within AsyncQuery.
+
+    Attributes:
+        query (AsyncQuery): The query object.
+        ranges (list[tuple[str, str]]): Ranges queried from the database.
+    """
+
+    query: AsyncQuery
+    ranges: list[tuple[str, str]]
+
+    def set_up(self, **kwargs):
+        self.query = AsyncQuery(
+            "localhost",
+            8086,
+            "token",
+            "org",
+            "bucket",
+            {"bmp180": ["temperature"]},
+            cache=QueryCache(**kwargs),
+        )
+        self.ranges = []
+
+        # a reading every minute within the queried range
+        async def historical_frame(query, pivoted, device=False):
+            start, stop = re.search(r"start: (\S+), stop: (\S+)\)", query).groups()
+            self.ranges.append((start, stop))
+            times = pd.date_range(start, stop, freq="1min", inclusive="left")
+            return pd.DataFrame(
+                {"temperature": range(len(times)), "time": times.tz_convert("UTC")}
+            )
+
+        self.query._historical_frame = historical_frame
+
+    @pytest.mark.asyncio
+    async def test_closed_buckets_are_reused(self):
+        self.set_up(bucket_seconds=3600)
+
+        first = await self.query.historical_data(
+            "2024-01-01T00:30:00Z", "2024-01-01T03:00:00Z"
+        )
+        second = await self.query.historical_data(
+            "2024-01-01T00:30:00Z", "2024-01-01T03:00:00Z"
+        )
+
+        assert len(self.ranges) == 1
+        assert len(first) == len(second) == 150
+        assert first["time"].iloc[0] == pd.Timestamp("2024-01-01T00:30:00Z")
+        assert self.query.cache_stats()["hits"] == 3
+
+    @pytest.mark.asyncio
+    async def test_only_missing_buckets_are_queried(self):
+        self.set_up(bucket_seconds=3600)
+
+        await self.query.historical_data("2024-01-01T01:00:00Z", "2024-01-01T02:00:00Z")
+        frame = await self.query.historical_data(
+            "2024-01-01T00:00:00Z", "2024-01-01T03:00:00Z"
+        )
+
+        assert self.ranges[1:] == [
+            ("2024-01-01T00:00:00+00:00", "2024-01-01T01:00:00+00:00"),
+            ("2024-01-01T02:00:00+00:00", "2024-01-01T03:00:00+00:00"),
+        ]
+        assert frame["time"].is_monotonic_increasing
+        assert len(frame) == 180
+
+    @pytest.mark.asyncio
+    async def test_open_bucket_is_always_queried(self):
+        # without lateness only the bucket containing now is open
+        self.set_up(bucket_seconds=3600, lateness=0)
+
+        await self.query.historical_data("-2h", "now()")
+        await self.query.historical_data("-2h", "now()")
+
+        stats = self.query.cache_stats()
+        assert stats["tail"] == 2
+        assert len(self.ranges) == 2
+
+    @staticmethod
+    async def aggregated_frame(query, pivoted, device=False):
+        """
+        Mean of readings taken every minute, over windows aligned to the epoch
+        and clipped to the range, stamped by their end, as InfluxDB does.
+        """
+
+        start, stop = re.search(r"start: (\S+), stop: (\S+)\)", query).groups()
+        every = re.search(r"every: (\w+),", query).group(1)
+        every = int(parse_flux_duration(every) * 1_000_000_000)
+
+        times = pd.date_range(start, stop, freq="1min", inclusive="left")
+        nanoseconds = times.asi8
+        ends = (nanoseconds // every + 1) * every
+        ends = ends.clip(max=pd.Timestamp(stop).value)
+
+        minutes = nanoseconds // 60_000_000_000 % 1440  # minute of the day
+        frame = pd.DataFrame({"temperature": minutes})
+        frame = frame.groupby(ends).mean()
+        frame["time"] = pd.to_datetime(frame.index, utc=True)
+        return frame.reset_index(drop=True)
+
+    @pytest.mark.asyncio
+    async def test_partial_windows_match_uncached(self):
+        self.set_up(bucket_seconds=3600)
+        self.query._historical_frame = self.aggregated_frame
+        uncached = AsyncQuery(
+            "localhost", 8086, "token", "org", "bucket", {"bmp180": ["temperature"]}
+        )
+        uncached._historical_frame = self.aggregated_frame
+
+        # neither end is aligned to the window, nor to the cache buckets
+        args = ("2024-01-01T00:07:00Z", "2024-01-01T03:23:00Z", None, "10m")
+        expected = await uncached.historical_data(*args)
+        first = await self.query.historical_data(*args)
+        second = await self.query.historical_data(*args)
+
+        pd.testing.assert_frame_equal(first, expected)
+        pd.testing.assert_frame_equal(second, expected)
+        # whole windows from 00:10 to 03:20 are served from four buckets
+        assert self.query.cache_stats()["hits"] == 4
+
+        # the first window covers 00:07 - 00:10, the last one 03:20 - 03:23
+        assert expected["time"].iloc[0] == pd.Timestamp("2024-01-01T00:10:00Z")
+        assert expected["temperature"].iloc[0] == 8.0
+        assert expected["time"].iloc[-1] == pd.Timestamp("2024-01-01T03:23:00Z")
+        assert expected["temperature"].iloc[-1] == 201.0
+
+    def test_memory_cap(self):
+        frame = pd.DataFrame({"value": range(50)})
+        size = int(frame.memory_usage(deep=True).sum())
+        cache = QueryCache(max_bytes=2 * size)
+
+        for bucket in range(3):
+            cache.put("query", bucket, frame)
+
+        assert len(cache) == 2
+        assert cache.stats()["evictions"] == 1
+        assert cache.get("query", 0) is None
@@ -0,0 +1,129 @@
+"""
+Test class for the bulk decoding of csv query responses.
+
+Author: Piotr Krzysztof Lis - github.com/straightchlorine
+"""
+
+import io
+
+import pandas as pd
+import pytest
+from influxdb_client.client.flux_csv_parser import (
+    FluxCsvParser,
+    FluxSerializationMode,
+)
+
+from reads.query.async_query import AsyncQuery
+
+ANNOTATIONS = (
+    "#datatype,string,long,dateTime:RFC3339,double,string,string\r\n"
+    "#group,false,false,false,false,true,true\r\n"
+    "#default,_result,,,,,\r\n"
+)
+
+RESPONSE = (
+    ",result,table,_time,_value,_field,device\r\n"
+    ",,0,2024-01-01T00:00:01Z,20.5,temperature,a\r\n"
+    ",,0,2024-01-01T00:00:02Z,21.5,temperature,a\r\n"
+    ",,1,2024-01-01T00:00:01Z,1000,pressure,a\r\n"
+    ",,2,2024-01-01T00:00:00Z,19.5,temperature,b\r\n"
+    ",,2,2024-01-01T00:00:02Z,18.5,temperature,b\r\n"
+    "\r\n"
+)
+
+PIVOTED = (
+    ",result,table,_time,device,pressure,temperature\r\n"
+    ",,0,2024-01-01T00:00:00Z,a,1000,20.5\r\n"
+    ",,0,2024-01-01T00:01:00Z,a,1001,21.5\r\n"
+    "\r\n"
+)
+
+
+class TestCsvDecode:
+    """
+    Test class for the _csv_into_dataframe() method of the AsyncQuery class.
+
+    Attributes:
+        query (AsyncQuery): The query object.
+    """
+
+    query: AsyncQuery
+
+    def set_up(self):
+        self.query = AsyncQuery(
+            "localhost",
+            8086,
+            "token",
+            "org",
+            "bucket",
+            {"bmp180": ["temperature", "pressure"]},
+            raw_csv=True,
+        )
+
+    def flux_tables(self, response):
+        """Tables the client parses the response into."""
+        parser = FluxCsvParser(
+            response=io.BytesIO(response.encode()),
+            serialization_mode=FluxSerializationMode.tables,
+        )
+        with parser:
+            for _ in parser.generator():
+                pass
+        return parser.table_list()
+
+    def test_same_as_records(self):
+        self.set_up()
+
+        expected = self.query._into_dataframe(self.flux_tables(ANNOTATIONS + RESPONSE))
+        frame = self.query._csv_into_dataframe(RESPONSE)
+
+        pd.testing.assert_frame_equal(frame, expected)
+        assert list(frame.columns) == ["temperature", "pressure", "device", "time"]
+
+    def test_annotations_are_skipped(self):
+        self.set_up()
+
+        pd.testing.assert_frame_equal(
+            self.query._csv_into_dataframe(ANNOTATIONS + RESPONSE),
+            self.query._csv_into_dataframe(RESPONSE),
+        )
+
+    def test_pivoted(self):
+        self.set_up()
+
+        frame = self.query._csv_into_dataframe(PIVOTED, pivoted=True)
+        stored = self.query._csv_into_dataframe(PIVOTED, pivoted=True, device=True)
+
+        assert list(frame.columns) == ["temperature", "pressure", "time"]
+        assert frame["pressure"].tolist() == [1000.0, 1001.0]
+        assert stored["device"].tolist() == ["a", "a"]
+
+    def test_empty_response(self):
+        self.set_up()
+
+        frame = self.query._csv_into_dataframe("\r\n")
+
+        assert frame.empty
+        assert list(frame.columns) == ["time"]
+
+    @pytest.mark.asyncio
+    async def test_raw_response_is_requested(self):
+        self.set_up()
+        await self.query.start()
+        query_api = self.query._client.query_api()
+        requested = []
+
+        async def query_raw(query, dialect=None):
+            requested.append(dialect.annotations)
+            return RESPONSE
+
+        query_api.query_raw = query_raw
+        self.query._client.query_api = lambda: query_api
+
+        frame = await self.query.latest()
+        await self.query.stop()
+
+        # merged into the latest values, a row per device
+        assert requested == [[]]
+        assert frame["device"].tolist() == ["a", "b"]
+        assert frame["temperature"].tolist() == [21.5, 18.5]
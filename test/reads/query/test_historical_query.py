@@ -0,0 +1,166 @@
+"""
+Test class for the flux queries of historical data built by AsyncQuery.
+
+Author: Piotr Krzysztof Lis - github.com/straightchlorine
+"""
+
+import datetime
+
+import pytest
+from influxdb_client.client.flux_table import FluxRecord, FluxTable
+
+from reads.query.async_query import AsyncQuery, flux_string
+
+
+class TestHistoricalQuery:
+    """
+    Test class for the _historical_query() method of the AsyncQuery class.
+
+    Attributes:
+        query (AsyncQuery): The query object.
+    """
+
+    query: AsyncQuery
+
+    def set_up(self, rollup_buckets=None):
+        self.query = AsyncQuery(
+            "localhost",
+            8086,
+            "token",
+            "org",
+            "raw",
+            {"bmp180": ["temperature", "pressure"]},
+            rollup_buckets=rollup_buckets,
+        )
+
+    def test_raw_query(self):
+        self.set_up()
+
+        query, pivoted = self.query._historical_query("-1h", "now()")
+
+        assert query == 'from(bucket:"raw") |> range(start: -1h, stop: now())'
+        assert not pivoted
+
+    def test_aggregate_window(self):
+        self.set_up()
+
+        query, pivoted = self.query._historical_query("-1d", "now()", window="5m")
+
+        assert "aggregateWindow(every: 5m, fn: mean, createEmpty: false)" in query
+        assert 'pivot(rowKey: ["_time"], columnKey: ["_field"]' in query
+        assert pivoted
+
+    def test_window_from_points(self):
+        self.set_up(rollup_buckets={60: "rollup_1m"})
+
+        query, _ = self.query._historical_query(
+            "2024-01-01T00:00:00Z", "2024-01-31T00:00:00Z", fn="max", points=1000
+        )
+
+        assert query.startswith('from(bucket:"rollup_1m")')
+        assert 'r.stat == "max"' in query
+        assert "aggregateWindow(every: 2592s, fn: max" in query
+
+    def test_last_reads_raw_bucket(self):
+        self.set_up(rollup_buckets={60: "rollup_1m"})
+
+        query, _ = self.query._historical_query("-30d", "now()", fn="last", points=10)
+
+        assert query.startswith('from(bucket:"raw")')
+
+    def test_invalid_arguments(self):
+        self.set_up()
+
+        with pytest.raises(ValueError):
+            self.query._historical_query("-1d", "now()", window="5m", fn="median")
+        with pytest.raises(ValueError):
+            self.query._historical_query("-1d", "now()", window="5 minutes")
+
+    def test_pivoted_into_dataframe(self):
+        self.set_up()
+        table = FluxTable()
+        table.records = [
+            FluxRecord(
+                0,
+                {
+                    "_time": datetime.datetime.fromtimestamp(
+                        60 * i, datetime.timezone.utc
+                    ),
+                    "device": "nodemcu",
+                    "pressure": 1000.0 + i,
+                    "temperature": 20.0 + i,
+                },
+            )
+            for i in range(3)
+        ]
+
+        frame = self.query._pivoted_into_dataframe([table])
+
+        assert list(frame.columns) == ["temperature", "pressure", "time"]
+        assert frame["pressure"].tolist() == [1000.0, 1001.0, 1002.0]
+
+    def test_rows_of_several_tables(self):
+        self.set_up()
+        records = [
+            FluxRecord(
+                table,
+                {
+                    "_time": datetime.datetime.fromtimestamp(
+                        60 * i, datetime.timezone.utc
+                    ),
+                    "device": device,
+                    "temperature": 20.0 + i,
+                },
+            )
+            for table, device in enumerate(("a", "b"))
+            for i in range(2)
+        ]
+
+        frame = self.query._rows_into_dataframe(records)
+
+        assert list(frame.columns) == ["temperature", "device", "time"]
+        assert frame["device"].tolist() == ["a", "a", "b", "b"]
+
+    def test_selection_filter(self):
+        self.set_up(rollup_buckets={60: "rollup_1m"})
+
+        query, _ = self.query._historical_query(
+            "-30d",
+            "now()",
+            fn="max",
+            points=100,
+            selection=self.query._selection(params="pressure", device=["a", "b"]),
+        )
+
+        assert (
+            "|> range(start: -30d, stop: now())"
+            ' |> filter(fn: (r) => r._measurement == "sensor_data"'
+            ' and (r._field == "pressure")'
+            ' and (r.device == "a" or r.device == "b"))'
+        ) in query
+        assert 'r.stat == "max"' in query
+
+    def test_selection_filter_escapes_devices(self):
+        self.set_up()
+
+        device = 'a" or true or r.device == "${token}\\'
+        query, _ = self.query._historical_query(
+            "-1h", "now()", selection=self.query._selection(device=device)
+        )
+
+        assert r'(r.device == "a\" or true or r.device == \"\${token}\\")' in query
+        assert flux_string("plain") == '"plain"'
+
+    def test_selection(self):
+        self.set_up()
+
+        assert self.query._selection() is None
+        assert self.query._selection(sensors="bmp180") == (
+            ["temperature", "pressure"],
+            None,
+        )
+        assert self.query._selection(device="a") == (None, ["a"])
+        with pytest.raises(ValueError):
+            self.query._selection(sensors="mq135")
+        with pytest.raises(ValueError):
+            self.query._selection(params=["co2"])
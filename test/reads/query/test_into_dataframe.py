@@ -0,0 +1,115 @@
+"""
+Test class for turning query results into DataFrames within AsyncQuery.
+
+Author: Piotr Krzysztof Lis - github.com/straightchlorine
+"""
+
+import asyncio
+import datetime
+
+import numpy as np
+import pandas as pd
+from influxdb_client.client.flux_table import FluxRecord, FluxTable
+
+from reads.query.async_query import AsyncQuery
+
+
+class TestIntoDataFrame:
+    """
+    Test class for the _into_dataframe() method of the AsyncQuery class.
+
+    Attributes:
+        query (AsyncQuery): The query object.
+    """
+
+    query: AsyncQuery
+
+    def set_up(self):
+        self.query = AsyncQuery(
+            "localhost", 8086, "token", "org", "bucket", {"bmp180": ["t", "p"]}
+        )
+
+    def table(self, field, points, device="nodemcu"):
+        table = FluxTable()
+        table.records = [
+            FluxRecord(
+                0,
+                {
+                    "_time": datetime.datetime.fromtimestamp(
+                        second, datetime.timezone.utc
+                    ),
+                    "_value": value,
+                    "_field": field,
+                    "device": device,
+                },
+            )
+            for second, value in points
+        ]
+        return table
+
+    def test_values_are_aligned_by_time(self):
+        self.set_up()
+
+        frame = self.query._into_dataframe(
+            [
+                self.table("t", [(2, 20.0), (1, 10.0), (3, 30.0)]),
+                self.table("p", [(1, 1.0), (3, 3.0)]),
+            ]
+        )
+
+        assert list(frame.columns) == ["t", "p", "time"]
+        assert frame["t"].tolist() == [10.0, 20.0, 30.0]
+        assert np.isnan(frame["p"][1])
+        assert frame["p"][[0, 2]].tolist() == [1.0, 3.0]
+        assert frame["t"].dtype == np.float64
+        assert frame["time"].dt.tz is not None
+        assert frame["time"][0] == pd.Timestamp(1, unit="s", tz="UTC")
+
+    def test_devices_are_told_apart(self):
+        self.set_up()
+
+        frame = self.query._into_dataframe(
+            [
+                self.table("t", [(1, 10.0), (2, 20.0)], device="a"),
+                self.table("t", [(1, 11.0)], device="b"),
+            ]
+        )
+
+        assert list(frame.columns) == ["t", "device", "time"]
+        assert frame["device"].tolist() == ["a", "b", "a"]
+        assert frame["t"].tolist() == [10.0, 11.0, 20.0]
+
+    def test_empty_result(self):
+        self.set_up()
+
+        assert self.query._into_dataframe([]).empty
+
+    def test_latest_merged_per_device(self):
+        self.set_up()
+
+        tables = [
+            self.table("t", [(5, 20.0)], device="a"),
+            self.table("p", [(2, 1.0)], device="a"),
+            self.table("t", [(3, 21.0)], device="b"),
+        ]
+
+        async def shared_query(query, method, limited=False):
+            return tables
+
+        self.query._shared_query = shared_query
+
+        frame = asyncio.run(self.query.latest())
+        assert frame["device"].tolist() == ["b", "a"]
+        assert frame["t"].tolist() == [21.0, 20.0]
+        assert np.isnan(frame["p"][0]) and frame["p"][1] == 1.0
+        assert frame["time"].tolist() == [
+            pd.Timestamp(3, unit="s", tz="UTC"),
+            pd.Timestamp(5, unit="s", tz="UTC"),
+        ]
+
+        # fields of a single device written at different times
+        tables = tables[:2]
+        frame = asyncio.run(self.query.latest())
+        assert len(frame) == 1
+        assert (frame["t"][0], frame["p"][0]) == (20.0, 1.0)
+        assert frame["time"][0] == pd.Timestamp(5, unit="s", tz="UTC")
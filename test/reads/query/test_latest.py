@@ -0,0 +1,176 @@
+"""
+Test class for the cache of the latest readings published by the fetcher.
+
+Author: Piotr Krzysztof Lis - github.com/straightchlorine
+"""
+
+import asyncio
+import threading
+import time
+from array import array
+
+import pandas as pd
+import pytest
+
+from reads.fetch.schema import Reading
+from reads.interface import DatabaseInterface
+from reads.query.latest import LatestCache
+
+
+class TestLatestCache:
+    """
+    Test class for the LatestCache class and query_latest of the interface.
+
+    Attributes:
+        sensors (dict): Sensors of the tested device.
+        interface (DatabaseInterface): The tested interface.
+        queried (int): Number of queries passed to the database.
+    """
+
+    sensors: dict = {"bmp180": ["temperature", "pressure"]}
+    interface: DatabaseInterface
+    queried: int
+
+    def set_up(self, **kwargs):
+        self.interface = DatabaseInterface(
+            "localhost", 8086, "token", "org", "bucket", self.sensors,
+            "localhost", 5000, **kwargs
+        )  # fmt: skip
+        self.queried = 0
+
+        async def latest(sensors=None, params=None, device=None):
+            self.queried += 1
+            return pd.DataFrame(columns=["time"])
+
+        async def store(reading, device):
+            pass
+
+        self.interface.query_interface.latest = latest
+        self.interface._fetcher._store_sensor_readings = store
+
+    def payload(self, temperature):
+        return (
+            b'{"nodemcu": {"bmp180": {"temperature": "%d", "pressure": "1000"}}}'
+            % temperature
+        )
+
+    @pytest.mark.asyncio
+    async def test_latest_from_fetcher(self):
+        self.set_up()
+        fetcher = self.interface._fetcher
+        device = fetcher.devices[0]
+
+        await fetcher.ingest(self.payload(20), device)
+        await fetcher.ingest(self.payload(21), device)
+        frame = await self.interface.query_latest()
+
+        assert self.queried == 0
+        assert list(frame.columns) == ["temperature", "pressure", "time"]
+        assert frame["temperature"].tolist() == [21.0]
+
+    @pytest.mark.asyncio
+    async def test_cold_cache_falls_back_to_database(self):
+        self.set_up(latest_max_age=1.0)
+        fetcher = self.interface._fetcher
+
+        await self.interface.query_latest()
+        await fetcher.ingest(self.payload(20), fetcher.devices[0], 1)
+        await self.interface.query_latest()
+
+        assert self.queried == 2
+
+    @pytest.mark.asyncio
+    async def test_latest_while_fetching(self):
+        self.set_up()
+        fetcher = self.interface._fetcher
+        polled = asyncio.Event()
+
+        async def request(session, url):
+            polled.set()
+            return self.payload(22)
+
+        fetcher._request_sensor_readings = request
+
+        # the fetcher shares the event loop of the queries
+        task = await self.interface.start_fetching()
+        with pytest.raises(RuntimeError):
+            await self.interface.start_fetching()
+        await asyncio.wait_for(polled.wait(), 5)
+        await asyncio.sleep(0)
+        frame = await self.interface.query_latest()
+        await self.interface.close()
+
+        assert self.queried == 0
+        assert frame["temperature"].tolist() == [22.0]
+        assert task.cancelled() and not fetcher.started
+
+    def test_devices(self):
+        cache = LatestCache()
+        now = time.time_ns()
+        cache.update(Reading("a", now, array("d", [1.0])), ("temperature",))
+        cache.update(Reading("b", now - 1, array("d", [2.0])), ("pressure",))
+        cache.update(Reading("a", now - 2, array("d", [3.0])), ("temperature",))
+
+        frame = cache.frame(now)
+
+        assert frame["device"].tolist() == ["b", "a"]
+        assert frame["temperature"].tolist()[1] == 1.0
+        assert frame["pressure"].tolist()[0] == 2.0
+        assert cache.stats()["hits"] == 1
+
+    def test_stale_reading_makes_cache_cold(self):
+        cache = LatestCache(max_age=1.0)
+        now = time.time_ns()
+        cache.update(Reading("a", now, array("d", [1.0])), ("temperature",))
+        cache.update(Reading("b", now - 2 * 10**9, array("d", [2.0])), ("temperature",))
+
+        # a device must not be silently left out of the answer
+        assert cache.frame(now) is None
+        assert cache.frame(now, devices=["a", "b"]) is None
+        assert cache.frame(now, devices=["a", "c"]) is None
+        assert cache.frame(now, devices=["a"])["temperature"].tolist() == [1.0]
+        assert cache.stats()["misses"] == 3
+
+    def test_device_column_of_several_devices(self):
+        cache = LatestCache()
+        now = time.time_ns()
+        cache.update(Reading("a", now, array("d", [1.0])), ("temperature",))
+        cache.update(Reading("b", now, array("d", [2.0])), ("temperature",))
+
+        frame = cache.frame(now, devices=["b", "a"])
+
+        assert list(frame.columns) == ["temperature", "device", "time"]
+        assert frame["device"].tolist() == ["a", "b"]
+        assert "device" not in cache.frame(now, devices=["a"]).columns
+
+    def test_selection(self):
+        cache = LatestCache()
+        now = time.time_ns()
+        fields = ("temperature", "pressure")
+        cache.update(Reading("a", now, array("d", [1.0, 1000.0])), fields)
+        cache.update(Reading("b", now, array("d", [2.0, 1001.0])), fields)
+
+        frame = cache.frame(now, fields=["pressure"], devices=["b"])
+
+        assert list(frame.columns) == ["pressure", "time"]
+        assert frame["pressure"].tolist() == [1001.0]
+
+    def test_update_from_another_thread(self):
+        cache = LatestCache()
+        now = time.time_ns()
+        done = threading.Event()
+
+        def publish():
+            for i in range(50000):
+                reading = Reading(f"d{i}", now + i, array("d", [float(i)]))
+                cache.update(reading, ("temperature",))
+            done.set()
+
+        publisher = threading.Thread(target=publish)
+        publisher.start()
+        # every query iterates the readings while new devices are published
+        while not done.is_set():
+            cache.frame(now, devices=["d0"])
+        publisher.join()
+
+        assert len(cache.frame(now)) == 50000
@@ -0,0 +1,48 @@
+"""
+Test class for the pooled InfluxDB client of AsyncQuery.
+
+Author: Piotr Krzysztof Lis - github.com/straightchlorine
+"""
+
+import asyncio
+
+import pytest
+
+from reads.query.async_query import AsyncQuery
+
+
+class TestQueryClient:
+    """
+    Test class for the lifecycle of the client of the AsyncQuery class.
+
+    Attributes:
+        query (AsyncQuery): The query object.
+    """
+
+    query: AsyncQuery
+
+    def set_up(self):
+        self.query = AsyncQuery(
+            "localhost", 8086, "token", "org", "bucket", {"bmp180": ["temperature"]}
+        )
+
+    @pytest.mark.asyncio
+    async def test_client_is_reused(self):
+        self.set_up()
+
+        async with self.query:
+            client = await self.query._get_InfluxDB_client()
+            assert await self.query._get_InfluxDB_client() is client
+
+        assert not self.query.started
+
+    def test_client_is_replaced_in_another_loop(self):
+        self.set_up()
+
+        first = asyncio.run(self.query._get_InfluxDB_client())
+        second = asyncio.run(self.query._get_InfluxDB_client())
+
+        assert first is not second
+        assert first.api_client.rest_client.pool_manager.closed
+        asyncio.run(self.query.stop())
+        assert not self.query.started
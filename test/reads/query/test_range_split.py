@@ -0,0 +1,157 @@
+"""
+Test class for the splitting of historical queries into concurrent sub-ranges.
+
+Author: Piotr Krzysztof Lis - github.com/straightchlorine
+"""
+
+import asyncio
+import re
+
+import pandas as pd
+import pytest
+from influxdb_client.client.flux_table import FluxRecord, FluxTable
+
+from reads.query.async_query import AsyncQuery
+
+
+class TestRangeSplit:
+    """
+    Test class for the _split_range() method of the AsyncQuery class and the
+    concurrent queries of historical data.
+
+    Attributes:
+        query (AsyncQuery): The query object.
+        ranges (list[tuple[str, str]]): Ranges queried from the database.
+        running (int): Number of queries currently running.
+        peak (int): Maximum number of queries running at once.
+        joined (pd.Timestamp): Time the second device starts reporting at
+            (None - a single device).
+    """
+
+    query: AsyncQuery
+    ranges: list[tuple[str, str]]
+    running: int
+    peak: int
+    joined: pd.Timestamp | None
+
+    def set_up(self, **kwargs):
+        self.query = AsyncQuery(
+            "localhost",
+            8086,
+            "token",
+            "org",
+            "bucket",
+            {"bmp180": ["temperature"]},
+            **kwargs,
+        )
+        self.ranges = []
+        self.running = 0
+        self.peak = 0
+        self.joined = None
+
+    async def fake_query(self, query):
+        """Return a reading every minute within the range of the query."""
+        start, stop = re.search(r"start: (\S+), stop: (\S+)\)", query).groups()
+        self.ranges.append((start, stop))
+
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        await asyncio.sleep(0.01)
+        self.running -= 1
+
+        times = pd.date_range(
+            pd.Timestamp(start).ceil("1min"), stop, freq="1min", inclusive="left"
+        )
+        devices = ["nodemcu"]
+        if self.joined is not None and pd.Timestamp(start) >= self.joined:
+            devices.append("esp32")
+
+        tables = []
+        for device in devices:
+            table = FluxTable()
+            table.records = [
+                FluxRecord(
+                    0,
+                    {
+                        "_time": time.to_pydatetime(),
+                        "_field": "temperature",
+                        "_value": float(i),
+                        "device": device,
+                    },
+                )
+                for i, time in enumerate(times)
+            ]
+            tables.append(table)
+        return tables
+
+    async def start(self):
+        await self.query.start()
+        query_api = self.query._client.query_api()
+        query_api.query = self.fake_query
+        self.query._client.query_api = lambda: query_api
+
+    def test_small_range_is_not_split(self):
+        self.set_up(split_rows=100000)
+
+        assert self.query._split_range("-1h", "now()") is None
+
+    def test_bounds_aligned_to_window(self):
+        self.set_up(split_rows=10, max_parallel=4)
+
+        bounds = self.query._split_range(
+            "2024-01-01T00:02:00Z", "2024-01-01T10:00:00Z", window="5m"
+        )
+
+        assert len(bounds) == 5
+        assert bounds[0] == pd.Timestamp("2024-01-01T00:02:00Z")
+        assert bounds[-1] == pd.Timestamp("2024-01-01T10:00:00Z")
+        assert all(bound.timestamp() % 300 == 0 for bound in bounds[1:-1])
+
+    @pytest.mark.asyncio
+    async def test_split_results_are_merged(self):
+        self.set_up(split_rows=1000, max_parallel=4)
+        await self.start()
+
+        frame = await self.query.historical_data(
+            "2024-01-01T00:00:00Z", "2024-01-01T01:00:00Z"
+        )
+        await self.query.stop()
+
+        assert len(self.ranges) == 4
+        assert len(frame) == 60
+        assert frame["time"].is_monotonic_increasing
+        assert frame["time"].is_unique
+        assert frame["temperature"].tolist()[15] == 0.0
+
+    @pytest.mark.asyncio
+    async def test_device_column_of_merged_results(self):
+        self.set_up(split_rows=1000, max_parallel=4)
+        self.joined = pd.Timestamp("2024-01-01T00:30:00Z")
+        await self.start()
+
+        # the first sub-ranges hold a single device, the last ones two
+        frame = await self.query.historical_data(
+            "2024-01-01T00:00:00Z", "2024-01-01T01:00:00Z"
+        )
+        await self.query.stop()
+
+        assert len(frame) == 90
+        assert frame["device"].notna().all()
+        assert frame["device"].value_counts().to_dict() == {
+            "nodemcu": 60,
+            "esp32": 30,
+        }
+
+    @pytest.mark.asyncio
+    async def test_concurrency_cap(self):
+        self.set_up(split_rows=1000, max_parallel=2)
+        await self.start()
+
+        await asyncio.gather(
+            self.query.historical_data("2024-01-01T00:00:00Z", "2024-01-01T01:00:00Z"),
+            self.query.historical_data("2024-01-02T00:00:00Z", "2024-01-02T01:00:00Z"),
+        )
+        await self.query.stop()
+
+        assert len(self.ranges) == 4
+        assert self.peak == 2
@@ -0,0 +1,211 @@
+"""
+Test class for the ring buffers of recent readings published by the fetcher.
+
+Author: Piotr Krzysztof Lis - github.com/straightchlorine
+"""
+
+import time
+from array import array
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from reads.fetch.schema import Reading
+from reads.interface import DatabaseInterface
+from reads.query.recent import RecentReadings, RingBuffer
+
+
+class TestRecentReadings:
+    """
+    Test class for the RingBuffer and RecentReadings classes and historical
+    queries of the interface answered by them.
+
+    Attributes:
+        sensors (dict): Sensors of the tested device.
+        interface (DatabaseInterface): The tested interface.
+        queried (int): Number of queries passed to the database.
+    """
+
+    sensors: dict = {"bmp180": ["temperature", "pressure"]}
+    interface: DatabaseInterface
+    queried: int
+
+    def set_up(self, **kwargs):
+        kwargs.setdefault("recent_capacity", 3600)
+        self.interface = DatabaseInterface(
+            "localhost", 8086, "token", "org", "bucket", self.sensors,
+            "localhost", 5000, **kwargs
+        )  # fmt: skip
+        self.queried = 0
+
+        async def queried_historical_data(*args):
+            self.queried += 1
+            return pd.DataFrame(columns=["time"])
+
+        async def store(reading, device):
+            pass
+
+        self.interface.query_interface._queried_historical_data = (
+            queried_historical_data
+        )
+        self.interface._fetcher._store_sensor_readings = store
+
+    def test_ring_buffer_wraps(self):
+        buffer = RingBuffer(("temperature",), 3)
+        for i in range(5):
+            buffer.append(i, [float(i)])
+
+        times, values = buffer.view()
+
+        assert len(buffer) == 3
+        assert times.tolist() == [2, 3, 4]
+        assert values[:, 0].tolist() == [2.0, 3.0, 4.0]
+        assert np.shares_memory(values, buffer._values)
+        assert not values.flags.writeable
+
+    def test_ring_buffer_slice(self):
+        buffer = RingBuffer(("temperature", "pressure"), 4)
+        for i in range(6):
+            buffer.append(10 * i, [float(i), 1000.0 + i])
+        buffer.append(0, [0.0, 0.0])
+
+        times, values = buffer.slice(25, 50)
+
+        assert times.tolist() == [30, 40]
+        assert values[:, 1].tolist() == [1003.0, 1004.0]
+        assert buffer.column("pressure").tolist() == [1002.0, 1003.0, 1004.0, 1005.0]
+        assert buffer.dropped == 1
+
+    def test_coverage(self):
+        recent = RecentReadings(capacity=2)
+        now = time.time_ns()
+        recent.update(Reading("a", now, array("d", [1.0])), ("temperature",))
+
+        assert recent.covers(now, now + 1, now)
+        assert not recent.covers(now - 10**9, now + 1, now)
+
+        recent.update(Reading("a", now + 1, array("d", [2.0])), ("temperature",))
+        recent.update(Reading("a", now + 2, array("d", [3.0])), ("temperature",))
+
+        assert not recent.covers(now, now + 3, now)
+        frame = recent.frame(now + 1, now + 3, now=now)
+        assert frame["temperature"].tolist() == [2.0, 3.0]
+
+        # the fetcher overwrites the buffer once the readings are returned
+        buffer = recent.buffer("a")
+        assert not np.shares_memory(frame["temperature"].to_numpy(), buffer._values)
+
+    def test_stale_readings_are_not_covered(self):
+        recent = RecentReadings(capacity=10, interval=1.0)
+        now = time.time_ns()
+        recent.update(Reading("a", now, array("d", [1.0])), ("temperature",))
+        recent.update(Reading("b", now - 5 * 10**9, array("d", [2.0])), ("pressure",))
+        later = now + 3 * 10**9
+
+        # readings of b stopped arriving
+        assert recent.covers(now, now + 1, now, devices=["a"])
+        assert not recent.covers(now, now + 1, now)
+        # the range ends before readings stopped arriving
+        assert recent.covers(now, now + 1, later, devices=["a"])
+        assert not recent.covers(now, later, later, devices=["a"])
+        # the device is not polled by the fetcher, it is left to the database
+        assert not recent.covers(now, now + 1, now, devices=["c"])
+        assert recent.frame(now, later, now=later) is None
+
+    def payload(self, temperature):
+        return (
+            b'{"nodemcu": {"bmp180": {"temperature": "%d", "pressure": "1000"}}}'
+            % temperature
+        )
+
+    @pytest.mark.asyncio
+    async def test_recent_range_from_memory(self):
+        self.set_up()
+        fetcher = self.interface._fetcher
+        start = pd.Timestamp.now(tz="UTC")
+
+        for i in range(3):
+            timestamp = start.value + i * 1_000_000_000
+            await fetcher.ingest(self.payload(20 + i), fetcher.devices[0], timestamp)
+
+        end = start + pd.Timedelta(seconds=10)
+        frame = await self.interface.query_historical(
+            start.isoformat(), end.isoformat()
+        )
+        windowed = await self.interface.query_historical(
+            start.isoformat(), end.isoformat(), window="10s", fn="max"
+        )
+        projected = await self.interface.query_historical(
+            start.isoformat(), end.isoformat(), params="pressure"
+        )
+
+        assert self.queried == 0
+        assert list(frame.columns) == ["temperature", "pressure", "time"]
+        assert frame["temperature"].tolist() == [20.0, 21.0, 22.0]
+        assert windowed["temperature"].max() == 22.0
+        assert list(projected.columns) == ["pressure", "time"]
+
+    @pytest.mark.asyncio
+    async def test_rollup_windows_stamped_by_start(self):
+        self.set_up(rollup_buckets={60: "rollup_1m"})
+        fetcher = self.interface._fetcher
+
+        async def roll_up(reading, device):
+            pass
+
+        fetcher._roll_up = roll_up
+        end = pd.Timestamp.now(tz="UTC")
+        first = end - pd.Timedelta(seconds=180)
+        for i in range(181):
+            timestamp = first.value + i * 1_000_000_000
+            await fetcher.ingest(self.payload(i), fetcher.devices[0], timestamp)
+
+        # the resolution routes the range to the rollup bucket
+        start = first + pd.Timedelta(seconds=30)
+        frame = await self.interface.query_historical(
+            start.isoformat(), end.isoformat(), resolution=60
+        )
+
+        assert self.queried == 0
+        windows = pd.date_range(
+            start.ceil("1min"), end - pd.Timedelta(seconds=60), freq="1min"
+        )
+        assert frame["time"].dt.tz_convert("UTC").tolist() == list(windows)
+
+        # the mean of the readings of every window, as the fetcher rolls up
+        seconds = (windows - first).total_seconds()
+        assert frame["temperature"].tolist() == (np.ceil(seconds) + 29.5).tolist()
+
+    @pytest.mark.asyncio
+    async def test_stopped_fetcher_from_database(self):
+        self.set_up()
+        fetcher = self.interface._fetcher
+        start = pd.Timestamp.now(tz="UTC") - pd.Timedelta(seconds=30)
+
+        for i in range(3):
+            timestamp = start.value + i * 1_000_000_000
+            await fetcher.ingest(self.payload(20 + i), fetcher.devices[0], timestamp)
+
+        await self.interface.query_historical(start.isoformat(), "now()")
+
+        assert self.queried == 1
+
+    def test_disabled_by_default(self):
+        interface = DatabaseInterface(
+            "localhost", 8086, "token", "org", "bucket", self.sensors,
+            "localhost", 5000
+        )  # fmt: skip
+
+        assert interface.query_interface.recent_stats() == {}
+
+    @pytest.mark.asyncio
+    async def test_older_range_from_database(self):
+        self.set_up()
+        fetcher = self.interface._fetcher
+        await fetcher.ingest(self.payload(20), fetcher.devices[0])
+
+        await self.interface.query_historical("-1h", "now()")
+
+        assert self.queried == 1
+        assert self.interface.query_interface.recent_stats()["misses"] == 1
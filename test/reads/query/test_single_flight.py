@@ -0,0 +1,115 @@
+"""
+Test class for the coalescing of identical concurrent queries.
+
+Author: Piotr Krzysztof Lis - github.com/straightchlorine
+"""
+
+import asyncio
+import datetime
+
+import pytest
+from influxdb_client.client.flux_table import FluxRecord, FluxTable
+
+from reads.query.async_query import AsyncQuery
+
+
+class TestSingleFlight:
+    """
+    Test class for the _shared_query() method of the AsyncQuery class.
+
+    Attributes:
+        query (AsyncQuery): The query object.
+        queries (list[str]): Queries passed to the database.
+    """
+
+    query: AsyncQuery
+    queries: list[str]
+
+    async def set_up(self):
+        self.query = AsyncQuery(
+            "localhost",
+            8086,
+            "token",
+            "org",
+            "bucket",
+            {"bmp180": ["temperature"]},
+        )
+        self.queries = []
+
+        async def fake_query(query):
+            self.queries.append(query)
+            await asyncio.sleep(0.05)
+
+            table = FluxTable()
+            table.records = [
+                FluxRecord(
+                    0,
+                    {
+                        "_time": datetime.datetime.now(datetime.timezone.utc),
+                        "_field": "temperature",
+                        "_value": 21.0,
+                    },
+                )
+            ]
+            return [table]
+
+        await self.query.start()
+        query_api = self.query._client.query_api()
+        query_api.query = fake_query
+        self.query._client.query_api = lambda: query_api
+
+    @pytest.mark.asyncio
+    async def test_identical_queries_are_coalesced(self):
+        await self.set_up()
+
+        frames = await asyncio.gather(*(self.query.latest() for _ in range(5)))
+        await self.query.stop()
+
+        assert len(self.queries) == 1
+        assert all(frame["temperature"].tolist() == [21.0] for frame in frames)
+        assert len({id(frame) for frame in frames}) == 5
+        assert self.query.single_flight_stats() == {
+            "executed": 1,
+            "coalesced": 4,
+            "in_flight": 0,
+        }
+
+    @pytest.mark.asyncio
+    async def test_string_literals_are_compared_exactly(self):
+        await self.set_up()
+
+        query = 'from(bucket:"bucket") |> filter(fn: (r) => r.device == "%s")'
+        await asyncio.gather(
+            self.query.query(query % "node  1"),
+            self.query.query(query % "node 1"),
+            self.query.query(query % "node 1"),
+        )
+        await self.query.stop()
+
+        assert len(self.queries) == 2
+
+    @pytest.mark.asyncio
+    async def test_cancelled_caller_does_not_cancel_others(self):
+        await self.set_up()
+
+        first = asyncio.create_task(self.query.latest())
+        second = asyncio.create_task(self.query.latest())
+        await asyncio.sleep(0.01)
+        first.cancel()
+
+        frame = await second
+        await self.query.stop()
+
+        assert first.cancelled()
+        assert frame["temperature"].tolist() == [21.0]
+        assert len(self.queries) == 1
+
+    @pytest.mark.asyncio
+    async def test_sequential_queries_are_not_coalesced(self):
+        await self.set_up()
+
+        await self.query.latest()
+        await self.query.latest()
+        await self.query.stop()
+
+        assert len(self.queries) == 2
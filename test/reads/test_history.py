@@ -0,0 +1,276 @@
+"""
+Test class for the local tier of historical readings.
+
+Author: Piotr Krzysztof Lis - github.com/straightchlorine
+"""
+
+import datetime
+import re
+
+import pandas as pd
+import pytest
+from influxdb_client.client.flux_table import FluxRecord, FluxTable
+
+from reads.interface import DatabaseInterface
+from reads.query.async_query import AsyncQuery
+
+pytest.importorskip("pyarrow")
+
+from reads.history import HistoryStore  # noqa: E402
+
+
+class TestHistoryStore:
+    """
+    Test class for the HistoryStore class and its use within AsyncQuery.
+
+    Attributes:
+        query (AsyncQuery): The query object.
+        queries (list[str]): Queries passed to the database.
+    """
+
+    query: AsyncQuery
+    queries: list[str]
+
+    async def set_up(self, directory, **kwargs):
+        self.query = AsyncQuery(
+            "localhost",
+            8086,
+            "token",
+            "org",
+            "bucket",
+            {"bmp180": ["temperature", "pressure"]},
+            history=HistoryStore(directory),
+            **kwargs,
+        )
+        self.queries = []
+        await self.fake_client(self.query)
+
+    async def fake_client(self, query):
+        """Start the query object, its queries are answered by fake_query."""
+        await query.start()
+        query_api = query._client.query_api()
+        query_api.query = self.fake_query
+        query._client.query_api = lambda: query_api
+
+    async def fake_query(self, query):
+        """
+        Return a reading every ten minutes within the range of the query, or
+        the means of the closed hours, stamped by their start, as the rollup
+        bucket holds them.
+        """
+        self.queries.append(query)
+        start, stop = re.search(r"start: (\S+), stop: (\S+)\)", query).groups()
+        times = pd.date_range(
+            pd.Timestamp(start).ceil("10min"), stop, freq="10min", inclusive="left"
+        )
+        if 'r.stat == "mean"' in query:
+            closed = pd.Timestamp.now(tz="UTC").floor("1h")
+            times = pd.date_range(
+                pd.Timestamp(start).ceil("1h"),
+                min(pd.Timestamp(stop), closed),
+                freq="1h",
+                inclusive="left",
+            )
+
+        values = [
+            {
+                "_time": time.to_pydatetime(),
+                "device": "nodemcu",
+                "temperature": float(time.hour),
+                "pressure": 1000.0,
+            }
+            for time in times
+        ]
+        if "pivot(" in query:
+            table = FluxTable()
+            table.records = [FluxRecord(0, value) for value in values]
+            return [table]
+
+        tables = []
+        for field in ("temperature", "pressure"):
+            table = FluxTable()
+            table.records = [
+                FluxRecord(
+                    0,
+                    {
+                        "_time": value["_time"],
+                        "_field": field,
+                        "_value": value[field],
+                        "device": "nodemcu",
+                    },
+                )
+                for value in values
+            ]
+            tables.append(table)
+        return tables
+
+    def test_partitions(self, tmp_path):
+        store = HistoryStore(tmp_path)
+        day = datetime.date(2024, 1, 1)
+        frame = pd.DataFrame(
+            {
+                "temperature": [1.0, 2.0, 3.0],
+                "pressure": [1000.0, 1001.0, 1002.0],
+                "device": ["a", "b", "a"],
+                "time": pd.date_range("2024-01-01", periods=3, freq="1h", tz="UTC"),
+            }
+        )
+
+        store.write(day, frame)
+        read = store.read(day, columns=["pressure"], devices=["a"])
+
+        assert store.complete(day)
+        assert sorted(p.name for p in (tmp_path / "2024-01-01").iterdir()) == [
+            "_COMPLETE",
+            "a.parquet",
+            "b.parquet",
+        ]
+        assert list(read.columns) == ["pressure", "time", "device"]
+        assert read["pressure"].tolist() == [1000.0, 1002.0]
+
+    def test_days_written_late_are_not_complete(self, tmp_path):
+        store = HistoryStore(tmp_path)
+        day = datetime.date(2024, 1, 1)
+        frame = pd.DataFrame(
+            {
+                "temperature": [1.0],
+                "device": ["a"],
+                "time": [pd.Timestamp("2024-01-01T12:00:00Z")],
+            }
+        )
+
+        # the readings of the day might not be written yet
+        assert not store.write(day, frame.iloc[:0])
+        assert not store.complete(day)
+        assert store.read(day).empty
+
+        # invalidated after the readings were queried
+        version = store.version(day)
+        store.invalidate(frame["time"].iloc[0], frame["time"].iloc[0] + pd.Timedelta(1))
+        assert not store.write(day, frame, version)
+        assert not store.complete(day)
+
+        assert store.write(day, frame, store.version(day))
+        store.invalidate(
+            pd.Timestamp("2024-01-02T00:00:00Z"), pd.Timestamp.now(tz="UTC")
+        )
+        assert store.complete(day)
+        assert store.stats()["writes"] == 1
+
+    def test_device_names_stay_within_the_day(self, tmp_path):
+        store = HistoryStore(tmp_path / "history")
+        day = datetime.date(2024, 1, 1)
+        frame = pd.DataFrame(
+            {
+                "temperature": [1.0, 2.0, 3.0],
+                "device": ["../../escaped", "floor/1", None],
+                "time": pd.date_range("2024-01-01", periods=3, freq="1h", tz="UTC"),
+            }
+        )
+
+        store.write(day, frame)
+        read = store.read(day)
+
+        assert sorted(p.name for p in tmp_path.iterdir()) == ["history"]
+        assert len(list((tmp_path / "history" / "2024-01-01").iterdir())) == 4
+        assert read.sort_values("time")["device"].tolist() == [
+            "../../escaped",
+            "floor/1",
+            None,
+        ]
+        assert store.read(day, devices=["floor/1"])["temperature"].tolist() == [2.0]
+
+    @pytest.mark.asyncio
+    async def test_closed_days_are_read_from_disk(self, tmp_path):
+        await self.set_up(tmp_path)
+        start = (pd.Timestamp.now(tz="UTC") - pd.Timedelta(days=3)).floor("1D")
+        end = pd.Timestamp.now(tz="UTC").floor("10min")
+
+        first = await self.query.historical_data(start.isoformat(), end.isoformat())
+        second = await self.query.historical_data(start.isoformat(), end.isoformat())
+        await self.query.stop()
+
+        # days are stored once, the open day is queried every time
+        stored = [query for query in self.queries if "pivot(" in query]
+        assert len(stored) >= 2
+        assert len(self.queries) == len(stored) + 2
+        assert self.query.history_stats()["writes"] == len(stored)
+
+        assert len(first) == len(second) == (end - start) // pd.Timedelta("10min")
+        assert first["time"].is_monotonic_increasing
+        assert first["time"].is_unique
+        assert list(first.columns) == ["temperature", "pressure", "time"]
+
+    @pytest.mark.asyncio
+    async def test_replayed_days_are_stored_again(self, tmp_path):
+        store = HistoryStore(tmp_path)
+        interface = DatabaseInterface(
+            "localhost", 8086, "token", "org", "bucket",
+            {"bmp180": ["temperature", "pressure"]}, "localhost", 5000,
+            history=store,
+        )  # fmt: skip
+        self.query = interface.query_interface
+        self.queries = []
+        await self.fake_client(self.query)
+
+        async def write_batch(batch, bucket=None):
+            pass
+
+        interface._fetcher._write_batch = write_batch
+
+        day = datetime.date(2024, 1, 1)
+        args = ("2024-01-01T00:00:00Z", "2024-01-02T00:00:00Z")
+        await self.query.historical_data(*args)
+        assert store.complete(day)
+
+        # the spool held a reading of the stored day
+        time = pd.Timestamp("2024-01-01T12:00:00Z").value
+        record = f"bmp180,device=nodemcu temperature=21.0 {time}"
+        await interface._fetcher._replay_batch([record], "rollup_1h")
+        assert store.complete(day)
+        await interface._fetcher._replay_batch([record], "bucket")
+        assert not store.complete(day)
+
+        await self.query.historical_data(*args)
+        await self.query.stop()
+
+        assert store.complete(day)
+        assert len([query for query in self.queries if "pivot(" in query]) == 2
+
+    @pytest.mark.asyncio
+    async def test_rollup_windows_match_the_bucket(self, tmp_path):
+        await self.set_up(tmp_path, rollup_buckets={3600: "rollup_1h"}, max_points=50)
+        bucket = AsyncQuery(
+            "localhost", 8086, "token", "org", "bucket",
+            {"bmp180": ["temperature", "pressure"]},
+            rollup_buckets={3600: "rollup_1h"}, max_points=50,
+        )  # fmt: skip
+        await self.fake_client(bucket)
+
+        # neither end is aligned to the windows of the rollup bucket
+        start = pd.Timestamp.now(tz="UTC").floor("1D") - pd.Timedelta("70h50min")
+        args = (start.isoformat(), pd.Timestamp.now(tz="UTC").isoformat())
+        expected = await bucket.historical_data(*args)
+        self.queries = []
+        frame = await self.query.historical_data(*args)
+        await bucket.stop()
+        await self.query.stop()
+
+        assert any("pivot(" in query for query in self.queries)
+        pd.testing.assert_frame_equal(frame, expected)
+        assert frame["time"].iloc[0] == start.ceil("1h")
+        assert frame["time"].is_unique
+
+    @pytest.mark.asyncio
+    async def test_windows_computed_locally(self, tmp_path):
+        await self.set_up(tmp_path)
+
+        frame = await self.query.historical_data(
+            "2024-01-01T00:30:00Z", "2024-01-02T00:00:00Z", window="1h", fn="max"
+        )
+        await self.query.stop()
+
+        assert len(frame) == 24
+        assert frame["time"].iloc[0] == pd.Timestamp("2024-01-01T01:00:00Z")
+        assert frame["temperature"].tolist()[:3] == [0.0, 1.0, 2.0]
+        assert all("aggregateWindow" not in query for query in self.queries)
@@ -0,0 +1,67 @@
+"""
+Test class for the metrics and their Prometheus text rendering.
+
+Author: Piotr Krzysztof Lis - github.com/straightchlorine
+"""
+
+import pytest
+
+from reads.metrics import MetricsRegistry
+
+
+class TestMetrics:
+    """
+    Test class for the MetricsRegistry class.
+
+    Attributes:
+        registry (MetricsRegistry): Registry of the tested metrics.
+    """
+
+    registry: MetricsRegistry
+
+    def set_up(self):
+        self.registry = MetricsRegistry()
+
+    def test_counter(self):
+        self.set_up()
+        errors = self.registry.counter("errors_total", "Errors.", ("stage",))
+
+        errors.inc("write")
+        errors.inc("write", amount=2)
+        errors.inc("request")
+
+        text = self.registry.render()
+        assert "# TYPE errors_total counter" in text
+        assert 'errors_total{stage="write"} 3' in text
+        assert 'errors_total{stage="request"} 1' in text
+
+    def test_histogram(self):
+        self.set_up()
+        latency = self.registry.histogram("latency_seconds", "Latency.", buckets=(1, 2))
+
+        for value in (0.5, 1.5, 3):
+            latency.observe(value)
+
+        lines = self.registry.render().splitlines()
+        assert 'latency_seconds_bucket{le="1"} 1' in lines
+        assert 'latency_seconds_bucket{le="2"} 2' in lines
+        assert 'latency_seconds_bucket{le="+Inf"} 3' in lines
+        assert "latency_seconds_sum 5" in lines
+        assert "latency_seconds_count 3" in lines
+
+    def test_gauge_callbacks(self):
+        self.set_up()
+        depth = self.registry.gauge("queue_depth", "Depth.")
+
+        depth.add_callback(lambda: 2)
+        depth.add_callback(lambda: 3)
+
+        assert "queue_depth 5" in self.registry.render()
+
+    def test_same_name_is_shared(self):
+        self.set_up()
+        first = self.registry.counter("errors_total", "Errors.", ("stage",))
+
+        assert self.registry.counter("errors_total", "Errors.", ("stage",)) is first
+        with pytest.raises(ValueError):
+            self.registry.gauge("errors_total", "Errors.")
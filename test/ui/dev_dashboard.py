@@ -6,7 +6,7 @@ Author: Piotr Krzysztof Lis - github.com/straightchlorine
 
 import asyncio
 import json
-import multiprocessing
+import threading
 
 from dash import Dash, Input, Output, callback, dcc, html
 import pandas as pd
@@ -50,6 +50,11 @@ interface = DatabaseInterface(
 )
 
 
+# event loop shared by the fetcher and the queries, so that the latest
+# readings published by the fetcher answer them
+loop = asyncio.new_event_loop()
+
+
 # data update task
 async def update_data():
     # get the data
@@ -75,7 +80,9 @@ dashboard_server.layout = html.Div(
     Output("live-update-text", "children"), Input("interval-component", "n_intervals")
 )
 def update_metrics(n):
-    measurement_dataframe: pd.DataFrame = asyncio.run(update_data())
+    measurement_dataframe: pd.DataFrame = asyncio.run_coroutine_threadsafe(
+        update_data(), loop
+    ).result()
 
     if not measurement_dataframe.empty:
         time = measurement_dataframe["time"].iloc[-1]
@@ -111,10 +118,10 @@ def update_metrics(n):
 
 def run():
     dashboard_server.scripts.config.serve_locally = True
-    dashboard_server.run_server(port=8050, debug=False, processes=4, threaded=False)
+    dashboard_server.run_server(port=8050, debug=False, threaded=True)
 
 
 if __name__ == "__main__":
-    server_process = multiprocessing.Process(target=run, name="dash")
-    server_process.start()
-    interface.enable_fetching()
+    threading.Thread(target=loop.run_forever, name="fetcher", daemon=True).start()
+    asyncio.run_coroutine_threadsafe(interface.start_fetching(), loop).result()
+    run()